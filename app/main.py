@@ -12,6 +12,8 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 import streamlit as st
+import pandas as pd
+import plotly.graph_objects as go
 import json
 import uuid
 from datetime import datetime, timedelta
@@ -20,7 +22,14 @@ from app.auth import login, SEED_USERS
 from app.services.forms import FormsService, QuestionsService
 from app.services.submissions import SubmissionsService
 from app.services.analytics import AnalyticsService
-from app.db import get_db_session
+from app.services.filters import ANSWER_OPERATORS, OPERATOR_LABELS, SUBMITTER_LABELS, AnswerPredicate, FilterSpec
+from app.services.jobs import cancel_jobs, poll_job
+from app.services.numeric_analytics import BIN_STRATEGY_LABELS
+from app.services.submission_queue import (
+    SUBMISSION_WRITE_BEHIND, enqueue_submission, resume_submission_writer
+)
+from app.services.aggregates import start_aggregate_folder
+from app.db import get_db_session, warm_up_pool, test_connection
 from app.models import Form, FormVersion, Question, QuestionOption
 
 st.set_page_config(
@@ -69,6 +78,13 @@ def init_session_state():
         st.session_state.current_form_id = None
     if 'form_builder_questions' not in st.session_state:
         st.session_state.form_builder_questions = []
+    if 'job_owner' not in st.session_state:
+        # Background analytics jobs of this browser session (see services/jobs.py)
+        st.session_state.job_owner = uuid.uuid4().hex
+    if 'insight_jobs' not in st.session_state:
+        st.session_state.insight_jobs = {}
+    if 'export_jobs' not in st.session_state:
+        st.session_state.export_jobs = {}
 
 # ============================================================================
 # AUTHENTICATION
@@ -256,9 +272,9 @@ def show_dashboard(user: Dict[str, Any]):
 def show_fill_form(token: str):
     """Display a public form for filling out"""
     try:
-        # Get form by token
+        # Get form, active version and questions by token (cached across reruns)
         forms_service = FormsService()
-        form = forms_service.get_form_by_token(token)
+        form = forms_service.get_public_form_schema(token)
         
         if not form:
             st.error("❌ Form not found. Please check your link.")
@@ -271,8 +287,7 @@ def show_fill_form(token: str):
         
         st.divider()
         
-        # Get questions for the form
-        questions = QuestionsService.get_questions_for_form(form['id'])
+        questions = form['questions']
         
         if not questions:
             st.warning("This form has no questions yet.")
@@ -304,7 +319,7 @@ def show_fill_form(token: str):
                         placeholder=question.get('placeholder')
                     )
                 elif field_type == 'multiple_choice':
-                    options = question.get('options', [])
+                    options = [option['label'] for option in question.get('options', [])]
                     if options:
                         answers[question['id']] = st.radio(
                             display_label,
@@ -312,7 +327,7 @@ def show_fill_form(token: str):
                             help=question.get('help_text')
                         )
                 elif field_type == 'checkboxes':
-                    options = question.get('options', [])
+                    options = [option['label'] for option in question.get('options', [])]
                     if options:
                         answers[question['id']] = st.multiselect(
                             display_label,
@@ -320,13 +335,14 @@ def show_fill_form(token: str):
                             help=question.get('help_text')
                         )
                 elif field_type == 'dropdown':
-                    options = question.get('options', [])
+                    options = {option['label']: option['value'] for option in question.get('options', [])}
                     if options:
-                        answers[question['id']] = st.selectbox(
+                        # The placeholder leaves the question unanswered
+                        answers[question['id']] = options.get(st.selectbox(
                             display_label,
-                            ["Select an option"] + options,
+                            ["Select an option"] + list(options),
                             help=question.get('help_text')
-                        )
+                        ))
                 elif field_type == 'number':
                     answers[question['id']] = st.number_input(
                         display_label,
@@ -371,14 +387,26 @@ def show_fill_form(token: str):
                     st.error(f"Please fill in the required fields: {', '.join(missing_required)}")
                 else:
                     # Save submission
-                    submissions_service = SubmissionsService()
-                    submission_id = submissions_service.create_submission(
-                        form_id=form['id'],
-                        answers=answers
-                    )
+                    errors = []
+                    if SUBMISSION_WRITE_BEHIND:
+                        # Check, journal locally and acknowledge; the background writer stores it
+                        entry_id, errors = enqueue_submission(form, answers)
+                        saved = entry_id is not None
+                    else:
+                        submissions_service = SubmissionsService()
+                        saved = submissions_service.create_submission(
+                            form_id=form['id'],
+                            answers=answers
+                        ) is not None
+                        if not saved and not test_connection():
+                            # Database briefly unavailable: keep the response instead of dropping it
+                            entry_id, errors = enqueue_submission(form, answers)
+                            saved = entry_id is not None
                     
-                    if submission_id:
+                    if saved:
                         st.success("✅ Thank you! Your response has been submitted.")
+                    elif errors:
+                        st.error(f"❌ {'; '.join(errors)}")
                     else:
                         st.error("❌ Failed to submit response. Please try again.")
         
@@ -398,6 +426,9 @@ def show_fill_form(token: str):
 def main():
     """Main application router"""
     init_session_state()
+    warm_up_pool()  # No-op after the first run in this process
+    resume_submission_writer()
+    start_aggregate_folder()
     
     # Check for public form access via URL parameters
     query_params = st.query_params
@@ -462,6 +493,12 @@ def main():
     # Route to appropriate page
     page = st.session_state.current_page
     
+    # Background insights and exports are only wanted while their analytics page is open
+    if page != 'form_analytics' and (st.session_state.insight_jobs or st.session_state.export_jobs):
+        cancel_jobs(st.session_state.job_owner)
+        st.session_state.insight_jobs = {}
+        st.session_state.export_jobs = {}
+    
     if page == 'dashboard':
         show_dashboard(user)
     elif page == 'create_form':
@@ -1129,6 +1166,135 @@ def show_form_filler(user: Optional[Dict[str, Any]]):
         if st.button("🔄 Clear Form"):
             st.rerun()
 
+@st.fragment(run_every=1.0)
+def show_text_insights(analytics_service: AnalyticsService, form_id: int, question_id: int, user: Dict[str, Any]):
+    """Keywords and sentiment of a text question, computed in the background and polled every second"""
+    job_id = st.session_state.insight_jobs.get(question_id)
+    job = poll_job(job_id)
+    if job is None:
+        job_id = analytics_service.start_text_insights(
+            form_id, question_id, user['id'], user['role'], owner=st.session_state.job_owner
+        )
+        if job_id is None:
+            st.caption("Insights are busy right now; they will load shortly.")
+            return
+        st.session_state.insight_jobs[question_id] = job_id
+        job = poll_job(job_id)
+    
+    if job['state'] in ('queued', 'running'):
+        st.progress(job['progress'], text="Analyzing responses...")
+        return
+    insights = job['result']
+    if job['state'] != 'done' or not insights:
+        if job['state'] == 'failed':
+            st.caption("Insights could not be computed.")
+        return
+    if not insights['response_count']:
+        return
+    
+    sentiment = insights['sentiment']
+    st.write(f"**Overall Sentiment:** {sentiment['overall'].title()} ({sentiment['average_score']:+.2f})")
+    st.write(" · ".join(f"{label.title()}: {pct:.0f}%" for label, pct in sentiment['percentages'].items()))
+    if insights['keywords']:
+        st.write("**Keywords:** " + ", ".join(
+            f"{keyword['word']} ({keyword['count']})" for keyword in insights['keywords']
+        ))
+
+def read_spool(path: str):
+    """Deferred download data: the spool file is only read when its button is clicked"""
+    def read() -> bytes:
+        with open(path, 'rb') as spool:
+            return spool.read()
+    return read
+
+def show_response_filters(analytics_service: AnalyticsService, form_id: int,
+                          user: Dict[str, Any]) -> Optional[FilterSpec]:
+    """Filter controls for a form's analytics; the spec applies to summary, question analytics and exports"""
+    options = analytics_service.get_filter_options(form_id, user['id'], user['role'])
+    if not options or not options['versions']:
+        return None
+    
+    with st.expander("🔎 Filter responses"):
+        filters: Dict[str, Any] = {}
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.checkbox("Limit dates", key=f"filter_dates_{form_id}"):
+                start_date = st.date_input("From", value=datetime.now() - timedelta(days=30),
+                                           key=f"filter_start_{form_id}")
+                end_date = st.date_input("To", value=datetime.now(), key=f"filter_end_{form_id}")
+                filters['start_date'] = datetime.combine(start_date, datetime.min.time())
+                filters['end_date'] = datetime.combine(end_date, datetime.max.time())
+        with col2:
+            if len(options['versions']) > 1:
+                filters['versions'] = st.multiselect(
+                    "Form versions", options['versions'], format_func=lambda v: f"Version {v}",
+                    key=f"filter_versions_{form_id}"
+                )
+            filters['submitter'] = st.selectbox(
+                "Submitted by", list(SUBMITTER_LABELS), format_func=SUBMITTER_LABELS.get,
+                key=f"filter_submitter_{form_id}"
+            )
+        with col3:
+            questions = {question['id']: question['label'] for question in options['questions']}
+            question_id = st.selectbox(
+                "Answer to", [None] + list(questions), format_func=lambda q: 'any question' if q is None else questions[q],
+                key=f"filter_question_{form_id}"
+            )
+            if question_id is not None:
+                operator = st.selectbox("Condition", list(ANSWER_OPERATORS), format_func=OPERATOR_LABELS.get,
+                                        key=f"filter_operator_{form_id}")
+                value = None
+                if operator not in ('answered', 'not_answered'):
+                    value = st.text_input("Value", key=f"filter_value_{form_id}")
+                if value or operator in ('answered', 'not_answered'):
+                    try:
+                        AnswerPredicate(question_id, operator, value)
+                    except ValueError:
+                        st.warning("Enter a number to compare with.")
+                    else:
+                        filters['answer_filters'] = [{'question_id': question_id, 'operator': operator, 'value': value}]
+    
+    spec = FilterSpec.from_filters(filters)
+    return spec if spec.active else None
+
+@st.fragment(run_every=1.0)
+def show_export_downloads(analytics_service: AnalyticsService, form_id: int, user: Dict[str, Any],
+                          filters: Optional[FilterSpec] = None):
+    """Export buttons; exports are written to gzip spool files in the background and polled every second"""
+    exports = [('csv', "📥 Export to CSV"), ('json', "📊 Export to JSON")]
+    columns = st.columns(len(exports))
+    for column, (format_type, label) in zip(columns, exports):
+        with column:
+            key = (form_id, format_type, filters.key() if filters else None)
+            if st.button(label, key=f"export_{format_type}"):
+                job_id = analytics_service.start_export(
+                    form_id, user['id'], user['role'], format_type, owner=st.session_state.job_owner,
+                    filters=filters
+                )
+                if job_id is None:
+                    st.warning("Exports are busy right now; please try again shortly.")
+                    continue
+                st.session_state.export_jobs[key] = job_id
+            
+            job = poll_job(st.session_state.export_jobs.get(key))
+            if job is None:
+                st.session_state.export_jobs.pop(key, None)
+                continue
+            if job['state'] in ('queued', 'running'):
+                st.progress(job['progress'], text=f"Preparing {format_type.upper()} export...")
+            elif job['state'] == 'done' and job['result']:
+                export = job['result']
+                if export['rows']:
+                    st.download_button(
+                        f"Download {format_type.upper()} ({export['rows']} responses, {export['size'] / 1024:.0f} KB)",
+                        read_spool(export['path']), export['filename'], "application/gzip",
+                        key=f"download_{format_type}"
+                    )
+                else:
+                    st.info("No data to export")
+            elif job['state'] == 'failed':
+                st.error("Export failed. Please try again.")
+
 def show_form_analytics(user: Dict[str, Any]):
     """Analytics for specific form using real database data"""
     st.title("📈 Form Analytics")
@@ -1143,8 +1309,11 @@ def show_form_analytics(user: Dict[str, Any]):
     analytics_service = AnalyticsService()
     
     try:
+        # Filters narrow the summary, question analytics and exports alike
+        filters = show_response_filters(analytics_service, form_id, user)
+        
         # Get form summary stats
-        summary_stats = analytics_service.get_form_summary_stats(form_id, user['id'], user['role'])
+        summary_stats = analytics_service.get_form_summary_stats(form_id, user['id'], user['role'], filters)
         
         if not summary_stats:
             st.error("Unable to load form analytics. Form not found or access denied.")
@@ -1176,10 +1345,38 @@ def show_form_analytics(user: Dict[str, Any]):
             else:
                 st.metric("Last Response", "None")
         
+        if summary_stats['unique_respondents']:
+            prefix = "≈ " if summary_stats['unique_respondents_approximate'] else ""
+            st.caption(f"{prefix}{summary_stats['unique_respondents']:,} unique respondents")
+        
         st.divider()
         
+        # Trend and weekly pattern from the submission rollups
+        trend = analytics_service.get_submission_trend(form_id, user['id'], user['role'], days=90)
+        if any(point['count'] for point in trend):
+            st.subheader("📈 Responses Over Time")
+            st.line_chart(pd.DataFrame(trend).set_index('bucket'))
+            
+            heatmap = analytics_service.get_submission_heatmap(form_id, user['id'], user['role'], days=365)
+            if heatmap:
+                fig = go.Figure(go.Heatmap(
+                    z=heatmap['counts'], x=heatmap['hours'], y=heatmap['days'], colorscale='Blues'
+                ))
+                fig.update_layout(
+                    title=f"Responses by weekday and hour ({heatmap['timezone']})",
+                    xaxis_title="Hour of day", height=320
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            
+            st.divider()
+        
         # Question-specific analytics
-        question_analytics = analytics_service.get_question_analytics(form_id, user['id'], user['role'])
+        bins = st.selectbox(
+            "Histogram bins", list(BIN_STRATEGY_LABELS), format_func=BIN_STRATEGY_LABELS.get, key="analytics_bins"
+        )
+        question_analytics = analytics_service.get_question_analytics(
+            form_id, user['id'], user['role'], filters, bins=bins
+        )
         
         if question_analytics:
             st.subheader("📊 Question Analytics")
@@ -1204,34 +1401,27 @@ def show_form_analytics(user: Dict[str, Any]):
                             if 'average' in qa and qa['average']:
                                 st.write(f"**Average:** {qa['average']}")
                                 st.write(f"**Range:** {qa['min_value']} - {qa['max_value']}")
+                            if qa.get('q1') is not None:
+                                st.write(f"**Quartiles:** {qa['q1']} / {qa['median']} / {qa['q3']} (IQR {qa['iqr']})")
+                            if qa.get('distribution'):
+                                fig = go.Figure(go.Bar(
+                                    x=[row['range'] for row in qa['distribution']],
+                                    y=[row['count'] for row in qa['distribution']]
+                                ))
+                                fig.update_layout(height=240, margin=dict(t=10, b=10))
+                                st.plotly_chart(fig, use_container_width=True)
                         
                         elif qa['question_type'] in ['short_text', 'long_text']:
                             if 'avg_length' in qa:
                                 st.write(f"**Average Length:** {qa['avg_length']} characters")
+                            if qa['total_responses']:
+                                show_text_insights(analytics_service, form_id, qa['question_id'], user)
         else:
             st.info("No question analytics available yet. Add questions to your form to see detailed analytics.")
         
         # Export section
         st.divider()
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("📥 Export to CSV"):
-                csv_data = analytics_service.export_form_responses(form_id, user['id'], user['role'], 'csv')
-                if csv_data:
-                    st.download_button("Download CSV", csv_data, f"form_{form_id}_responses.csv", "text/csv")
-                    st.success("CSV export ready!")
-                else:
-                    st.info("No data to export")
-        
-        with col2:
-            if st.button("📊 Export to JSON"):
-                json_data = analytics_service.export_form_responses(form_id, user['id'], user['role'], 'json')
-                if json_data:
-                    st.download_button("Download JSON", json_data, f"form_{form_id}_responses.json", "application/json")
-                    st.success("JSON export ready!")
-                else:
-                    st.info("No data to export")
+        show_export_downloads(analytics_service, form_id, user, filters)
     
     except Exception as e:
         st.error(f"Error loading analytics: {str(e)}")
@@ -1275,6 +1465,9 @@ def show_global_analytics(user: Dict[str, Any]):
             else:
                 st.metric("Published Rate", "0%")
         
+        if dashboard_stats.get('unique_respondents_90d'):
+            st.caption(f"≈ {dashboard_stats['unique_respondents_90d']:,} unique respondents in the last 90 days")
+        
         st.divider()
         
         # Form status breakdown
@@ -5,15 +5,20 @@ Matches the database schema defined in migrations/init_db.sql
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     Text,
     Boolean,
     ForeignKey,
     DateTime,
+    Date,
     Numeric,
+    Float,
+    SmallInteger,
+    ARRAY,
     UniqueConstraint,
     Index,
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -124,6 +129,8 @@ class Question(Base):
     validation_min = Column(Numeric)
     validation_max = Column(Numeric)
     validation_regex = Column(Text)
+    # Shared by a question and its copies in later versions: the id of the original
+    lineage_key = Column(Integer)
 
     # Relationships
     form_version = relationship("FormVersion", back_populates="questions")
@@ -133,6 +140,7 @@ class Question(Base):
     # Indexes
     __table_args__ = (
         Index('idx_question_form_version_order', 'form_version_id', 'order_index'),
+        Index('idx_question_lineage', 'lineage_key'),
     )
 
 
@@ -166,6 +174,8 @@ class Submission(Base):
     guest_token = Column(Text)  # For tracking guest submissions
     submitted_at = Column(DateTime(timezone=True), server_default=func.now())
     completion_time_ms = Column(Integer)  # Time taken to complete form
+    # Set on the one submission per respondent that a single-submission form allows
+    enforce_single = Column(Boolean, nullable=False, default=False, server_default=text("false"))
 
     # Relationships
     form = relationship("Form", back_populates="submissions")
@@ -177,6 +187,12 @@ class Submission(Base):
     __table_args__ = (
         Index('idx_submission_form_user', 'form_id', 'user_id'),
         Index('idx_submission_form_date', 'form_id', 'submitted_at'),
+        Index('idx_submission_form_guest', 'form_id', 'guest_token'),
+        Index('idx_submission_version_id', 'form_version_id', 'id'),
+        Index('uq_submission_single_user', 'form_id', 'user_id', unique=True,
+              postgresql_where=text("enforce_single AND user_id IS NOT NULL")),
+        Index('uq_submission_single_guest', 'form_id', 'guest_token', unique=True,
+              postgresql_where=text("enforce_single AND user_id IS NULL AND guest_token IS NOT NULL")),
     )
 
 
@@ -188,6 +204,7 @@ class Answer(Base):
     submission_id = Column(Integer, ForeignKey("submissions.id", ondelete="CASCADE"))
     question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"))
     value = Column(Text)  # Store all values as text, convert based on field_type
+    lineage_key = Column(Integer)  # The question's lineage_key, for analytics across versions
 
     # Relationships
     submission = relationship("Submission", back_populates="answers")
@@ -197,6 +214,8 @@ class Answer(Base):
     __table_args__ = (
         UniqueConstraint('submission_id', 'question_id', name='unique_submission_question'),
         Index('idx_answer_submission', 'submission_id'),
+        Index('idx_answer_lineage', 'lineage_key'),
+        Index('idx_answer_question', 'question_id', 'id'),
     )
 
 
@@ -220,3 +239,153 @@ class Template(Base):
     __table_args__ = (
         Index('idx_template_tenant_visibility', 'tenant_id', 'visibility'),
     )
+
+
+# ============================================================================
+# ANALYTICS AGGREGATES (maintained on submission insert, see services/aggregates.py)
+# ============================================================================
+
+class FormVersionStats(Base):
+    """Submission count per form version"""
+    __tablename__ = "form_version_stats"
+    
+    form_version_id = Column(Integer, ForeignKey("form_versions.id", ondelete="CASCADE"), primary_key=True)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
+    submission_count = Column(Integer, nullable=False, default=0)
+    last_submitted_at = Column(DateTime(timezone=True))
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_form_version_stats_form', 'form_id'),
+    )
+
+
+class QuestionStats(Base):
+    """Response count and numeric moments per question"""
+    __tablename__ = "question_stats"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
+    response_count = Column(Integer, nullable=False, default=0)
+    numeric_count = Column(Integer, nullable=False, default=0)  # Answers that parse as numbers
+    numeric_sum = Column(Float, nullable=False, default=0)
+    numeric_sumsq = Column(Float, nullable=False, default=0)
+    numeric_min = Column(Float)
+    numeric_max = Column(Float)
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_question_stats_form', 'form_id'),
+    )
+
+
+class QuestionTextStats(Base):
+    """Answer count and length statistics per text question"""
+    __tablename__ = "question_text_stats"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
+    answer_count = Column(Integer, nullable=False, default=0)  # Non-blank answers
+    length_sum = Column(BigInteger, nullable=False, default=0)
+    length_min = Column(Integer)
+    length_max = Column(Integer)
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_question_text_stats_form', 'form_id'),
+    )
+
+
+class QuestionTerm(Base):
+    """Term frequencies of a text question's answers (see services/text_analytics.py)"""
+    __tablename__ = "question_terms"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    term = Column(Text, primary_key=True)
+    term_count = Column(Integer, nullable=False, default=0)
+
+    # Top terms of a question are read in index order
+    __table_args__ = (
+        Index('idx_question_terms_top', 'question_id', text('term_count DESC'), 'term'),
+    )
+
+
+class QuestionOptionStats(Base):
+    """Selection count per answer value of a choice question"""
+    __tablename__ = "question_option_stats"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    value = Column(Text, primary_key=True)
+    selection_count = Column(Integer, nullable=False, default=0)
+
+
+class QuestionSketch(Base):
+    """Quantile sketch of a numeric question's answers per submission day (see services/sketches.py)"""
+    __tablename__ = "question_sketches"
+    
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), nullable=False)
+    value_count = Column(Integer, nullable=False, default=0)
+    sketch = Column(Text, nullable=False)  # KLLSketch.to_json()
+
+    # Indexes
+    __table_args__ = (
+        Index('idx_question_sketches_form', 'form_id'),
+    )
+
+
+class FormRespondentSketch(Base):
+    """HyperLogLog registers of distinct respondents per form and submission day (see services/sketches.py)"""
+    __tablename__ = "form_respondent_sketches"
+    
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    registers = Column(ARRAY(SmallInteger), nullable=False)
+
+
+class TenantRespondentSketch(Base):
+    """HyperLogLog registers of distinct respondents across a tenant's forms per submission day"""
+    __tablename__ = "tenant_respondent_sketches"
+    
+    tenant_id = Column(Integer, ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    registers = Column(ARRAY(SmallInteger), nullable=False)
+
+
+class AggregateQueueEntry(Base):
+    """A submission not yet folded into the aggregates (see aggregates.fold_pending_aggregates)"""
+    __tablename__ = "aggregate_queue"
+    
+    submission_id = Column(Integer, ForeignKey("submissions.id", ondelete="CASCADE"), primary_key=True)
+
+
+class FormHourlySubmissions(Base):
+    """Submissions per form and UTC hour"""
+    __tablename__ = "form_hourly_submissions"
+    
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    submission_count = Column(Integer, nullable=False, default=0)
+
+
+class FormDailySubmissions(Base):
+    """Submissions per form and UTC day"""
+    __tablename__ = "form_daily_submissions"
+    
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), primary_key=True)
+    bucket_date = Column(Date, primary_key=True)
+    submission_count = Column(Integer, nullable=False, default=0)
+
+
+class FormSubmissionCounter(Base):
+    """Total submissions of a form, split over shards so concurrent writers update different rows
+
+    A form's count is the sum of its shards (see aggregates.load_submission_counts).
+    """
+    __tablename__ = "form_submission_counters"
+    
+    form_id = Column(Integer, ForeignKey("forms.id", ondelete="CASCADE"), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    submission_count = Column(Integer, nullable=False, default=0)
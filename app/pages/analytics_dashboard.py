@@ -16,6 +16,7 @@ import plotly.express as px
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 from app.services.analytics import summary_metrics, choice_stats, numeric_stats, text_table
+from app.services.filters import ANSWER_OPERATORS, OPERATOR_LABELS, SUBMITTER_LABELS, AnswerPredicate, FilterSpec
 
 
 # ============================================================================
@@ -71,7 +72,12 @@ class MetricsRow:
 # ============================================================================
 
 class AnalyticsFilter:
-    """Manages analytics filters (date range, submission count, etc.)."""
+    """Manages analytics filters (date range, version, submitter, answers, submission count).
+    
+    The filter dict converts to a FilterSpec (app.services.filters), which
+    AnalyticsService compiles into SQL; apply_filters() matches loaded
+    submissions with the same rules.
+    """
     
     def __init__(self):
         self.initialize_session_state()
@@ -79,14 +85,18 @@ class AnalyticsFilter:
     def initialize_session_state(self) -> None:
         """Initialize session state for filters."""
         if 'analytics_filters' not in st.session_state:
-            st.session_state.analytics_filters = {
+            st.session_state['analytics_filters'] = {
                 'start_date': datetime.now() - timedelta(days=30),
                 'end_date': datetime.now(),
                 'min_submissions': 0,
                 'question_filter': 'all',
+                'versions': [],
+                'submitter': 'all',
+                'answer_filters': [],
             }
     
-    def render_filters(self, available_questions: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def render_filters(self, available_questions: List[Dict[str, Any]] = None,
+                       available_versions: List[int] = None) -> Dict[str, Any]:
         """Render filter controls in sidebar and return filter dict."""
         st.sidebar.markdown("---")
         st.sidebar.subheader("📅 Filters")
@@ -106,6 +116,26 @@ class AnalyticsFilter:
                 key='filter_end_date'
             )
         
+        # Form version filter
+        versions = []
+        if available_versions:
+            versions = st.sidebar.multiselect(
+                "Form Versions",
+                options=available_versions,
+                default=[v for v in st.session_state.analytics_filters.get('versions', []) if v in available_versions],
+                format_func=lambda v: f"Version {v}",
+                key='filter_versions'
+            )
+        
+        # Submitter type filter
+        submitter = st.sidebar.selectbox(
+            "Submitted By",
+            options=list(SUBMITTER_LABELS),
+            index=list(SUBMITTER_LABELS).index(st.session_state.analytics_filters.get('submitter', 'all')),
+            format_func=SUBMITTER_LABELS.get,
+            key='filter_submitter'
+        )
+        
         # Min submissions filter
         min_subs = st.sidebar.slider(
             "Minimum Submissions",
@@ -128,29 +158,48 @@ class AnalyticsFilter:
             key='filter_question'
         )
         
+        # Answer condition on the selected question
+        answer_filters = []
+        question = next((q for q in available_questions or [] if q['label'] == question_filter), None)
+        if question is not None and 'id' in question:
+            operator = st.sidebar.selectbox(
+                "Answer",
+                options=['any'] + list(ANSWER_OPERATORS),
+                format_func=lambda op: 'any answer' if op == 'any' else OPERATOR_LABELS[op],
+                key='filter_answer_operator'
+            )
+            if operator in ('answered', 'not_answered'):
+                answer_filters.append({'question_id': question['id'], 'operator': operator})
+            elif operator != 'any':
+                value = st.sidebar.text_input("Value", key='filter_answer_value')
+                if value:
+                    try:
+                        AnswerPredicate(question['id'], operator, value)
+                    except ValueError:
+                        st.sidebar.warning("Enter a number to compare with.")
+                    else:
+                        answer_filters.append({'question_id': question['id'], 'operator': operator, 'value': value})
+        
         # Update session state
         st.session_state.analytics_filters = {
             'start_date': datetime.combine(start_date, datetime.min.time()),
             'end_date': datetime.combine(end_date, datetime.max.time()),
             'min_submissions': min_subs,
             'question_filter': question_filter,
+            'versions': versions,
+            'submitter': submitter,
+            'answer_filters': answer_filters,
         }
         
         return st.session_state.analytics_filters
     
     def apply_filters(self, submissions: List[Dict[str, Any]], 
                      filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Apply active filters to submissions list."""
-        filtered = submissions
-        
-        # Apply date range filter
-        if 'submitted_at' in (submissions[0] if submissions else {}):
-            filtered = [
-                s for s in filtered
-                if filters['start_date'] <= s['submitted_at'] <= filters['end_date']
-            ]
-        
-        return filtered
+        """Apply active filters to submissions list (see FilterSpec.matches)."""
+        spec = FilterSpec.from_filters(filters)
+        if not spec.active:
+            return submissions
+        return [s for s in submissions if spec.matches(s)]
 
 
 # ============================================================================
@@ -421,6 +470,11 @@ def render_analytics_dashboard(forms: List[Dict[str, Any]],
         st.warning("No submissions match the current filters.")
         return
     
+    if len(filtered_submissions) < filters.get('min_submissions', 0):
+        st.warning(f"Only {len(filtered_submissions)} submissions match the current filters; "
+                   f"question analytics need at least {filters['min_submissions']}.")
+        return
+    
     # ========== QUESTION ANALYTICS SECTION ==========
     st.subheader("📊 Question Analytics")
     
@@ -428,6 +482,14 @@ def render_analytics_dashboard(forms: List[Dict[str, Any]],
         st.info("No questions in this form.")
         return
     
+    if filters.get('question_filter', 'all') != 'all':
+        questions = [q for q in questions if q.get('label') == filters['question_filter']] or questions
+    
+    # Answers that name their submission only count for matching submissions
+    matching_ids = None
+    if FilterSpec.from_filters(filters).active:
+        matching_ids = {s['id'] for s in filtered_submissions if 'id' in s}
+    
     # Create tabs for each question
     question_tabs = st.tabs([q.get('label', f"Q{i}") for i, q in enumerate(questions)])
     
@@ -438,6 +500,10 @@ def render_analytics_dashboard(forms: List[Dict[str, Any]],
             
             # Get answers for this question
             question_answers = answers_data.get(question_id, [])
+            if matching_ids is not None:
+                question_answers = [
+                    a for a in question_answers if 'submission_id' not in a or a['submission_id'] in matching_ids
+                ]
             
             if not question_answers:
                 st.info("No responses for this question yet.")
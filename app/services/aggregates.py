@@ -0,0 +1,1039 @@
+"""
+Incrementally maintained analytics aggregates for FormMind-AI
+Submissions are folded into per-version submission counts, per-question
+response counts and numeric moments, per-option selection counts, text
+length statistics and term frequencies (the text analytics index), per-day
+quantile sketches of numeric answers, per-day HyperLogLog sketches of
+distinct respondents (per form and per tenant) and hourly / daily
+submission counts, so analytics read O(questions) rows instead of every
+answer and trends read O(buckets) rows.
+
+A submission only increments one shard of its form's submission counter
+and queues its id, so submissions to a hot form share no locked row; a
+folder thread (or the fold command) merges queued submissions into the
+other aggregates in batches, a few seconds behind.
+
+Rebuild or verify the aggregates from raw answers, repair only drifted
+submission counters (cheap enough to run from cron) or fold the queue now:
+    python -m app.services.aggregates rebuild [--form-id ID]
+    python -m app.services.aggregates verify [--form-id ID]
+    python -m app.services.aggregates reconcile [--form-id ID]
+    python -m app.services.aggregates fold
+"""
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from collections import Counter
+from datetime import datetime, date, timezone
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+from sqlalchemy.orm import Session
+from sqlalchemy import SmallInteger, func, delete, insert, literal, or_, select, text, tuple_, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..db import get_db_session, profile_operation
+from ..models import (
+    Form, Submission, Answer, Question, FormVersionStats, QuestionStats, QuestionOptionStats, QuestionSketch,
+    QuestionTextStats, QuestionTerm,
+    FormRespondentSketch, TenantRespondentSketch, FormHourlySubmissions, FormDailySubmissions,
+    FormSubmissionCounter, AggregateQueueEntry
+)
+from .numeric_analytics import parse_number
+from .sketches import KLLSketch, HyperLogLog, HLL_REGISTERS, respondent_key
+from .text_analytics import TEXT_FIELD_TYPES, DEFAULT_TOP_N, terms, stop_words
+
+logger = logging.getLogger(__name__)
+
+# Rows each form's submission counter is spread over; each transaction increments one at random
+SUBMISSION_COUNTER_SHARDS = max(int(os.getenv("SUBMISSION_COUNTER_SHARDS", "8")), 1)
+
+# Queued submissions folded per transaction, and how often the folder thread looks for them
+AGGREGATE_FOLD_BATCH = int(os.getenv("AGGREGATE_FOLD_BATCH", "1000"))
+AGGREGATE_FOLD_INTERVAL = float(os.getenv("AGGREGATE_FOLD_INTERVAL", "2.0"))
+AGGREGATE_FOLD_RETRY_MAX_SECONDS = 60.0
+
+# Transaction-level advisory lock held while folding (and rebuilding), so
+# one process folds at a time
+_FOLD_LOCK_KEY = 0x466F4C44
+
+# Register assignments per UPDATE of a respondent sketch (PostgreSQL allows 1664 SET targets)
+_REGISTER_UPDATE_CHUNK = 1024
+
+NUMERIC_FIELD_TYPES = ('number',)
+CHOICE_FIELD_TYPES = ('radio', 'dropdown', 'checkbox')
+
+
+def sketch_bucket(submitted_at: Optional[datetime]) -> date:
+    """UTC day a submission's numeric answers are sketched under"""
+    if submitted_at is None:
+        return datetime.now(timezone.utc).date()
+    # Naive timestamps (datetime.now() on insert) are local time, as PostgreSQL stores them
+    return submitted_at.astimezone(timezone.utc).date()
+
+
+def hour_bucket(submitted_at: Optional[datetime]) -> datetime:
+    """Start of the UTC hour a submission is rolled up under"""
+    if submitted_at is None:
+        submitted_at = datetime.now(timezone.utc)
+    return submitted_at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def parse_selections(field_type: str, value: Optional[str]) -> List[str]:
+    """Option values selected by one stored answer"""
+    if value is None:
+        return []
+    if field_type == 'checkbox' and value.startswith('['):
+        try:
+            return [str(selection) for selection in json.loads(value)]
+        except ValueError:
+            pass
+    return [value]
+
+
+class AggregateDelta:
+    """Aggregate increments for a batch of submissions, applied with one upsert per table"""
+
+    def __init__(self):
+        self.versions: Dict[int, List[Any]] = {}   # version id -> [form id, count, last submitted at]
+        self.questions: Dict[int, List[Any]] = {}  # question id -> [form id, responses, n, sum, sumsq, min, max]
+        self.options: Counter = Counter()          # (question id, value) -> selections
+        self.sketches: Dict[Tuple[int, date], List[Any]] = {}  # (question id, day) -> [form id, KLLSketch]
+        self.form_respondents: Dict[Tuple[int, date], List[Any]] = {}  # (form id, day) -> [tenant id, HLL]
+        self.tenant_respondents: Dict[Tuple[int, date], HyperLogLog] = {}  # (tenant id, day) -> HLL
+        self.hourly: Counter = Counter()  # (form id, UTC hour start) -> submissions
+        self.forms: Counter = Counter()   # form id -> submissions
+        self.texts: Dict[int, List[Any]] = {}  # question id -> [form id, answers, length sum, min, max]
+        self.terms: Counter = Counter()        # (question id, term) -> occurrences
+
+    def __bool__(self) -> bool:
+        return bool(self.versions or self.questions or self.options or self.sketches
+                    or self.form_respondents or self.tenant_respondents or self.hourly or self.forms
+                    or self.texts or self.terms)
+
+    def add_submission(self, form_id: int, form_version_id: Optional[int], submitted_at: Optional[datetime] = None,
+                       count: int = 1) -> None:
+        self.forms[form_id] += count
+        if form_version_id is None:
+            return
+        entry = self.versions.setdefault(form_version_id, [form_id, 0, None])
+        entry[1] += count
+        if submitted_at is not None and (entry[2] is None or submitted_at > entry[2]):
+            entry[2] = submitted_at
+
+    def add_rollup(self, form_id: int, hour_start: datetime, count: int = 1) -> None:
+        self.hourly[(form_id, hour_start)] += count
+
+    def daily(self) -> Counter:
+        """(form id, UTC day) -> submissions, summed from the hourly counts"""
+        days: Counter = Counter()
+        for (form_id, hour_start), count in self.hourly.items():
+            days[(form_id, hour_start.date())] += count
+        return days
+
+    def add_respondent(self, tenant_id: int, form_id: int, bucket: date, user_id: Optional[int],
+                       guest_token: Optional[str]) -> None:
+        key = respondent_key(user_id, guest_token)
+        if key is None:
+            return
+        entry = self.form_respondents.get((form_id, bucket))
+        if entry is None:
+            entry = self.form_respondents[(form_id, bucket)] = [tenant_id, HyperLogLog()]
+        entry[1].add(key)
+        sketch = self.tenant_respondents.get((tenant_id, bucket))
+        if sketch is None:
+            sketch = self.tenant_respondents[(tenant_id, bucket)] = HyperLogLog()
+        sketch.add(key)
+
+    def add_answer(self, form_id: int, question_id: int, field_type: str, value: Optional[str],
+                   bucket: Optional[date] = None) -> None:
+        entry = self.questions.get(question_id)
+        if entry is None:
+            entry = self.questions[question_id] = [form_id, 0, 0, 0.0, 0.0, None, None]
+        entry[1] += 1
+        if field_type in NUMERIC_FIELD_TYPES:
+            number = parse_number(value)
+            if number is not None:
+                entry[2] += 1
+                entry[3] += number
+                entry[4] += number * number
+                entry[5] = number if entry[5] is None else min(entry[5], number)
+                entry[6] = number if entry[6] is None else max(entry[6], number)
+                if bucket is not None:
+                    self.add_sketch_value(form_id, question_id, bucket, number)
+        elif field_type in CHOICE_FIELD_TYPES:
+            for selection in parse_selections(field_type, value):
+                self.options[(question_id, selection)] += 1
+        elif field_type in TEXT_FIELD_TYPES and value and value.strip():
+            length = len(value)
+            text_entry = self.texts.get(question_id)
+            if text_entry is None:
+                text_entry = self.texts[question_id] = [form_id, 0, 0, length, length]
+            text_entry[1] += 1
+            text_entry[2] += length
+            text_entry[3] = min(text_entry[3], length)
+            text_entry[4] = max(text_entry[4], length)
+            self.terms.update((question_id, term) for term in terms(value))
+
+    def add_sketch_value(self, form_id: int, question_id: int, bucket: date, number: float) -> None:
+        sketch = self.sketches.get((question_id, bucket))
+        if sketch is None:
+            sketch = self.sketches[(question_id, bucket)] = [form_id, KLLSketch()]
+        sketch[1].update(number)
+
+    def apply(self, session: Session) -> None:
+        """Upsert the increments (rows sorted by key so concurrent writers lock in the same order)"""
+        if self.versions:
+            stmt = pg_insert(FormVersionStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FormVersionStats.form_version_id],
+                set_={
+                    'submission_count': FormVersionStats.submission_count + stmt.excluded.submission_count,
+                    'last_submitted_at': func.greatest(
+                        FormVersionStats.last_submitted_at, stmt.excluded.last_submitted_at
+                    ),
+                }
+            )
+            session.execute(stmt, [
+                {'form_version_id': version_id, 'form_id': form_id,
+                 'submission_count': count, 'last_submitted_at': last_at}
+                for version_id, (form_id, count, last_at) in sorted(self.versions.items())
+            ])
+
+        if self.questions:
+            stmt = pg_insert(QuestionStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuestionStats.question_id],
+                set_={
+                    'response_count': QuestionStats.response_count + stmt.excluded.response_count,
+                    'numeric_count': QuestionStats.numeric_count + stmt.excluded.numeric_count,
+                    'numeric_sum': QuestionStats.numeric_sum + stmt.excluded.numeric_sum,
+                    'numeric_sumsq': QuestionStats.numeric_sumsq + stmt.excluded.numeric_sumsq,
+                    'numeric_min': func.least(QuestionStats.numeric_min, stmt.excluded.numeric_min),
+                    'numeric_max': func.greatest(QuestionStats.numeric_max, stmt.excluded.numeric_max),
+                }
+            )
+            session.execute(stmt, [
+                {'question_id': question_id, 'form_id': form_id, 'response_count': responses,
+                 'numeric_count': n, 'numeric_sum': total, 'numeric_sumsq': total_sq,
+                 'numeric_min': low, 'numeric_max': high}
+                for question_id, (form_id, responses, n, total, total_sq, low, high)
+                in sorted(self.questions.items())
+            ])
+
+        if self.options:
+            stmt = pg_insert(QuestionOptionStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuestionOptionStats.question_id, QuestionOptionStats.value],
+                set_={
+                    'selection_count': QuestionOptionStats.selection_count + stmt.excluded.selection_count,
+                }
+            )
+            session.execute(stmt, [
+                {'question_id': question_id, 'value': value, 'selection_count': count}
+                for (question_id, value), count in sorted(self.options.items())
+            ])
+
+        if self.texts:
+            stmt = pg_insert(QuestionTextStats)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuestionTextStats.question_id],
+                set_={
+                    'answer_count': QuestionTextStats.answer_count + stmt.excluded.answer_count,
+                    'length_sum': QuestionTextStats.length_sum + stmt.excluded.length_sum,
+                    'length_min': func.least(QuestionTextStats.length_min, stmt.excluded.length_min),
+                    'length_max': func.greatest(QuestionTextStats.length_max, stmt.excluded.length_max),
+                }
+            )
+            session.execute(stmt, [
+                {'question_id': question_id, 'form_id': form_id, 'answer_count': count,
+                 'length_sum': length_sum, 'length_min': low, 'length_max': high}
+                for question_id, (form_id, count, length_sum, low, high) in sorted(self.texts.items())
+            ])
+
+        if self.terms:
+            stmt = pg_insert(QuestionTerm)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[QuestionTerm.question_id, QuestionTerm.term],
+                set_={'term_count': QuestionTerm.term_count + stmt.excluded.term_count}
+            )
+            session.execute(stmt, [
+                {'question_id': question_id, 'term': term, 'term_count': count}
+                for (question_id, term), count in sorted(self.terms.items())
+            ])
+
+        if self.forms:
+            # Concurrent submissions to a hot form mostly land on different shards
+            shard = random.randrange(SUBMISSION_COUNTER_SHARDS)
+            stmt = pg_insert(FormSubmissionCounter)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FormSubmissionCounter.form_id, FormSubmissionCounter.shard],
+                set_={'submission_count': FormSubmissionCounter.submission_count + stmt.excluded.submission_count}
+            )
+            session.execute(stmt, [
+                {'form_id': form_id, 'shard': shard, 'submission_count': count}
+                for form_id, count in sorted(self.forms.items())
+            ])
+
+        if self.sketches:
+            self._apply_sketches(session)
+
+        if self.hourly:
+            stmt = pg_insert(FormHourlySubmissions)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FormHourlySubmissions.form_id, FormHourlySubmissions.bucket_start],
+                set_={'submission_count': FormHourlySubmissions.submission_count + stmt.excluded.submission_count}
+            )
+            session.execute(stmt, [
+                {'form_id': form_id, 'bucket_start': hour_start, 'submission_count': count}
+                for (form_id, hour_start), count in sorted(self.hourly.items())
+            ])
+            stmt = pg_insert(FormDailySubmissions)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[FormDailySubmissions.form_id, FormDailySubmissions.bucket_date],
+                set_={'submission_count': FormDailySubmissions.submission_count + stmt.excluded.submission_count}
+            )
+            session.execute(stmt, [
+                {'form_id': form_id, 'bucket_date': day, 'submission_count': count}
+                for (form_id, day), count in sorted(self.daily().items())
+            ])
+
+        if self.form_respondents:
+            _apply_respondent_sketches(session, FormRespondentSketch, ('form_id', 'bucket_date'), {
+                key: ({'tenant_id': tenant_id}, sketch)
+                for key, (tenant_id, sketch) in self.form_respondents.items()
+            })
+        if self.tenant_respondents:
+            _apply_respondent_sketches(session, TenantRespondentSketch, ('tenant_id', 'bucket_date'), {
+                key: ({}, sketch) for key, sketch in self.tenant_respondents.items()
+            })
+
+    def _apply_sketches(self, session: Session) -> None:
+        """Insert new day sketches; merge into existing ones under a row lock
+
+        Sketches cannot be merged in SQL, so rows that already exist are read
+        FOR UPDATE (in key order), merged here and written back. Called once
+        per folded batch (or rebuild), not per submission.
+        """
+        keys = sorted(self.sketches)
+        inserted = {tuple(row) for row in session.execute(
+            pg_insert(QuestionSketch).on_conflict_do_nothing().returning(
+                QuestionSketch.question_id, QuestionSketch.bucket_date
+            ),
+            [
+                {'question_id': question_id, 'bucket_date': bucket, 'form_id': form_id,
+                 'value_count': sketch.n, 'sketch': sketch.to_json()}
+                for (question_id, bucket), (form_id, sketch) in ((key, self.sketches[key]) for key in keys)
+            ]
+        )}
+        existing = [key for key in keys if key not in inserted]
+        if not existing:
+            return
+
+        rows = session.query(
+            QuestionSketch.question_id, QuestionSketch.bucket_date, QuestionSketch.sketch
+        ).filter(
+            tuple_(QuestionSketch.question_id, QuestionSketch.bucket_date).in_(existing)
+        ).order_by(QuestionSketch.question_id, QuestionSketch.bucket_date).with_for_update().all()
+        updates = []
+        for question_id, bucket, data in rows:
+            merged = KLLSketch.from_json(data).merge(self.sketches[(question_id, bucket)][1])
+            updates.append({'question_id': question_id, 'bucket_date': bucket,
+                            'value_count': merged.n, 'sketch': merged.to_json()})
+        session.execute(update(QuestionSketch), updates)
+
+
+def _apply_respondent_sketches(session: Session, model, key_names: Tuple[str, ...],
+                               sketches: Dict[Tuple, Tuple[Dict[str, Any], HyperLogLog]]) -> None:
+    """Merge HyperLogLog sketches into stored registers by sending only their set registers
+
+    sketches maps a primary key to (other column values, HyperLogLog).
+    Missing rows are created with zeroed registers in the database, then
+    each row gets an UPDATE of registers[i] = greatest(registers[i], rank)
+    over the sketch's nonzero registers (skipped if none would grow), so
+    neither side ships or rebuilds the whole register array. Dense sketches
+    (a rebuild) take one UPDATE per _REGISTER_UPDATE_CHUNK registers.
+    """
+    keys = sorted(sketches)
+    key_columns = [getattr(model, name) for name in key_names]
+    session.execute(
+        pg_insert(model).values(
+            registers=func.array_fill(literal(0, SmallInteger), [HLL_REGISTERS])
+        ).on_conflict_do_nothing(),
+        [dict(zip(key_names, key), **sketches[key][0]) for key in keys]
+    )
+    registers = model.registers
+    for key in keys:
+        # PostgreSQL arrays are 1-based
+        ranks = [(index + 1, rank) for index, rank in sorted(sketches[key][1].nonzero_registers().items())]
+        for start in range(0, len(ranks), _REGISTER_UPDATE_CHUNK):
+            chunk = ranks[start:start + _REGISTER_UPDATE_CHUNK]
+            session.execute(
+                update(model).where(
+                    *[column == value for column, value in zip(key_columns, key)],
+                    or_(*[registers[index] < rank for index, rank in chunk])
+                ).values({registers[index]: func.greatest(registers[index], rank) for index, rank in chunk})
+            )
+
+
+def record_submission_aggregates(session: Session, submissions: Iterable[Dict[str, Any]]) -> None:
+    """Count newly inserted submissions and queue them for folding, in the caller's transaction
+
+    Each item has 'submission_id' and 'form_id'. Only one shard of each
+    form's submission counter is written here, so concurrent submissions to
+    a hot form share no locked row; every other aggregate is merged from the
+    queue by fold_pending_aggregates.
+    """
+    submissions = list(submissions)
+    if not submissions:
+        return
+    delta = AggregateDelta()
+    for item in submissions:
+        delta.add_submission(item['form_id'], None)
+    delta.apply(session)
+    session.execute(insert(AggregateQueueEntry), [{'submission_id': item['submission_id']} for item in submissions])
+
+
+def fold_pending_aggregates(session: Session, limit: int = AGGREGATE_FOLD_BATCH, wait: bool = False) -> int:
+    """Merge up to limit queued submissions into the aggregates; returns how many
+
+    Everything but the submission counters (counted on submit) is folded
+    here with one upsert per table per batch. While another process is
+    folding, returns 0 at once (or waits for it with wait=True). The queue
+    entries are deleted in the same transaction, so a failed fold leaves
+    them queued.
+    """
+    if wait:
+        session.execute(select(func.pg_advisory_xact_lock(_FOLD_LOCK_KEY)))
+    elif not session.execute(select(func.pg_try_advisory_xact_lock(_FOLD_LOCK_KEY))).scalar():
+        return 0
+    claimed = select(AggregateQueueEntry.submission_id).order_by(
+        AggregateQueueEntry.submission_id
+    ).limit(limit).with_for_update(skip_locked=True)
+    submission_ids = session.execute(
+        delete(AggregateQueueEntry).where(AggregateQueueEntry.submission_id.in_(claimed))
+        .returning(AggregateQueueEntry.submission_id)
+    ).scalars().all()
+    if not submission_ids:
+        return 0
+
+    delta = AggregateDelta()
+    tenant_ids = set()
+    submissions = session.query(
+        Form.tenant_id, Submission.form_id, Submission.form_version_id, Submission.submitted_at,
+        Submission.user_id, Submission.guest_token
+    ).join(Form, Submission.form_id == Form.id).filter(Submission.id.in_(submission_ids))
+    for tenant_id, form_id, version_id, submitted_at, user_id, guest_token in submissions:
+        delta.add_submission(form_id, version_id, submitted_at)
+        delta.add_rollup(form_id, hour_bucket(submitted_at))
+        delta.add_respondent(tenant_id, form_id, sketch_bucket(submitted_at), user_id, guest_token)
+        tenant_ids.add(tenant_id)
+    delta.forms.clear()  # Counted when they were submitted
+
+    answers = session.query(
+        Submission.form_id, Submission.submitted_at, Answer.question_id, Question.field_type, Answer.value
+    ).join(
+        Submission, Answer.submission_id == Submission.id
+    ).join(
+        Question, Answer.question_id == Question.id
+    ).filter(Answer.submission_id.in_(submission_ids))
+    for form_id, submitted_at, question_id, field_type, value in answers:
+        delta.add_answer(form_id, question_id, field_type, value, sketch_bucket(submitted_at))
+    delta.apply(session)
+
+    # Imported here: tenant_dashboard reads respondent sketches from this module
+    from .tenant_dashboard import invalidate_tenant_dashboard
+    for tenant_id in tenant_ids:
+        invalidate_tenant_dashboard(tenant_id, session)
+    return len(submission_ids)
+
+
+class AggregateFolder:
+    """Background thread folding queued submissions into the aggregates in batches"""
+
+    def __init__(self, batch_size: int = AGGREGATE_FOLD_BATCH, interval: float = AGGREGATE_FOLD_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.folded = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aggregate-folder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def fold_once(self) -> int:
+        with profile_operation("AggregateFolder.fold"):
+            with get_db_session() as session:
+                folded = fold_pending_aggregates(session, self.batch_size)
+        self.folded += folded
+        return folded
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            delay = self.interval
+            try:
+                folded = self.fold_once()
+                self.consecutive_failures = 0
+                if folded >= self.batch_size:
+                    continue  # Backlog: keep going without waiting
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                delay = min(self.interval * 2 ** self.consecutive_failures, AGGREGATE_FOLD_RETRY_MAX_SECONDS)
+                logger.warning(f"Aggregate folder failed, retrying in {delay:.0f}s: {e}")
+            self._stop.wait(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'folded': self.folded,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+
+_folder: Optional[AggregateFolder] = None
+_folder_lock = threading.Lock()
+
+
+def start_aggregate_folder() -> AggregateFolder:
+    """Process-wide folder thread, started on first use"""
+    global _folder
+    with _folder_lock:
+        if _folder is None:
+            _folder = AggregateFolder()
+        _folder.start()
+        return _folder
+
+
+def fold_all_pending() -> int:
+    """Fold the whole queue, one batch per transaction; returns the number of submissions folded"""
+    total = 0
+    while True:
+        with get_db_session() as session:
+            folded = fold_pending_aggregates(session, wait=True)
+        if not folded:
+            return total
+        total += folded
+
+
+def compute_aggregates(session: Session, form_id: Optional[int] = None) -> AggregateDelta:
+    """Recompute aggregates from raw submissions and answers, streaming the answers"""
+    delta = AggregateDelta()
+
+    submission_counts = session.query(
+        Submission.form_id, Submission.form_version_id,
+        func.count(Submission.id), func.max(Submission.submitted_at)
+    ).filter(Submission.form_id.isnot(None))
+    if form_id is not None:
+        submission_counts = submission_counts.filter(Submission.form_id == form_id)
+    for row_form_id, version_id, count, last_at in submission_counts.group_by(
+        Submission.form_id, Submission.form_version_id
+    ):
+        delta.add_submission(row_form_id, version_id, last_at, count=count)
+
+    hour = func.date_trunc('hour', func.timezone('UTC', Submission.submitted_at))
+    rollups = session.query(Submission.form_id, hour, func.count(Submission.id)).filter(
+        Submission.submitted_at.isnot(None)
+    )
+    if form_id is not None:
+        rollups = rollups.filter(Submission.form_id == form_id)
+    for row_form_id, hour_start, count in rollups.group_by(Submission.form_id, hour):
+        delta.add_rollup(row_form_id, hour_start.replace(tzinfo=timezone.utc), count=count)
+
+    # A form's rebuild merges into the tenant sketches: a register-wise max
+    # of the same respondents is idempotent, and other forms' rows stay intact
+    respondents = session.query(
+        Form.tenant_id, Submission.form_id, Submission.submitted_at, Submission.user_id, Submission.guest_token
+    ).join(Form, Submission.form_id == Form.id)
+    if form_id is not None:
+        respondents = respondents.filter(Submission.form_id == form_id)
+    for tenant_id, row_form_id, submitted_at, user_id, guest_token in respondents.execution_options(yield_per=10000):
+        delta.add_respondent(tenant_id, row_form_id, sketch_bucket(submitted_at), user_id, guest_token)
+
+    answers = session.query(
+        Submission.form_id, Submission.submitted_at, Answer.question_id, Question.field_type, Answer.value
+    ).join(
+        Submission, Answer.submission_id == Submission.id
+    ).join(
+        Question, Answer.question_id == Question.id
+    )
+    if form_id is not None:
+        answers = answers.filter(Submission.form_id == form_id)
+    for row_form_id, submitted_at, question_id, field_type, value in answers.execution_options(yield_per=10000):
+        delta.add_answer(row_form_id, question_id, field_type, value, sketch_bucket(submitted_at))
+    return delta
+
+
+def _lock_aggregates(session: Session) -> None:
+    # Submitters block on the counters until the rebuild commits; their
+    # submissions were invisible to the rebuild and stay queued for the fold
+    session.execute(text(
+        "LOCK TABLE form_version_stats, question_stats, question_option_stats, question_sketches, "
+        "form_respondent_sketches, tenant_respondent_sketches, form_hourly_submissions, form_daily_submissions, "
+        "form_submission_counters, question_text_stats, question_terms IN EXCLUSIVE MODE"
+    ))
+
+
+def rebuild_aggregates(session: Session, form_id: Optional[int] = None) -> AggregateDelta:
+    """Replace the stored aggregates (all, or one form's) with a recomputation"""
+    # Waits for a running fold; queued submissions visible now are recomputed below
+    session.execute(select(func.pg_advisory_xact_lock(_FOLD_LOCK_KEY)))
+    _lock_aggregates(session)
+    if form_id is None:
+        session.execute(delete(AggregateQueueEntry))
+        session.execute(delete(QuestionTerm))
+        session.execute(delete(QuestionTextStats))
+        session.execute(delete(FormSubmissionCounter))
+        session.execute(delete(FormDailySubmissions))
+        session.execute(delete(FormHourlySubmissions))
+        session.execute(delete(TenantRespondentSketch))
+        session.execute(delete(FormRespondentSketch))
+        session.execute(delete(QuestionSketch))
+        session.execute(delete(QuestionOptionStats))
+        session.execute(delete(QuestionStats))
+        session.execute(delete(FormVersionStats))
+    else:
+        session.execute(delete(AggregateQueueEntry).where(AggregateQueueEntry.submission_id.in_(
+            select(Submission.id).where(Submission.form_id == form_id)
+        )))
+        session.execute(delete(QuestionTerm).where(QuestionTerm.question_id.in_(
+            session.query(QuestionTextStats.question_id).filter(QuestionTextStats.form_id == form_id)
+        )))
+        session.execute(delete(QuestionTextStats).where(QuestionTextStats.form_id == form_id))
+        session.execute(delete(FormSubmissionCounter).where(FormSubmissionCounter.form_id == form_id))
+        session.execute(delete(FormDailySubmissions).where(FormDailySubmissions.form_id == form_id))
+        session.execute(delete(FormHourlySubmissions).where(FormHourlySubmissions.form_id == form_id))
+        session.execute(delete(FormRespondentSketch).where(FormRespondentSketch.form_id == form_id))
+        session.execute(delete(QuestionSketch).where(QuestionSketch.form_id == form_id))
+        session.execute(delete(QuestionOptionStats).where(QuestionOptionStats.question_id.in_(
+            session.query(QuestionStats.question_id).filter(QuestionStats.form_id == form_id)
+        )))
+        session.execute(delete(QuestionStats).where(QuestionStats.form_id == form_id))
+        session.execute(delete(FormVersionStats).where(FormVersionStats.form_id == form_id))
+
+    delta = compute_aggregates(session, form_id)
+    delta.apply(session)
+    logger.info(f"Rebuilt aggregates for {'all forms' if form_id is None else f'form {form_id}'}: "
+                f"{len(delta.versions)} versions, {len(delta.questions)} questions, {len(delta.options)} options, "
+                f"{len(delta.sketches)} sketches, {len(delta.form_respondents)} respondent sketches, "
+                f"{len(delta.hourly)} hourly rollups, {len(delta.terms)} indexed terms")
+    return delta
+
+
+def verify_aggregates(session: Session, form_id: Optional[int] = None) -> List[str]:
+    """Compare stored aggregates with a recomputation; returns one line per mismatch
+
+    Submissions still queued for folding show up as drift, so fold the
+    queue first (the verify command does).
+    """
+    expected = compute_aggregates(session, form_id)
+    stored = AggregateDelta()
+
+    versions = session.query(FormVersionStats)
+    questions = session.query(QuestionStats)
+    options = session.query(QuestionOptionStats.question_id, QuestionOptionStats.value,
+                            QuestionOptionStats.selection_count)
+    if form_id is not None:
+        versions = versions.filter(FormVersionStats.form_id == form_id)
+        questions = questions.filter(QuestionStats.form_id == form_id)
+        options = options.join(
+            QuestionStats, QuestionStats.question_id == QuestionOptionStats.question_id
+        ).filter(QuestionStats.form_id == form_id)
+    for row in versions:
+        stored.versions[row.form_version_id] = [row.form_id, row.submission_count, row.last_submitted_at]
+    for row in questions:
+        stored.questions[row.question_id] = [
+            row.form_id, row.response_count, row.numeric_count, row.numeric_sum,
+            row.numeric_sumsq, row.numeric_min, row.numeric_max
+        ]
+    for question_id, value, count in options:
+        if count:
+            stored.options[(question_id, value)] = count
+
+    mismatches = []
+    for version_id in sorted(set(expected.versions) | set(stored.versions)):
+        want = expected.versions.get(version_id, [None, 0])[1]
+        got = stored.versions.get(version_id, [None, 0])[1]
+        if want != got:
+            mismatches.append(f"form_version {version_id}: submission_count {got} != {want}")
+
+    stored_forms = load_submission_counts(session, None if form_id is None else [form_id])
+    for row_form_id in sorted(set(expected.forms) | set(stored_forms)):
+        if expected.forms.get(row_form_id, 0) != stored_forms.get(row_form_id, 0):
+            mismatches.append(f"form {row_form_id}: submission counter "
+                              f"{stored_forms.get(row_form_id, 0)} != {expected.forms.get(row_form_id, 0)}")
+
+    fields = ('response_count', 'numeric_count', 'numeric_sum', 'numeric_sumsq', 'numeric_min', 'numeric_max')
+    for question_id in sorted(set(expected.questions) | set(stored.questions)):
+        want = expected.questions.get(question_id, [None, 0, 0, 0.0, 0.0, None, None])[1:]
+        got = stored.questions.get(question_id, [None, 0, 0, 0.0, 0.0, None, None])[1:]
+        for field, want_value, got_value in zip(fields, want, got):
+            if want_value is None or got_value is None:
+                same = want_value is got_value
+            else:
+                same = math.isclose(want_value, got_value, rel_tol=1e-9, abs_tol=1e-9)
+            if not same:
+                mismatches.append(f"question {question_id}: {field} {got_value} != {want_value}")
+
+    for key in sorted(set(expected.options) | set(stored.options)):
+        if expected.options.get(key, 0) != stored.options.get(key, 0):
+            mismatches.append(f"question {key[0]} option {key[1]!r}: selection_count "
+                              f"{stored.options.get(key, 0)} != {expected.options.get(key, 0)}")
+
+    text_rows = session.query(QuestionTextStats)
+    term_rows = session.query(QuestionTerm.question_id, QuestionTerm.term, QuestionTerm.term_count)
+    if form_id is not None:
+        text_rows = text_rows.filter(QuestionTextStats.form_id == form_id)
+        term_rows = term_rows.join(
+            QuestionTextStats, QuestionTextStats.question_id == QuestionTerm.question_id
+        ).filter(QuestionTextStats.form_id == form_id)
+    stored_texts = {
+        row.question_id: [row.answer_count, row.length_sum, row.length_min, row.length_max] for row in text_rows
+    }
+    text_fields = ('answer_count', 'length_sum', 'length_min', 'length_max')
+    for question_id in sorted(set(expected.texts) | set(stored_texts)):
+        want = expected.texts.get(question_id, [None, 0, 0, None, None])[1:]
+        got = stored_texts.get(question_id, [0, 0, None, None])
+        for field, want_value, got_value in zip(text_fields, want, got):
+            if want_value != got_value:
+                mismatches.append(f"question {question_id}: {field} {got_value} != {want_value}")
+    stored_terms = Counter({(question_id, term): count for question_id, term, count in term_rows if count})
+    drifted_terms = Counter()
+    for key in set(expected.terms) | set(stored_terms):
+        if expected.terms[key] != stored_terms[key]:
+            drifted_terms[key[0]] += 1
+    for question_id, count in sorted(drifted_terms.items()):
+        mismatches.append(f"question {question_id}: {count} term counts differ")
+
+    # Sketches are approximate; check that every numeric answer is in one
+    expected_sketched = Counter()
+    for (question_id, _), (_, sketch) in expected.sketches.items():
+        expected_sketched[question_id] += sketch.n
+    sketched = session.query(QuestionSketch.question_id, func.sum(QuestionSketch.value_count))
+    if form_id is not None:
+        sketched = sketched.filter(QuestionSketch.form_id == form_id)
+    stored_sketched = Counter(dict(sketched.group_by(QuestionSketch.question_id).all()))
+    for question_id in sorted(set(expected_sketched) | set(stored_sketched)):
+        if expected_sketched[question_id] != stored_sketched[question_id]:
+            mismatches.append(f"question {question_id}: sketched values "
+                              f"{stored_sketched[question_id]} != {expected_sketched[question_id]}")
+
+    hourly = session.query(FormHourlySubmissions.form_id, FormHourlySubmissions.bucket_start,
+                           FormHourlySubmissions.submission_count)
+    daily = session.query(FormDailySubmissions.form_id, FormDailySubmissions.bucket_date,
+                          FormDailySubmissions.submission_count)
+    if form_id is not None:
+        hourly = hourly.filter(FormHourlySubmissions.form_id == form_id)
+        daily = daily.filter(FormDailySubmissions.form_id == form_id)
+    for label, want, got in (
+        ('hour', expected.hourly, Counter({(f, h.astimezone(timezone.utc)): c for f, h, c in hourly if c})),
+        ('day', expected.daily(), Counter({(f, d): c for f, d, c in daily if c})),
+    ):
+        for key in sorted(set(want) | set(got)):
+            if want[key] != got[key]:
+                mismatches.append(f"form {key[0]} {label} {key[1]}: submission_count {got[key]} != {want[key]}")
+
+    # HyperLogLog registers are deterministic, so they must match exactly
+    form_sketches = session.query(FormRespondentSketch)
+    tenant_sketches = session.query(TenantRespondentSketch)
+    if form_id is not None:
+        form_sketches = form_sketches.filter(FormRespondentSketch.form_id == form_id)
+        tenant_sketches = tenant_sketches.filter(False)
+    stored_forms = {(row.form_id, row.bucket_date): row.registers for row in form_sketches}
+    stored_tenants = {(row.tenant_id, row.bucket_date): row.registers for row in tenant_sketches}
+    expected_forms = {key: sketch.to_list() for key, (_, sketch) in expected.form_respondents.items()}
+    expected_tenants = {} if form_id is not None else {
+        key: sketch.to_list() for key, sketch in expected.tenant_respondents.items()
+    }
+    for label, want, got in (('form', expected_forms, stored_forms), ('tenant', expected_tenants, stored_tenants)):
+        for key in sorted(set(want) | set(got)):
+            if want.get(key) != got.get(key):
+                mismatches.append(f"{label} {key[0]} on {key[1]}: respondent sketch differs")
+    return mismatches
+
+
+def reconcile_submission_counters(session: Session, form_id: Optional[int] = None) -> Dict[int, Tuple[int, int]]:
+    """Repair forms whose submission counters drifted from their submissions
+
+    Returns {form id: (stored count, actual count)} of the repaired forms.
+    Only submissions are counted, so this is much cheaper than a rebuild.
+    The counter table is locked first: writers that already incremented a
+    shard have committed and are counted, later ones increment the repaired
+    rows. A repaired form's shards collapse into shard 0.
+    """
+    session.execute(text("LOCK TABLE form_submission_counters IN EXCLUSIVE MODE"))
+    actual = session.query(Submission.form_id, func.count(Submission.id)).filter(Submission.form_id.isnot(None))
+    if form_id is not None:
+        actual = actual.filter(Submission.form_id == form_id)
+    actual_counts = dict(actual.group_by(Submission.form_id).all())
+    stored_counts = load_submission_counts(session, None if form_id is None else [form_id])
+
+    drifted = {
+        row_form_id: (stored_counts.get(row_form_id, 0), actual_counts.get(row_form_id, 0))
+        for row_form_id in sorted(set(actual_counts) | set(stored_counts))
+        if stored_counts.get(row_form_id, 0) != actual_counts.get(row_form_id, 0)
+    }
+    if drifted:
+        session.execute(delete(FormSubmissionCounter).where(FormSubmissionCounter.form_id.in_(list(drifted))))
+        rows = [
+            {'form_id': row_form_id, 'shard': 0, 'submission_count': count}
+            for row_form_id, (_, count) in drifted.items() if count
+        ]
+        if rows:
+            session.execute(insert(FormSubmissionCounter), rows)
+        logger.warning(f"Repaired submission counters of {len(drifted)} forms")
+    return drifted
+
+
+def load_submission_counts(session: Session, form_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Total submissions per form from the sharded counters, in one query (all forms if form_ids is None)
+
+    Forms without submissions are missing from the result.
+    """
+    counts = session.query(FormSubmissionCounter.form_id, func.sum(FormSubmissionCounter.submission_count))
+    if form_ids is not None:
+        form_ids = list(form_ids)
+        if not form_ids:
+            return {}
+        counts = counts.filter(FormSubmissionCounter.form_id.in_(form_ids))
+    return {
+        row_form_id: int(count)
+        for row_form_id, count in counts.group_by(FormSubmissionCounter.form_id)
+        if count
+    }
+
+
+def load_form_aggregates(session: Session, form_id: int) -> Dict[str, Any]:
+    """Stored aggregates of one form, read in three indexed queries"""
+    versions = {
+        row.form_version_id: row.submission_count
+        for row in session.query(FormVersionStats).filter(FormVersionStats.form_id == form_id)
+    }
+    questions = {
+        row.question_id: {
+            'response_count': row.response_count,
+            'numeric_count': row.numeric_count,
+            'numeric_sum': row.numeric_sum,
+            'numeric_sumsq': row.numeric_sumsq,
+            'numeric_min': row.numeric_min,
+            'numeric_max': row.numeric_max,
+        }
+        for row in session.query(QuestionStats).filter(QuestionStats.form_id == form_id)
+    }
+    options: Dict[int, Dict[str, int]] = {}
+    if questions:
+        for question_id, value, count in session.query(
+            QuestionOptionStats.question_id, QuestionOptionStats.value, QuestionOptionStats.selection_count
+        ).filter(QuestionOptionStats.question_id.in_(list(questions))):
+            options.setdefault(question_id, {})[value] = count
+    return {'versions': versions, 'questions': questions, 'options': options}
+
+
+def load_question_sketches(session: Session, question_ids: Iterable[int], since: Optional[date] = None,
+                           until: Optional[date] = None) -> Dict[int, KLLSketch]:
+    """Day sketches of the given questions merged per question, optionally for a date range"""
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+    rows = session.query(QuestionSketch.question_id, QuestionSketch.sketch).filter(
+        QuestionSketch.question_id.in_(question_ids)
+    )
+    if since is not None:
+        rows = rows.filter(QuestionSketch.bucket_date >= since)
+    if until is not None:
+        rows = rows.filter(QuestionSketch.bucket_date <= until)
+    sketches: Dict[int, KLLSketch] = {}
+    for question_id, data in rows:
+        sketch = KLLSketch.from_json(data)
+        if question_id in sketches:
+            sketches[question_id].merge(sketch)
+        else:
+            sketches[question_id] = sketch
+    return sketches
+
+
+# Top terms per question straight from the (question_id, term_count DESC, term) index
+_TOP_TERMS_SQL = text("""
+    SELECT q.question_id, t.term, t.term_count
+    FROM unnest(CAST(:question_ids AS integer[])) AS q(question_id)
+    CROSS JOIN LATERAL (
+        SELECT term, term_count
+        FROM question_terms
+        WHERE question_id = q.question_id AND term <> ALL(:stop_words)
+        ORDER BY term_count DESC, term
+        LIMIT :top_n
+    ) t
+    ORDER BY q.question_id, t.term_count DESC, t.term
+""")
+
+
+def load_text_summaries(session: Session, question_ids: Iterable[int],
+                        top_n: int = DEFAULT_TOP_N) -> Dict[int, Dict[str, Any]]:
+    """Length statistics and most common words per text question from the text index, in two queries
+
+    Same format as analytics_engine.text_summaries. Reads O(questions * top_n)
+    index entries however many answers there are; stop words are skipped here.
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+
+    common_words: Dict[int, List[Dict[str, Any]]] = {}
+    for question_id, term, count in session.execute(
+        _TOP_TERMS_SQL, {'question_ids': question_ids, 'stop_words': sorted(stop_words()), 'top_n': top_n}
+    ):
+        common_words.setdefault(question_id, []).append({'word': term, 'count': count})
+
+    return {
+        row.question_id: {
+            'response_count': row.answer_count,
+            'avg_length': row.length_sum / row.answer_count,
+            'min_length': row.length_min,
+            'max_length': row.length_max,
+            'common_words': common_words.get(row.question_id, []),
+        }
+        for row in session.query(QuestionTextStats).filter(QuestionTextStats.question_id.in_(question_ids))
+        if row.answer_count
+    }
+
+
+def load_respondent_sketch(session: Session, tenant_id: Optional[int] = None,
+                           form_ids: Optional[Iterable[int]] = None, since: Optional[date] = None,
+                           until: Optional[date] = None) -> HyperLogLog:
+    """Distinct respondents of a tenant's forms, or of the given forms, merged over a date range
+
+    A whole tenant reads one row per day from tenant_respondent_sketches;
+    the register-wise max runs in the database, so one merged row comes back.
+    """
+    if form_ids is not None:
+        form_ids = list(form_ids)
+        if not form_ids:
+            return HyperLogLog()
+        table, scope = 'form_respondent_sketches', 's.form_id IN :scope_ids'
+        params: Dict[str, Any] = {'scope_ids': form_ids}
+    else:
+        table, scope = 'tenant_respondent_sketches', 's.tenant_id = :tenant_id'
+        params = {'tenant_id': tenant_id}
+    conditions = [scope]
+    if since is not None:
+        conditions.append('s.bucket_date >= :since')
+        params['since'] = since
+    if until is not None:
+        conditions.append('s.bucket_date <= :until')
+        params['until'] = until
+
+    query = text(f"""
+        SELECT array_agg(merged.register ORDER BY merged.i) FROM (
+            SELECT r.i, max(r.register) AS register
+            FROM {table} s CROSS JOIN LATERAL unnest(s.registers) WITH ORDINALITY AS r(register, i)
+            WHERE {' AND '.join(conditions)}
+            GROUP BY r.i
+        ) merged
+    """)
+    if form_ids is not None:
+        query = query.bindparams(bindparam('scope_ids', expanding=True))
+    registers = session.execute(query, params).scalar()
+    return HyperLogLog(registers) if registers else HyperLogLog()
+
+
+def load_submission_trend(session: Session, form_ids: Iterable[int], granularity: str = 'day',
+                          start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[Any, int]:
+    """Submissions of the given forms per UTC hour (datetime) or day (date) bucket in [start, end)
+
+    Buckets without submissions are omitted.
+    """
+    form_ids = list(form_ids)
+    if not form_ids:
+        return {}
+    if granularity == 'hour':
+        model, bucket = FormHourlySubmissions, FormHourlySubmissions.bucket_start
+        low, high = start, end
+    elif granularity == 'day':
+        model, bucket = FormDailySubmissions, FormDailySubmissions.bucket_date
+        low = start.astimezone(timezone.utc).date() if start else None
+        high = end.astimezone(timezone.utc).date() if end else None
+    else:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    rows = session.query(bucket, func.sum(model.submission_count)).filter(model.form_id.in_(form_ids))
+    if low is not None:
+        rows = rows.filter(bucket >= low)
+    if high is not None:
+        rows = rows.filter(bucket < high)
+    return {key: int(count) for key, count in rows.group_by(bucket).order_by(bucket) if count}
+
+
+def load_submission_heatmap(session: Session, form_ids: Iterable[int], start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, tz: str = 'UTC') -> List[List[int]]:
+    """Submissions by day of week (rows, Monday first) and hour of day (columns) in a time zone
+
+    Read from the hourly rollups; zones with a half-hour offset are binned
+    by the UTC hour they fall in.
+    """
+    counts = [[0] * 24 for _ in range(7)]
+    form_ids = list(form_ids)
+    if not form_ids:
+        return counts
+    local = func.timezone(tz, FormHourlySubmissions.bucket_start)
+    weekday = func.extract('isodow', local)
+    hour = func.extract('hour', local)
+    rows = session.query(weekday, hour, func.sum(FormHourlySubmissions.submission_count)).filter(
+        FormHourlySubmissions.form_id.in_(form_ids)
+    )
+    if start is not None:
+        rows = rows.filter(FormHourlySubmissions.bucket_start >= start)
+    if end is not None:
+        rows = rows.filter(FormHourlySubmissions.bucket_start < end)
+    for day, hour_of_day, count in rows.group_by(weekday, hour):
+        counts[int(day) - 1][int(hour_of_day)] = int(count)
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild, verify, reconcile or fold FormMind analytics aggregates")
+    parser.add_argument("command", choices=["rebuild", "verify", "reconcile", "fold"])
+    parser.add_argument("--form-id", type=int, help="limit to one form (default: all forms)")
+    args = parser.parse_args(argv)
+
+    if args.command in ("fold", "verify"):
+        folded = fold_all_pending()
+        if args.command == "fold":
+            print(f"Folded {folded} queued submissions")
+            return 0
+
+    with get_db_session() as session:
+        if args.command == "rebuild":
+            delta = rebuild_aggregates(session, args.form_id)
+            print(f"Rebuilt {len(delta.versions)} version, {len(delta.questions)} question "
+                  f"and {len(delta.options)} option aggregates")
+            return 0
+        if args.command == "reconcile":
+            drifted = reconcile_submission_counters(session, args.form_id)
+            for row_form_id, (stored, actual) in drifted.items():
+                print(f"form {row_form_id}: submission counter {stored} -> {actual}")
+            print(f"Repaired {len(drifted)} submission counters")
+            return 0
+        mismatches = verify_aggregates(session, args.form_id)
+    for line in mismatches:
+        print(line)
+    print(f"{len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
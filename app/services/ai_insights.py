@@ -0,0 +1,381 @@
+"""
+AI insights for text answers in FormMind-AI
+Keywords are ranked by TF-IDF and every answer gets a lexicon-based
+sentiment score. Answers are processed in batches: each batch is tokenized
+once into a sparse document-term matrix (NumPy coordinate arrays, one entry
+per distinct term of an answer) and both analyses are vectorized over it.
+
+Everything kept between batches is additive (term totals, document
+frequencies, sentiment counts), so a question's insights are extended with
+its new answers instead of being recomputed; results are cached per
+question and checked against a hash of the answer set. Keyword scores use
+corpus-level TF-IDF, total count x smoothed IDF, which stays exact under
+such updates.
+
+With INSIGHTS_LEXICON=nltk the NLTK opinion lexicon is added to the
+built-in word lists (python -m nltk.downloader opinion_lexicon). Stop words
+are the text analytics ones (see text_analytics.py). Corpora are loaded
+once per process.
+"""
+from typing import Dict, Any, List, Optional, Iterable, Hashable, Tuple
+import functools
+import hashlib
+import logging
+import os
+import re
+import numpy as np
+
+from .cache import LRUCache
+from .text_analytics import DEFAULT_TOP_N, MAX_TERM_LENGTH, MIN_TERM_LENGTH, stop_words, tokenize
+
+logger = logging.getLogger(__name__)
+
+# builtin, or nltk for the builtin lists plus NLTK's opinion lexicon
+LEXICON_SOURCE = os.getenv("INSIGHTS_LEXICON", "builtin").lower()
+INSIGHTS_BATCH_SIZE = int(os.getenv("INSIGHTS_BATCH_SIZE", "20000"))
+INSIGHTS_CACHE_SIZE = int(os.getenv("INSIGHTS_CACHE_SIZE", "256"))
+# Smaller batches are analyzed in place rather than shipped to worker processes
+PARALLEL_MIN_ANSWERS = 5000
+
+POSITIVE_WORDS = (
+    'amazing', 'awesome', 'best', 'brilliant', 'clean', 'comfortable', 'convenient', 'delighted',
+    'easy', 'efficient', 'enjoy', 'enjoyed', 'excellent', 'exceeded', 'exceptional', 'fantastic',
+    'fast', 'friendly', 'glad', 'good', 'great', 'happy', 'helpful', 'impressed', 'impressive',
+    'incredible', 'intuitive', 'love', 'loved', 'lovely', 'nice', 'outstanding', 'perfect',
+    'pleasant', 'pleased', 'polite', 'professional', 'quick', 'recommend', 'recommended',
+    'reliable', 'responsive', 'satisfied', 'simple', 'smooth', 'superb', 'thank', 'thanks',
+    'useful', 'valuable', 'wonderful'
+)
+NEGATIVE_WORDS = (
+    'angry', 'annoying', 'awful', 'bad', 'broken', 'buggy', 'bugs', 'complaint', 'complaints',
+    'complicated', 'confusing', 'damaged', 'difficult', 'disappointed', 'disappointing',
+    'disappointment', 'expensive', 'fail', 'failed', 'frustrated', 'frustrating', 'hard', 'hate',
+    'hated', 'horrible', 'poor', 'poorly', 'problem', 'problems', 'rude', 'slow', 'terrible',
+    'unhappy', 'unhelpful', 'unreliable', 'useless', 'waste', 'worse', 'worst', 'wrong',
+    'overpriced'
+)
+# A negation flips the polarity of the next NEGATION_SCOPE tokens
+NEGATIONS = (
+    'not', 'no', 'never', 'without', 'hardly', 'cannot', "don't", "doesn't", "didn't", "isn't",
+    "wasn't", "aren't", "weren't", "won't", "can't", "couldn't", "wouldn't", "shouldn't"
+)
+NEGATION_SCOPE = 2
+# Negated tokens become their own terms ("not_recommend"); they carry sentiment but are not keywords
+NEGATED_PREFIX = 'not_'
+_NEGATION_PATTERN = re.compile(r"\b(?:%s)\b" % '|'.join(re.escape(word) for word in NEGATIONS))
+_NEGATION_SET = frozenset(NEGATIONS)
+
+SENTIMENT_LABELS = ('positive', 'neutral', 'negative')
+
+# cache key -> TextInsights; callers pass e.g. a question id
+_insights_cache = LRUCache(maxsize=INSIGHTS_CACHE_SIZE, name="text_insights")
+
+
+@functools.lru_cache(maxsize=None)
+def lexicon() -> Dict[str, int]:
+    """Word polarities (+1 / -1), loaded once per process"""
+    polarity = {word: 1 for word in POSITIVE_WORDS}
+    polarity.update({word: -1 for word in NEGATIVE_WORDS})
+    if LEXICON_SOURCE == 'nltk':
+        try:
+            from nltk.corpus import opinion_lexicon
+            for word in opinion_lexicon.positive():
+                polarity.setdefault(word, 1)
+            for word in opinion_lexicon.negative():
+                polarity.setdefault(word, -1)
+        except (ImportError, LookupError, OSError) as e:
+            logger.warning(f"NLTK opinion lexicon unavailable, using the built-in lists: {e}")
+    elif LEXICON_SOURCE != 'builtin':
+        logger.warning(f"Unknown INSIGHTS_LEXICON={LEXICON_SOURCE!r}, using the built-in lists")
+    return polarity
+
+
+def term_polarity(term: str) -> int:
+    """Polarity of a vocabulary term, negated terms flipped"""
+    if term.startswith(NEGATED_PREFIX) and len(term) > len(NEGATED_PREFIX):
+        return -lexicon().get(term[len(NEGATED_PREFIX):], 0)
+    return lexicon().get(term, 0)
+
+
+def is_keyword_term(term: str) -> bool:
+    """Whether a vocabulary term may be reported as a keyword"""
+    return (MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH
+            and term not in stop_words() and term not in _NEGATION_SET
+            and not term.startswith(NEGATED_PREFIX))
+
+
+def answer_tokens(text: str) -> List[str]:
+    """Tokens of an answer with negated words marked ("not good" -> not, not_good)"""
+    tokens = tokenize(text)
+    # Most answers have no negation; the regex pass is far cheaper than the loop
+    if not _NEGATION_PATTERN.search(text.lower()):
+        return tokens
+    marked = []
+    scope = 0
+    for token in tokens:
+        if token in _NEGATION_SET:
+            marked.append(token)
+            scope = NEGATION_SCOPE
+        elif scope:
+            marked.append(NEGATED_PREFIX + token)
+            scope -= 1
+        else:
+            marked.append(token)
+    return marked
+
+
+def answer_set_hash(answers: Iterable[Any]) -> int:
+    """Order-independent hash of a multiset of answers
+
+    The sum of per-answer digests modulo 2**64, so the hash of a grown set
+    is the old hash plus the hash of the new answers.
+    """
+    total = 0
+    for answer in answers:
+        digest = hashlib.blake2b(repr(answer).encode('utf-8'), digest_size=8).digest()
+        total += int.from_bytes(digest, 'little')
+    return total & 0xFFFFFFFFFFFFFFFF
+
+
+def document_term_matrix(documents: List[List[str]], vocabulary: Dict[str, int]
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sparse document-term counts as coordinate arrays (rows, cols, counts)
+
+    New terms are appended to the vocabulary. Entries are sorted by row,
+    then column, with one entry per distinct term of a document.
+    """
+    lengths = np.fromiter((len(tokens) for tokens in documents), dtype=np.int64, count=len(documents))
+    term_ids = np.fromiter(
+        (vocabulary.setdefault(token, len(vocabulary)) for tokens in documents for token in tokens),
+        dtype=np.int64, count=int(lengths.sum())
+    )
+    rows = np.repeat(np.arange(len(documents), dtype=np.int64), lengths)
+    keys, counts = np.unique(rows * max(len(vocabulary), 1) + term_ids, return_counts=True)
+    return keys // max(len(vocabulary), 1), keys % max(len(vocabulary), 1), counts
+
+
+def sentiment_scores(rows: np.ndarray, cols: np.ndarray, counts: np.ndarray,
+                     polarity: np.ndarray, documents: int) -> np.ndarray:
+    """Score of each document, (positive - negative) / (positive + negative) over its sentiment words"""
+    signed = polarity[cols] * counts
+    positive = np.bincount(rows, weights=np.where(signed > 0, signed, 0), minlength=documents)
+    negative = np.bincount(rows, weights=np.where(signed < 0, -signed, 0), minlength=documents)
+    weight = positive + negative
+    return np.divide(positive - negative, weight, out=np.zeros(documents), where=weight > 0)
+
+
+class TextInsights:
+    """Keyword and sentiment state of a set of answers, extended batch by batch"""
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.term_counts = np.zeros(0, dtype=np.int64)
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.polarity = np.zeros(0, dtype=np.int8)
+        self.keyword_mask = np.zeros(0, dtype=bool)
+        self.documents = 0
+        self.sentiment = {label: 0 for label in SENTIMENT_LABELS}
+        self.score_sum = 0.0
+        # Hash and size of every answer passed to update(), blank ones included
+        self.fingerprint = 0
+        self.answers_seen = 0
+        # Highest answer id included, for callers that read new answers by id
+        self.last_answer_id = 0
+
+    def update(self, answers: Iterable[Any]) -> 'TextInsights':
+        """Add answers; blank and non-text values count towards the hash only"""
+        batch: List[List[str]] = []
+        for answer in answers:
+            self.fingerprint = (self.fingerprint + answer_set_hash((answer,))) & 0xFFFFFFFFFFFFFFFF
+            self.answers_seen += 1
+            if not isinstance(answer, str) or not answer.strip():
+                continue
+            batch.append(answer_tokens(answer))
+            if len(batch) >= INSIGHTS_BATCH_SIZE:
+                self._add_batch(batch)
+                batch = []
+        if batch:
+            self._add_batch(batch)
+        return self
+
+    def merge(self, other: 'TextInsights') -> 'TextInsights':
+        """Add the answers summarized by another state (e.g. a chunk analyzed in a worker process)"""
+        known = len(self.vocabulary)
+        term_ids = np.fromiter(
+            (self.vocabulary.setdefault(term, len(self.vocabulary)) for term in other.terms),
+            dtype=np.int64, count=len(other.terms)
+        )
+        self._grow(known)
+        self.term_counts[term_ids] += other.term_counts
+        self.doc_freq[term_ids] += other.doc_freq
+        self.documents += other.documents
+        for label, count in other.sentiment.items():
+            self.sentiment[label] += count
+        self.score_sum += other.score_sum
+        self.fingerprint = (self.fingerprint + other.fingerprint) & 0xFFFFFFFFFFFFFFFF
+        self.answers_seen += other.answers_seen
+        self.last_answer_id = max(self.last_answer_id, other.last_answer_id)
+        return self
+
+    def _add_batch(self, documents: List[List[str]]) -> None:
+        known = len(self.vocabulary)
+        rows, cols, counts = document_term_matrix(documents, self.vocabulary)
+        self._grow(known)
+
+        vocabulary_size = len(self.vocabulary)
+        self.term_counts += np.bincount(cols, weights=counts, minlength=vocabulary_size).astype(np.int64)
+        self.doc_freq += np.bincount(cols, minlength=vocabulary_size)
+
+        scores = sentiment_scores(rows, cols, counts, self.polarity, len(documents))
+
+        self.documents += len(documents)
+        self.score_sum += float(scores.sum())
+        self.sentiment['positive'] += int(np.count_nonzero(scores > 0))
+        self.sentiment['negative'] += int(np.count_nonzero(scores < 0))
+        self.sentiment['neutral'] += int(np.count_nonzero(scores == 0))
+
+    def _grow(self, known: int) -> None:
+        """Extend the per-term arrays to terms added to the vocabulary since `known`"""
+        added = len(self.vocabulary) - known
+        if not added:
+            return
+        new_terms = list(self.vocabulary)[known:]
+        self.terms.extend(new_terms)
+        self.term_counts = np.concatenate([self.term_counts, np.zeros(added, dtype=np.int64)])
+        self.doc_freq = np.concatenate([self.doc_freq, np.zeros(added, dtype=np.int64)])
+        self.polarity = np.concatenate([
+            self.polarity, np.fromiter((term_polarity(term) for term in new_terms), dtype=np.int8, count=added)
+        ])
+        self.keyword_mask = np.concatenate([
+            self.keyword_mask, np.fromiter((is_keyword_term(term) for term in new_terms), dtype=bool, count=added)
+        ])
+
+    def keywords(self, top_n: int = DEFAULT_TOP_N) -> List[Dict[str, Any]]:
+        """Top terms by TF-IDF (total count x smoothed IDF), ties by count then term"""
+        candidates = np.flatnonzero(self.keyword_mask & (self.term_counts > 0))
+        if not len(candidates) or top_n <= 0:
+            return []
+        idf = np.log((1 + self.documents) / (1 + self.doc_freq[candidates])) + 1
+        scores = self.term_counts[candidates] * idf
+        # Partition down to the top scores before the (Python) tie-breaking sort
+        if len(candidates) > top_n:
+            cutoff = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+            keep = scores >= cutoff - 1e-9
+            candidates, scores = candidates[keep], scores[keep]
+        ranked = sorted(
+            zip(candidates.tolist(), scores.tolist()),
+            key=lambda item: (-round(item[1], 9), -int(self.term_counts[item[0]]), self.terms[item[0]])
+        )
+        return [
+            {
+                'word': self.terms[term_id],
+                'count': int(self.term_counts[term_id]),
+                'document_count': int(self.doc_freq[term_id]),
+                'score': round(score, 4)
+            }
+            for term_id, score in ranked[:top_n]
+        ]
+
+    def sentiment_summary(self) -> Dict[str, Any]:
+        """Answer counts and shares per sentiment label, and the mean score in [-1, 1]"""
+        return {
+            'counts': dict(self.sentiment),
+            'percentages': {
+                label: (count / self.documents) * 100 if self.documents else 0.0
+                for label, count in self.sentiment.items()
+            },
+            'average_score': self.score_sum / self.documents if self.documents else 0.0,
+            'overall': overall_sentiment(self.score_sum / self.documents if self.documents else 0.0)
+        }
+
+    def summary(self, top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+        return {
+            'response_count': self.documents,
+            'keywords': self.keywords(top_n),
+            'sentiment': self.sentiment_summary()
+        }
+
+
+def overall_sentiment(score: float, threshold: float = 0.05) -> str:
+    """Label for a mean sentiment score"""
+    if score > threshold:
+        return 'positive'
+    if score < -threshold:
+        return 'negative'
+    return 'neutral'
+
+
+def score_answers(answers: List[str]) -> List[float]:
+    """Sentiment score of each answer in [-1, 1] (0 for blank or neutral answers)"""
+    vocabulary: Dict[str, int] = {}
+    documents = [answer_tokens(answer) if isinstance(answer, str) else [] for answer in answers]
+    rows, cols, counts = document_term_matrix(documents, vocabulary)
+    polarity = np.fromiter((term_polarity(term) for term in vocabulary), dtype=np.int8, count=len(vocabulary))
+    return sentiment_scores(rows, cols, counts, polarity, len(documents)).tolist()
+
+
+def sentiment_label(score: float) -> str:
+    return 'positive' if score > 0 else 'negative' if score < 0 else 'neutral'
+
+
+def insights_chunk(answers: List[Any]) -> TextInsights:
+    """State of one chunk of answers, for merging (runs in analytics worker processes, see jobs.py)"""
+    return TextInsights().update(answers)
+
+
+def analyze_answers(answers: Iterable[Any], top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+    """Keywords and sentiment of answers, computed from scratch"""
+    return TextInsights().update(answers).summary(top_n)
+
+
+def get_insights(answers: List[Any], cache_key: Optional[Hashable] = None,
+                 top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+    """Insights of a list of answers, reusing the cached state for cache_key
+
+    When the cached state covers a prefix of `answers` (same size and hash),
+    only the answers after it are processed; any other change rebuilds it.
+    """
+    if cache_key is None:
+        return analyze_answers(answers, top_n)
+    state = get_cached_insights(cache_key)
+    if state is None or state.answers_seen > len(answers) \
+            or answer_set_hash(answers[:state.answers_seen]) != state.fingerprint:
+        state = TextInsights()
+    if state.answers_seen < len(answers):
+        state.update(answers[state.answers_seen:])
+        cache_insights(cache_key, state)
+    return state.summary(top_n)
+
+
+def copy_insights(state: TextInsights) -> TextInsights:
+    """Independent copy of an insights state (arrays and counters)"""
+    copied = TextInsights()
+    copied.vocabulary = dict(state.vocabulary)
+    copied.terms = list(state.terms)
+    copied.term_counts = state.term_counts.copy()
+    copied.doc_freq = state.doc_freq.copy()
+    copied.polarity = state.polarity.copy()
+    copied.keyword_mask = state.keyword_mask.copy()
+    copied.documents = state.documents
+    copied.sentiment = dict(state.sentiment)
+    copied.score_sum = state.score_sum
+    copied.fingerprint = state.fingerprint
+    copied.answers_seen = state.answers_seen
+    copied.last_answer_id = state.last_answer_id
+    return copied
+
+
+def get_cached_insights(cache_key: Hashable) -> Optional[TextInsights]:
+    """Copy of the cached state for a key, or None (cached states are never updated in place)"""
+    state = _insights_cache.get(cache_key)
+    return copy_insights(state) if state is not None else None
+
+
+def cache_insights(cache_key: Hashable, state: TextInsights) -> None:
+    _insights_cache.set(cache_key, state)
+
+
+def get_insights_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the insights cache"""
+    return _insights_cache.stats()
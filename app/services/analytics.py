@@ -2,28 +2,50 @@
 Analytics and reporting services for FormMind-AI
 Provides summary metrics, choice/numeric stats, and text processing analytics
 """
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Iterator, Tuple, Union
+from datetime import datetime, timedelta, timezone
 import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, desc
+from sqlalchemy import func, and_, desc, Text, cast
 from collections import Counter
-import json
+import os
 
-from ..models import Form, Submission, Answer, Question, QuestionOption
-from ..db import get_db_session
+from ..models import Form, FormVersion, Submission, Answer, Question, QuestionOption, QuestionTextStats
+from ..db import get_read_session, profiled
+from .aggregates import (
+    load_form_aggregates, load_question_sketches, load_respondent_sketch, load_submission_counts,
+    load_text_summaries, load_submission_trend, load_submission_heatmap, parse_selections
+)
+from .filters import FilterSpec
+from . import ai_insights, analytics_engine, exports, jobs, numeric_analytics, snapshots, tenant_dashboard, text_analytics
+from .snapshots import refresh_form_snapshots
 
 logger = logging.getLogger(__name__)
 
+# Numeric questions with more answers than this report sketched medians and histograms
+EXACT_QUANTILE_LIMIT = int(os.getenv("EXACT_QUANTILE_LIMIT", "10000"))
+
+# Serve numeric question statistics from local memory-mapped snapshots (services/snapshots.py)
+ANALYTICS_SNAPSHOTS = os.getenv("ANALYTICS_SNAPSHOTS", "false").lower() in ("1", "true", "yes")
+
 
 class AnalyticsService:
     """Service class for analytics and reporting operations"""
     
     @staticmethod
-    def get_form_summary_stats(form_id: int, user_id: int, user_role: str) -> Optional[Dict[str, Any]]:
-        """Get high-level summary statistics for a form"""
+    @profiled()
+    def get_form_summary_stats(form_id: int, user_id: int, user_role: str,
+                               filters: Optional[FilterSpec] = None) -> Optional[Dict[str, Any]]:
+        """Get high-level summary statistics for a form
+        
+        Unfiltered, counts come from the submission counters, stored rollups
+        and respondent sketches, so unique_respondents is an estimate
+        (unique_respondents_approximate is True). With an active FilterSpec
+        they are counted over the matching submissions in the database, and
+        unique respondents are exact.
+        """
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 # Check form access
                 form = session.query(Form).filter(Form.id == form_id).first()
                 if not form:
@@ -33,24 +55,21 @@ class AnalyticsService:
                 if user_role == "EDITOR" and form.created_by != user_id:
                     return None
                 
-                # Get submission count
-                total_submissions = session.query(Submission).filter(
-                    Submission.form_id == form_id
-                ).count()
-                
-                # Get submission count by date (last 30 days)
-                thirty_days_ago = datetime.now() - timedelta(days=30)
-                recent_submissions = session.query(
-                    func.date(Submission.submitted_at).label('date'),
-                    func.count(Submission.id).label('count')
-                ).filter(
-                    and_(
-                        Submission.form_id == form_id,
-                        Submission.submitted_at >= thirty_days_ago
-                    )
-                ).group_by(
-                    func.date(Submission.submitted_at)
-                ).order_by('date').all()
+                thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
+                if filters is not None and filters.active:
+                    total_submissions, recent_submissions, unique_respondents = \
+                        AnalyticsService._filtered_submission_stats(session, form_id, filters, thirty_days_ago)
+                    respondents_approximate = False
+                else:
+                    # Get submission count from the sharded submission counters
+                    total_submissions = load_submission_counts(session, [form_id]).get(form_id, 0)
+                    
+                    # Get submission count by date (last 30 days) from the daily rollups
+                    recent_submissions = load_submission_trend(session, [form_id], 'day', start=thirty_days_ago)
+                    
+                    # Distinct users / guest tokens from the per-day HyperLogLog sketches (about 1.6% error)
+                    unique_respondents = load_respondent_sketch(session, form_ids=[form_id]).count()
+                    respondents_approximate = True
                 
                 # Get completion rate (submissions vs. partial submissions)
                 # For now, we'll consider all submissions as complete
@@ -66,11 +85,13 @@ class AnalyticsService:
                     'form_id': form_id,
                     'form_title': form.title,
                     'total_submissions': total_submissions,
+                    'unique_respondents': unique_respondents,
+                    'unique_respondents_approximate': respondents_approximate,
                     'completion_rate': completion_rate,
                     'avg_completion_time': avg_completion_time,
                     'submissions_by_date': [
-                        {'date': str(row.date), 'count': row.count}
-                        for row in recent_submissions
+                        {'date': str(day), 'count': count}
+                        for day, count in recent_submissions.items()
                     ],
                     'top_referrers': top_referrers,
                     'form_status': form.status,
@@ -82,49 +103,226 @@ class AnalyticsService:
             return None
     
     @staticmethod
-    def get_question_analytics(form_id: int, user_id: int, user_role: str) -> List[Dict[str, Any]]:
-        """Get detailed analytics for each question in a form"""
+    @profiled()
+    def get_filter_options(form_id: int, user_id: int, user_role: str) -> Optional[Dict[str, Any]]:
+        """Form versions with submissions and their questions, to build a FilterSpec from
+        
+        Questions are listed once per lineage, as labelled in the newest
+        version; a predicate on one covers its copies in the other versions.
+        """
+        try:
+            with get_read_session(user_id) as session:
+                form = session.query(Form).filter(Form.id == form_id).first()
+                if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                    return None
+                
+                rows = session.query(
+                    FormVersion.version_number, Question.id, Question.lineage_key, Question.label, Question.field_type
+                ).join(Question, Question.form_version_id == FormVersion.id).filter(
+                    FormVersion.form_id == form_id,
+                    FormVersion.id.in_(session.query(Submission.form_version_id).filter(Submission.form_id == form_id))
+                ).order_by(desc(FormVersion.version_number), Question.order_index, Question.id).all()
+                
+                versions = []
+                questions = []
+                seen = set()
+                for version_number, question_id, lineage_key, label, field_type in rows:
+                    if version_number not in versions:
+                        versions.append(version_number)
+                    if (lineage_key or question_id) not in seen:
+                        seen.add(lineage_key or question_id)
+                        questions.append({'id': question_id, 'label': label, 'field_type': field_type})
+                return {'versions': sorted(versions), 'questions': questions}
+                
+        except Exception as e:
+            logger.error(f"Error getting filter options for form {form_id}: {e}")
+            return None
+    
+    @staticmethod
+    def _filtered_submission_stats(session: Session, form_id: int, filters: FilterSpec,
+                                   since: datetime) -> Tuple[int, Dict[Any, int], int]:
+        """Matching submissions, those per UTC day since `since`, and distinct respondents, in two queries"""
+        conditions = filters.conditions(form_id)
+        # Respondents as in sketches.respondent_key; anonymous submissions have none
+        respondent = func.coalesce(
+            'user:' + cast(Submission.user_id, Text), 'guest:' + func.nullif(Submission.guest_token, '')
+        )
+        total, respondents = session.query(
+            func.count(Submission.id), func.count(func.distinct(respondent))
+        ).filter(*conditions).one()
+        day = func.date(func.timezone('UTC', Submission.submitted_at))
+        by_day = session.query(day, func.count(Submission.id)).filter(
+            *conditions, Submission.submitted_at >= since
+        ).group_by(day).order_by(day)
+        return total, {bucket: count for bucket, count in by_day}, respondents
+    
+    @staticmethod
+    @profiled()
+    def get_submission_trend(form_id: int, user_id: int, user_role: str, granularity: str = 'day',
+                             days: int = 365) -> List[Dict[str, Any]]:
+        """Submissions per UTC day or hour over the last `days` days, zero-filled, from the rollups"""
+        try:
+            with get_read_session(user_id) as session:
+                form = session.query(Form).filter(Form.id == form_id).first()
+                if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                    return []
+                
+                now = datetime.now(timezone.utc)
+                if granularity == 'hour':
+                    step = timedelta(hours=1)
+                    bucket = now.replace(minute=0, second=0, microsecond=0) - timedelta(days=days) + step
+                else:
+                    step = timedelta(days=1)
+                    bucket = now.date() - timedelta(days=days - 1)
+                counts = load_submission_trend(session, [form_id], granularity, start=now - timedelta(days=days))
+                
+                trend = []
+                last = now if granularity == 'hour' else now.date()
+                while bucket <= last:
+                    trend.append({'bucket': bucket.isoformat(), 'count': counts.get(bucket, 0)})
+                    bucket += step
+                return trend
+                
+        except Exception as e:
+            logger.error(f"Error getting submission trend for form {form_id}: {e}")
+            return []
+    
+    @staticmethod
+    @profiled()
+    def get_submission_heatmap(form_id: int, user_id: int, user_role: str, days: Optional[int] = None,
+                               tz: str = 'UTC') -> Optional[Dict[str, Any]]:
+        """Submissions by day of week and hour of day (in `tz`), from the hourly rollups"""
+        try:
+            with get_read_session(user_id) as session:
+                form = session.query(Form).filter(Form.id == form_id).first()
+                if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                    return None
+                
+                start = datetime.now(timezone.utc) - timedelta(days=days) if days else None
+                return {
+                    'days': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+                    'hours': list(range(24)),
+                    'counts': load_submission_heatmap(session, [form_id], start=start, tz=tz),
+                    'timezone': tz
+                }
+                
+        except Exception as e:
+            logger.error(f"Error getting submission heatmap for form {form_id}: {e}")
+            return None
+    
+    @staticmethod
+    @profiled()
+    def get_question_analytics(form_id: int, user_id: int, user_role: str,
+                               filters: Optional[FilterSpec] = None,
+                               bins: Union[str, int] = numeric_analytics.FIXED) -> List[Dict[str, Any]]:
+        """Get detailed analytics for each question in a form
+        
+        Counts, choice distributions and text statistics come from the
+        incrementally maintained aggregates (see services/aggregates.py and
+        services/text_analytics.py); numeric statistics are computed in the
+        database (see services/analytics_engine.py), so the number of queries
+        does not grow with questions or responses. Numeric
+        questions above EXACT_QUANTILE_LIMIT answers use the stored quantile
+        sketches (see services/sketches.py) and are not scanned at all.
+        
+        With an active FilterSpec every statistic is aggregated in the
+        database over the answers of matching submissions instead, covering
+        the questions of versions with matching submissions.
+        
+        bins sets the numeric histograms: a bin count or a strategy of
+        services/numeric_analytics.py ('fixed', 'sturges' or 'fd').
+        """
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 # Check form access
                 form = session.query(Form).filter(Form.id == form_id).first()
                 if not form or (user_role == "EDITOR" and form.created_by != user_id):
                     return []
                 
-                # Get all questions for the form
-                questions = session.query(Question).join(
-                    Submission, Question.form_version_id == Submission.form_version_id
-                ).filter(Submission.form_id == form_id).distinct().order_by(Question.order_index).all()
+                submissions = filters.submission_ids(form_id) if filters is not None and filters.active else None
+                if submissions is None:
+                    aggregates = load_form_aggregates(session, form_id)
+                else:
+                    aggregates = {'versions': dict(session.query(
+                        Submission.form_version_id, func.count(Submission.id)
+                    ).filter(*filters.conditions(form_id)).group_by(Submission.form_version_id).all())}
+                total_submissions = sum(aggregates['versions'].values())
+                if not aggregates['versions']:
+                    return []
+                
+                # Questions of every version that has submissions
+                questions = session.query(Question).filter(
+                    Question.form_version_id.in_(list(aggregates['versions']))
+                ).order_by(Question.order_index, Question.id).all()
+                question_ids = [question.id for question in questions]
+                if submissions is not None:
+                    aggregates.update(AnalyticsService._filtered_question_aggregates(session, questions, submissions))
+                
+                options_by_question: Dict[int, List[QuestionOption]] = {}
+                choice_ids = [q.id for q in questions if q.field_type in ['radio', 'dropdown', 'checkbox']]
+                if choice_ids:
+                    for option in session.query(QuestionOption).filter(
+                        QuestionOption.question_id.in_(choice_ids)
+                    ).order_by(QuestionOption.question_id, QuestionOption.order_index):
+                        options_by_question.setdefault(option.question_id, []).append(option)
+                
+                # Numeric and text statistics are aggregated in the database, or
+                # read from the local columnar snapshots when those are enabled
+                numeric_ids = [q.id for q in questions if q.field_type == 'number']
+                numeric = {}
+                if ANALYTICS_SNAPSHOTS and numeric_ids and submissions is None:
+                    numeric.update(AnalyticsService._snapshot_numeric_summaries(
+                        session, form_id, list(aggregates['versions']), numeric_ids, bins
+                    ))
+                # Large numeric questions use the quantile sketches instead of a scan
+                large_ids = [
+                    question_id for question_id in numeric_ids
+                    if question_id not in numeric
+                    and aggregates['questions'].get(question_id, {}).get('numeric_count', 0) > EXACT_QUANTILE_LIMIT
+                ]
+                for question_id, sketch in load_question_sketches(session, large_ids).items():
+                    stats = aggregates['questions'][question_id]
+                    # Sketches missing days (e.g. before a rebuild) fall back to the exact path
+                    if sketch.n == stats['numeric_count']:
+                        numeric[question_id] = analytics_engine.sketch_numeric_summary(stats, sketch, bins)
+                numeric.update(analytics_engine.numeric_summaries(
+                    session, [question_id for question_id in numeric_ids if question_id not in numeric],
+                    bins=bins, submissions=submissions
+                ))
+                # Text statistics come from the incrementally maintained term index
+                text_ids = [q.id for q in questions if q.field_type in text_analytics.TEXT_FIELD_TYPES]
+                if submissions is None:
+                    texts = load_text_summaries(session, text_ids)
+                else:
+                    texts = analytics_engine.text_summaries(
+                        session, text_ids, text_analytics.DEFAULT_TOP_N, submissions=submissions
+                    )
                 
                 question_analytics = []
                 
                 for question in questions:
-                    # Get all answers for this question
-                    answers = session.query(Answer).filter(
-                        Answer.question_id == question.id
-                    ).all()
-                    
-                    total_responses = len(answers)
+                    stats = aggregates['questions'].get(question.id, {})
+                    total_responses = stats.get('response_count', 0)
                     
                     analytics = {
                         'question_id': question.id,
                         'question_label': question.label,
                         'question_type': question.field_type,
                         'total_responses': total_responses,
-                        'response_rate': (total_responses / session.query(Submission).filter(
-                            Submission.form_id == form_id
-                        ).count()) * 100 if total_responses > 0 else 0.0
+                        'response_rate': (total_responses / total_submissions) * 100 if total_responses > 0 else 0.0
                     }
                     
                     # Type-specific analytics
+                    options = options_by_question.get(question.id, [])
+                    selections = aggregates['options'].get(question.id, {})
                     if question.field_type in ['radio', 'dropdown']:
-                        analytics.update(AnalyticsService._analyze_choice_question(question, answers, session))
+                        analytics.update(AnalyticsService._analyze_choice_question(options, selections, total_responses))
                     elif question.field_type == 'checkbox':
-                        analytics.update(AnalyticsService._analyze_checkbox_question(question, answers, session))
+                        analytics.update(AnalyticsService._analyze_checkbox_question(options, selections, total_responses))
                     elif question.field_type == 'number':
-                        analytics.update(AnalyticsService._analyze_numeric_question(answers))
+                        analytics.update(AnalyticsService._summarize_numeric_question(numeric.get(question.id)))
                     elif question.field_type in ['short_text', 'long_text', 'email']:
-                        analytics.update(AnalyticsService._analyze_text_question(answers))
+                        analytics.update(AnalyticsService._summarize_text_question(texts.get(question.id)))
                     
                     question_analytics.append(analytics)
                 
@@ -135,20 +333,210 @@ class AnalyticsService:
             return []
     
     @staticmethod
-    def _analyze_choice_question(question: Question, answers: List[Answer], session: Session) -> Dict[str, Any]:
-        """Analyze single-choice questions (radio, dropdown)"""
-        # Count responses by value
-        value_counts = Counter([answer.value for answer in answers])
+    def _filtered_question_aggregates(session: Session, questions: List[Question], submissions) -> Dict[str, Any]:
+        """Response counts and option selections of the answers of a SELECT of submission ids
+
+        In the format of aggregates.load_form_aggregates; numeric_count is
+        left out, so numeric questions are always summarized exactly.
+        """
+        counts = analytics_engine.response_counts(session, [q.id for q in questions], submissions)
+        field_types = {q.id: q.field_type for q in questions if q.field_type in ['radio', 'dropdown', 'checkbox']}
+        options: Dict[int, Dict[str, int]] = {}
+        for question_id, values in analytics_engine.choice_counts(session, list(field_types), submissions).items():
+            selections = options[question_id] = Counter()
+            for value, count in values.items():
+                for selection in parse_selections(field_types[question_id], value):
+                    selections[selection] += count
+        return {
+            'questions': {question_id: {'response_count': count} for question_id, count in counts.items()},
+            'options': options,
+        }
+    
+    @staticmethod
+    @profiled()
+    def get_lineage_analytics(form_id: int, user_id: int, user_role: str) -> List[Dict[str, Any]]:
+        """Question analytics combined across all versions of a form
+        
+        A question and its copies in later versions share a lineage_key, so
+        each entry covers one question over the form's history, labelled as in
+        the latest version that has it. Counts and choice selections add up the
+        stored per-question aggregates; numeric and text statistics are grouped
+        by the indexed answers.lineage_key in the database.
+        """
+        try:
+            with get_read_session(user_id) as session:
+                form = session.query(Form).filter(Form.id == form_id).first()
+                if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                    return []
+                
+                aggregates = load_form_aggregates(session, form_id)
+                if not aggregates['versions']:
+                    return []
+                
+                questions = session.query(Question).filter(
+                    Question.form_version_id.in_(list(aggregates['versions']))
+                ).order_by(Question.form_version_id, Question.id).all()
+                
+                # Later versions come last, so each lineage ends up described by its latest question
+                members: Dict[int, List[Question]] = {}
+                for question in questions:
+                    members.setdefault(question.lineage_key or question.id, []).append(question)
+                latest = {key: group[-1] for key, group in members.items()}
+                
+                choice_ids = [q.id for q in latest.values() if q.field_type in ['radio', 'dropdown', 'checkbox']]
+                options_by_question: Dict[int, List[QuestionOption]] = {}
+                if choice_ids:
+                    for option in session.query(QuestionOption).filter(
+                        QuestionOption.question_id.in_(choice_ids)
+                    ).order_by(QuestionOption.question_id, QuestionOption.order_index):
+                        options_by_question.setdefault(option.question_id, []).append(option)
+                
+                numeric = analytics_engine.numeric_summaries(
+                    session, [key for key, q in latest.items() if q.field_type == 'number'], by='lineage_key'
+                )
+                texts = analytics_engine.text_summaries(
+                    session, [key for key, q in latest.items() if q.field_type in ['short_text', 'long_text', 'email']],
+                    by='lineage_key'
+                )
+                
+                lineage_analytics = []
+                for key, question in sorted(latest.items(), key=lambda item: (item[1].order_index, item[1].id)):
+                    group = members[key]
+                    total_responses = sum(
+                        aggregates['questions'].get(q.id, {}).get('response_count', 0) for q in group
+                    )
+                    # Only submissions to versions that asked the question count towards its rate
+                    total_submissions = sum(aggregates['versions'][q.form_version_id] for q in group)
+                    selections = Counter()
+                    for q in group:
+                        selections.update(aggregates['options'].get(q.id, {}))
+                    
+                    analytics = {
+                        'lineage_key': key,
+                        'question_id': question.id,
+                        'question_ids': [q.id for q in group],
+                        'question_label': question.label,
+                        'question_type': question.field_type,
+                        'total_responses': total_responses,
+                        'response_rate': (total_responses / total_submissions) * 100 if total_responses > 0 else 0.0
+                    }
+                    
+                    options = options_by_question.get(question.id, [])
+                    if question.field_type in ['radio', 'dropdown']:
+                        analytics.update(AnalyticsService._analyze_choice_question(options, selections, total_responses))
+                    elif question.field_type == 'checkbox':
+                        analytics.update(AnalyticsService._analyze_checkbox_question(options, selections, total_responses))
+                    elif question.field_type == 'number':
+                        analytics.update(AnalyticsService._summarize_numeric_question(numeric.get(key)))
+                    elif question.field_type in ['short_text', 'long_text', 'email']:
+                        analytics.update(AnalyticsService._summarize_text_question(texts.get(key)))
+                    
+                    lineage_analytics.append(analytics)
+                
+                return lineage_analytics
+                
+        except Exception as e:
+            logger.error(f"Error getting lineage analytics for form {form_id}: {e}")
+            return []
+    
+    @staticmethod
+    @profiled()
+    def get_text_insights(form_id: int, question_id: int, user_id: int, user_role: str,
+                          top_n: int = text_analytics.DEFAULT_TOP_N) -> Optional[Dict[str, Any]]:
+        """Keywords and sentiment of a text question's answers (see services/ai_insights.py)
         
-        # Get all possible options
-        options = session.query(QuestionOption).filter(
-            QuestionOption.question_id == question.id
-        ).order_by(QuestionOption.order_index).all()
+        Runs on the calling thread; pages use start_text_insights instead.
+        """
+        try:
+            return AnalyticsService._load_text_insights(form_id, question_id, user_id, user_role, top_n)
+        except Exception as e:
+            logger.error(f"Error getting text insights for question {question_id} of form {form_id}: {e}")
+            return None
+    
+    @staticmethod
+    def start_text_insights(form_id: int, question_id: int, user_id: int, user_role: str,
+                            owner: Optional[str] = None, top_n: int = text_analytics.DEFAULT_TOP_N) -> Optional[str]:
+        """Compute get_text_insights as a background job (see services/jobs.py)
         
+        Returns the job id to poll with jobs.poll_job, or None when the job
+        queue is full. The owner (e.g. the browser session) can cancel it.
+        """
+        return jobs.submit_job(
+            lambda context: AnalyticsService._load_text_insights(
+                form_id, question_id, user_id, user_role, top_n, context
+            ),
+            key=('text_insights', question_id, user_id, user_role, top_n), owner=owner
+        )
+    
+    @staticmethod
+    @profiled("AnalyticsService.load_text_insights")
+    def _load_text_insights(form_id: int, question_id: int, user_id: int, user_role: str, top_n: int,
+                            context: Optional[jobs.JobContext] = None) -> Optional[Dict[str, Any]]:
+        """Insights of a question, extending its cached state with the answers added since
+        
+        New answers are read past the highest answer id the state already
+        includes. A cached state with fewer answers than the text index
+        counts (an answer committed after a later id was read) is rebuilt.
+        In a background job the answers are analyzed in the worker processes.
+        """
+        with get_read_session(user_id) as session:
+            form = session.query(Form).filter(Form.id == form_id).first()
+            if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                return None
+            
+            question = session.query(Question).join(FormVersion).filter(
+                Question.id == question_id, FormVersion.form_id == form_id
+            ).first()
+            if not question or question.field_type not in text_analytics.TEXT_FIELD_TYPES:
+                return None
+            
+            # Counted first: every answer it includes is visible to the reads below
+            expected = session.query(QuestionTextStats.answer_count).filter(
+                QuestionTextStats.question_id == question_id
+            ).scalar() or 0
+            state = ai_insights.get_cached_insights(question_id) or ai_insights.TextInsights()
+            for attempt in range(2):
+                rows = session.query(Answer.id, Answer.value).filter(
+                    Answer.question_id == question_id, Answer.id > state.last_answer_id
+                ).order_by(Answer.id).yield_per(ai_insights.INSIGHTS_BATCH_SIZE)
+                batch = []
+                last_answer_id = state.last_answer_id
+                for answer_id, value in rows:
+                    batch.append(value)
+                    last_answer_id = answer_id
+                    if len(batch) >= ai_insights.INSIGHTS_BATCH_SIZE:
+                        AnalyticsService._extend_insights(state, batch, context)
+                        batch = []
+                AnalyticsService._extend_insights(state, batch, context)
+                state.last_answer_id = last_answer_id
+                if state.documents >= expected:
+                    break
+                state = ai_insights.TextInsights()
+            
+            ai_insights.cache_insights(question_id, state)
+            return dict(state.summary(top_n), question_id=question_id, question_label=question.label)
+    
+    @staticmethod
+    def _extend_insights(state: ai_insights.TextInsights, answers: List[Optional[str]],
+                         context: Optional[jobs.JobContext] = None) -> None:
+        if context is None:
+            state.update(answers)
+            return
+        context.check()
+        if len(answers) < ai_insights.PARALLEL_MIN_ANSWERS:
+            state.update(answers)
+            return
+        for part in context.map(ai_insights.insights_chunk, answers):
+            state.merge(part)
+    
+    @staticmethod
+    def _analyze_choice_question(options: List[QuestionOption], value_counts: Dict[str, int],
+                                 total_responses: int) -> Dict[str, Any]:
+        """Analyze single-choice questions (radio, dropdown)"""
         choice_distribution = []
         for option in options:
             count = value_counts.get(option.value, 0)
-            percentage = (count / len(answers)) * 100 if answers else 0
+            percentage = (count / total_responses) * 100 if total_responses else 0
             choice_distribution.append({
                 'label': option.label,
                 'value': option.value,
@@ -166,28 +554,15 @@ class AnalyticsService:
         }
     
     @staticmethod
-    def _analyze_checkbox_question(question: Question, answers: List[Answer], session: Session) -> Dict[str, Any]:
+    def _analyze_checkbox_question(options: List[QuestionOption], selection_counts: Dict[str, int],
+                                   total_responses: int) -> Dict[str, Any]:
         """Analyze multiple-choice questions (checkbox)"""
-        # Parse JSON values and count individual selections
-        all_selections = []
-        for answer in answers:
-            try:
-                selections = json.loads(answer.value) if answer.value.startswith('[') else [answer.value]
-                all_selections.extend(selections)
-            except:
-                all_selections.append(answer.value)
-        
-        value_counts = Counter(all_selections)
-        
-        # Get all possible options
-        options = session.query(QuestionOption).filter(
-            QuestionOption.question_id == question.id
-        ).order_by(QuestionOption.order_index).all()
+        total_selections = sum(selection_counts.values())
         
         selection_distribution = []
         for option in options:
-            count = value_counts.get(option.value, 0)
-            percentage = (count / len(answers)) * 100 if answers else 0
+            count = selection_counts.get(option.value, 0)
+            percentage = (count / total_responses) * 100 if total_responses else 0
             selection_distribution.append({
                 'label': option.label,
                 'value': option.value,
@@ -196,297 +571,216 @@ class AnalyticsService:
             })
         
         # Calculate average selections per response
-        avg_selections = len(all_selections) / len(answers) if answers else 0
+        avg_selections = total_selections / total_responses if total_responses else 0
         
         return {
             'selection_distribution': selection_distribution,
             'avg_selections_per_response': round(avg_selections, 2),
-            'total_selections': len(all_selections)
+            'total_selections': total_selections
+        }
+    
+    @staticmethod
+    def _snapshot_numeric_summaries(session: Session, form_id: int, form_version_ids: List[int],
+                                    question_ids: List[int],
+                                    bins: Union[str, int] = numeric_analytics.FIXED) -> Dict[int, Dict[str, Any]]:
+        """Exact numeric summaries from memory-mapped snapshot columns; {} if snapshots fail"""
+        wanted = set(question_ids)
+        summaries = {}
+        try:
+            for snapshot in refresh_form_snapshots(session, form_id, form_version_ids).values():
+                for question_id, column in snapshot.columns.items():
+                    if question_id in wanted and column['kind'] == snapshots.NUMERIC:
+                        summary = analytics_engine.array_numeric_summary(snapshot.numeric(question_id), bins)
+                        if summary is not None:
+                            summaries[question_id] = summary
+        except Exception as e:
+            logger.warning(f"Analytics snapshots unavailable for form {form_id}, querying instead: {e}")
+            return {}
+        return summaries
+    
+    @staticmethod
+    def _summarize_numeric_question(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Numeric analytics from a database summary (see analytics_engine.numeric_summaries)"""
+        if not summary:
+            return AnalyticsService._analyze_numeric_question([])
+        
+        return {
+            'min_value': summary['min'],
+            'max_value': summary['max'],
+            'average': round(summary['avg'], 2),
+            'median': round(summary['median'], 2),
+            'q1': round(summary['q1'], 2),
+            'q3': round(summary['q3'], 2),
+            'iqr': round(summary['iqr'], 2),
+            'std_dev': round(summary['std_dev'], 2),
+            'valid_responses': summary['count'],
+            'distribution': summary['distribution']
         }
     
     @staticmethod
-    def _analyze_numeric_question(answers: List[Answer]) -> Dict[str, Any]:
+    def _summarize_text_question(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Text analytics from a database summary (see analytics_engine.text_summaries)"""
+        if not summary:
+            return AnalyticsService._analyze_text_question([])
+        
+        return {
+            'avg_length': round(summary['avg_length'], 2),
+            'min_length': summary['min_length'],
+            'max_length': summary['max_length'],
+            'common_words': summary['common_words'],
+            'response_count': summary['response_count']
+        }
+    
+    @staticmethod
+    def _analyze_numeric_question(values: List[str], bins: Union[str, int] = numeric_analytics.FIXED) -> Dict[str, Any]:
         """Analyze numeric questions"""
-        numeric_values = []
-        for answer in answers:
-            try:
-                numeric_values.append(float(answer.value))
-            except ValueError:
-                continue  # Skip invalid numeric values
+        summary = numeric_analytics.describe(values, bins)
         
-        if not numeric_values:
+        if summary is None:
             return {
                 'min_value': None,
                 'max_value': None,
                 'average': None,
                 'median': None,
+                'q1': None,
+                'q3': None,
+                'iqr': None,
                 'valid_responses': 0
             }
         
-        numeric_values.sort()
-        n = len(numeric_values)
-        
-        # Calculate median
-        if n % 2 == 0:
-            median = (numeric_values[n//2 - 1] + numeric_values[n//2]) / 2
-        else:
-            median = numeric_values[n//2]
-        
         return {
-            'min_value': min(numeric_values),
-            'max_value': max(numeric_values),
-            'average': round(sum(numeric_values) / n, 2),
-            'median': round(median, 2),
-            'valid_responses': n,
-            'distribution': AnalyticsService._create_numeric_distribution(numeric_values)
+            'min_value': summary['min'],
+            'max_value': summary['max'],
+            'average': round(summary['mean'], 2),
+            'median': round(summary['median'], 2),
+            'q1': round(summary['q1'], 2),
+            'q3': round(summary['q3'], 2),
+            'iqr': round(summary['iqr'], 2),
+            'std_dev': round(summary['std'], 2),
+            'valid_responses': summary['count'],
+            'distribution': summary['distribution']
         }
     
     @staticmethod
-    def _analyze_text_question(answers: List[Answer]) -> Dict[str, Any]:
-        """Analyze text-based questions"""
-        text_values = [answer.value for answer in answers if answer.value.strip()]
-        
-        if not text_values:
-            return {
-                'avg_length': 0,
-                'min_length': 0,
-                'max_length': 0,
-                'common_words': [],
-                'response_count': 0
-            }
-        
-        lengths = [len(text) for text in text_values]
-        
-        # Find common words (simple implementation)
-        all_words = []
-        for text in text_values:
-            words = text.lower().split()
-            # Filter out common stop words
-            stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should'}
-            filtered_words = [word.strip('.,!?;:"') for word in words if word.lower() not in stop_words and len(word) > 2]
-            all_words.extend(filtered_words)
-        
-        common_words = Counter(all_words).most_common(10)
-        
+    def _analyze_text_question(values: List[str]) -> Dict[str, Any]:
+        """Analyze text-based questions (tokenized as in services/text_analytics.py)"""
+        summary = text_analytics.summarize(values)
         return {
-            'avg_length': round(sum(lengths) / len(lengths), 2),
-            'min_length': min(lengths),
-            'max_length': max(lengths),
-            'common_words': [{'word': word, 'count': count} for word, count in common_words],
-            'response_count': len(text_values)
+            'avg_length': round(summary['avg_length'], 2),
+            'min_length': summary['min_length'],
+            'max_length': summary['max_length'],
+            'common_words': summary['common_words'],
+            'response_count': summary['response_count']
         }
     
     @staticmethod
-    def _create_numeric_distribution(values: List[float], bins: int = 5) -> List[Dict[str, Any]]:
-        """Create distribution bins for numeric data"""
-        if not values or len(values) < 2:
-            return []
-        
-        min_val, max_val = min(values), max(values)
-        if min_val == max_val:
-            return [{'range': f'{min_val}', 'count': len(values)}]
-        
-        bin_width = (max_val - min_val) / bins
-        distribution = []
-        
-        for i in range(bins):
-            bin_start = min_val + (i * bin_width)
-            bin_end = bin_start + bin_width
-            
-            # Count values in this bin
-            if i == bins - 1:  # Last bin includes max value
-                count = sum(1 for v in values if bin_start <= v <= bin_end)
-            else:
-                count = sum(1 for v in values if bin_start <= v < bin_end)
-            
-            distribution.append({
-                'range': f'{bin_start:.1f} - {bin_end:.1f}',
-                'count': count
-            })
+    def _create_numeric_distribution(values: List[float], bins: Union[str, int] = 5) -> List[Dict[str, Any]]:
+        """Create distribution bins for numeric data (count or strategy, see numeric_analytics)"""
+        return numeric_analytics.histogram(numeric_analytics.parse_numbers(values), bins)
+    
+    @staticmethod
+    @profiled()
+    def export_form_responses(form_id: int, user_id: int, user_role: str, format_type: str = 'csv',
+                              filters: Optional[FilterSpec] = None) -> Optional[str]:
+        """Export form responses in various formats (csv, json or ndjson) as one string
         
-        return distribution
+        Built from stream_form_responses; large forms should be streamed.
+        """
+        chunks = AnalyticsService.stream_form_responses(form_id, user_id, user_role, format_type, filters)
+        if chunks is None:
+            return None
+        try:
+            return ''.join(chunks)
+        except Exception as e:
+            logger.error(f"Error exporting form responses for {form_id}: {e}")
+            return None
     
     @staticmethod
-    def export_form_responses(form_id: int, user_id: int, user_role: str, format_type: str = 'csv') -> Optional[str]:
-        """Export form responses in various formats"""
+    @profiled()
+    def stream_form_responses(form_id: int, user_id: int, user_role: str, format_type: str = 'csv',
+                              filters: Optional[FilterSpec] = None) -> Optional[Iterator[str]]:
+        """Form responses as an iterator of export chunks (see services/exports.py)
+        
+        Access is checked before returning; the rows are then read through a
+        server-side cursor in a session held open while the iterator is
+        consumed. Returns None for no access or an unknown format, and an
+        empty iterator for a form without (matching) submissions.
+        """
+        format_type = format_type.lower()
+        if format_type not in exports.EXPORT_FORMATS:
+            return None
         try:
-            with get_db_session() as session:
-                # Check form access
+            with get_read_session(user_id) as session:
                 form = session.query(Form).filter(Form.id == form_id).first()
                 if not form or (user_role == "EDITOR" and form.created_by != user_id):
                     return None
-                
-                # Get submissions with answers
-                submissions = session.query(Submission).filter(
-                    Submission.form_id == form_id
-                ).order_by(desc(Submission.submitted_at)).all()
-                
-                if not submissions:
-                    return ""
-                
-                # Get questions for column headers
-                questions = session.query(Question).join(
-                    Submission, Question.form_version_id == Submission.form_version_id
-                ).filter(Submission.form_id == form_id).distinct().order_by(Question.order_index).all()
-                
-                if format_type.lower() == 'csv':
-                    return AnalyticsService._export_to_csv(submissions, questions, session)
-                elif format_type.lower() == 'json':
-                    return AnalyticsService._export_to_json(submissions, questions, session)
-                else:
-                    return None
-                
+                conditions = filters.conditions(form_id) if filters is not None else [Submission.form_id == form_id]
+                if session.query(Submission.id).filter(*conditions).first() is None:
+                    return iter(())
         except Exception as e:
             logger.error(f"Error exporting form responses for {form_id}: {e}")
             return None
-    
-    @staticmethod
-    def _export_to_csv(submissions: List[Submission], questions: List[Question], session: Session) -> str:
-        """Export submissions to CSV format"""
-        import csv
-        from io import StringIO
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        headers = ['Submission ID', 'Submitted At', 'Submitted By']
-        headers.extend([q.label for q in questions])
-        writer.writerow(headers)
-        
-        # Write data rows
-        for submission in submissions:
-            row = [
-                submission.id,
-                submission.submitted_at.strftime('%Y-%m-%d %H:%M:%S'),
-                submission.user_id or 'Anonymous'
-            ]
-            
-            # Get answers for this submission
-            answers = session.query(Answer).filter(
-                Answer.submission_id == submission.id
-            ).all()
-            answer_dict = {answer.question_id: answer.value for answer in answers}
-            
-            # Add answers in question order
-            for question in questions:
-                value = answer_dict.get(question.id, '')
-                # Handle checkbox values
-                if question.field_type == 'checkbox' and value.startswith('['):
-                    try:
-                        parsed_value = json.loads(value)
-                        value = ', '.join(parsed_value)
-                    except:
-                        pass
-                row.append(value)
-            
-            writer.writerow(row)
-        
-        return output.getvalue()
-    
+        return exports.stream_form_export(form_id, user_id, format_type, filters)
+
     @staticmethod
-    def _export_to_json(submissions: List[Submission], questions: List[Question], session: Session) -> str:
-        """Export submissions to JSON format"""
-        export_data = []
-        
-        for submission in submissions:
-            # Get answers for this submission
-            answers = session.query(Answer).filter(
-                Answer.submission_id == submission.id
-            ).all()
-            answer_dict = {answer.question_id: answer.value for answer in answers}
-            
-            submission_data = {
-                'submission_id': submission.id,
-                'submitted_at': submission.submitted_at.isoformat(),
-                'user_id': submission.user_id,
-                'answers': {}
-            }
-            
-            # Add answers with question labels
-            for question in questions:
-                value = answer_dict.get(question.id, None)
-                # Handle checkbox values
-                if value and question.field_type == 'checkbox' and value.startswith('['):
-                    try:
-                        value = json.loads(value)
-                    except:
-                        pass
-                submission_data['answers'][question.label] = value
-            
-            export_data.append(submission_data)
-        
-        return json.dumps(export_data, indent=2)
-    
+    @profiled()
+    def start_export(form_id: int, user_id: int, user_role: str, format_type: str = 'csv',
+                     owner: Optional[str] = None, filters: Optional[FilterSpec] = None) -> Optional[str]:
+        """Write form responses to a gzip spool file as a background job (see exports.spool_export)
+
+        Access is checked before queueing. Returns the job id, whose result
+        holds the spool's path, download filename and row count; or None for
+        no access, an unknown format or a full job queue. Exports of an
+        unchanged form reuse the spool already written.
+        """
+        format_type = format_type.lower()
+        if format_type not in exports.EXPORT_FORMATS:
+            return None
+        try:
+            with get_read_session(user_id) as session:
+                form = session.query(Form).filter(Form.id == form_id).first()
+                if not form or (user_role == "EDITOR" and form.created_by != user_id):
+                    return None
+        except Exception as e:
+            logger.error(f"Error starting export for form {form_id}: {e}")
+            return None
+        filter_key = filters.key() if filters is not None and filters.active else None
+        return jobs.submit_job(
+            lambda context: exports.spool_export(form_id, user_id, format_type, context, filters),
+            key=('export', form_id, format_type, filter_key), owner=owner
+        )
+
     @staticmethod
+    @profiled()
     def get_tenant_dashboard_stats(tenant_id: int, user_id: int, user_role: str) -> Dict[str, Any]:
-        """Get dashboard statistics for a tenant"""
+        """Get dashboard statistics for a tenant
+        
+        Aggregated in the database (see services/tenant_dashboard.py) and
+        cached per tenant for TENANT_DASHBOARD_CACHE_TTL seconds, so a hit does
+        no database work. unique_respondents_90d is estimated from the per-day
+        HyperLogLog sketches: one row per day for the whole tenant, or the
+        editor's forms.
+        """
+        # Editors only see their own forms
+        scope = user_id if user_role == "EDITOR" else None
+        stats = tenant_dashboard.get_cached_dashboard(tenant_id, scope)
+        if stats is not None:
+            return stats
         try:
-            with get_db_session() as session:
-                # Apply role-based filtering
-                forms_query = session.query(Form).filter(Form.tenant_id == tenant_id)
-                if user_role == "EDITOR":
-                    forms_query = forms_query.filter(Form.created_by == user_id)
-                
-                forms = forms_query.all()
-                form_ids = [f.id for f in forms]
-                
-                if not form_ids:
-                    return {
-                        'total_forms': 0,
-                        'total_submissions': 0,
-                        'active_forms': 0,
-                        'recent_activity': []
-                    }
-                
-                # Get statistics
-                total_forms = len(forms)
-                active_forms = sum(1 for f in forms if f.status == 'published')
-                
-                total_submissions = session.query(Submission).filter(
-                    Submission.form_id.in_(form_ids)
-                ).count()
-                
-                # Get recent activity (last 10 submissions)
-                recent_submissions = session.query(Submission).filter(
-                    Submission.form_id.in_(form_ids)
-                ).order_by(desc(Submission.submitted_at)).limit(10).all()
-                
-                recent_activity = []
-                for sub in recent_submissions:
-                    form = next((f for f in forms if f.id == sub.form_id), None)
-                    recent_activity.append({
-                        'form_title': form.title if form else 'Unknown Form',
-                        'submitted_at': sub.submitted_at,
-                        'submitter': 'Anonymous' if sub.user_id is None else 'Registered User'
-                    })
-                
-                return {
-                    'total_forms': total_forms,
-                    'total_submissions': total_submissions,
-                    'active_forms': active_forms,
-                    'recent_activity': recent_activity,
-                    'forms_by_status': {
-                        'draft': sum(1 for f in forms if f.status == 'draft'),
-                        'published': sum(1 for f in forms if f.status == 'published'),
-                        'closed': sum(1 for f in forms if f.status == 'closed')
-                    }
-                }
+            with get_read_session(user_id) as session:
+                stats = tenant_dashboard.load_tenant_dashboard(session, tenant_id, created_by=scope)
+            tenant_dashboard.cache_dashboard(tenant_id, stats, scope)
+            return stats
                 
         except Exception as e:
             logger.error(f"Error getting tenant dashboard stats: {e}")
-            return {
-                'total_forms': 0,
-                'total_submissions': 0,
-                'active_forms': 0,
-                'recent_activity': []
-            }
+            return tenant_dashboard.empty_dashboard()
     
     @staticmethod
     def get_form_analytics(form_id: int, user_id: int, user_role: str) -> Dict[str, Any]:
         """Get analytics for a specific form"""
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 # Get form details
                 form = session.query(Form).filter(Form.id == form_id).first()
                 if not form:
@@ -521,7 +815,7 @@ class AnalyticsService:
     def get_global_analytics(user_id: int, user_role: str) -> Dict[str, Any]:
         """Get global analytics across all forms"""
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 # For now, return basic global stats
                 total_forms = session.query(Form).count()
                 total_submissions = session.query(Submission).count()
@@ -597,12 +891,9 @@ def choice_stats(question: Dict[str, Any], answers: List[Dict[str, Any]]) -> Dic
 def numeric_stats(answers: List[Dict[str, Any]]) -> Dict[str, Any]:
     nums = []
     for a in answers:
-        v = a.get("value")
-        try:
-            n = float(v)
+        n = numeric_analytics.parse_number(a.get("value"))
+        if n is not None:
             nums.append(n)
-        except Exception:
-            continue
     if not nums:
         return {"count": 0, "min": None, "max": None, "avg": None}
     return {"count": len(nums), "min": min(nums), "max": max(nums), "avg": sum(nums) / len(nums)}
@@ -0,0 +1,295 @@
+"""
+SQL push-down aggregation engine for FormMind-AI analytics
+Numeric and text question statistics are computed in PostgreSQL with
+GROUP BY, ordered-set aggregates and window functions, a fixed number of
+queries for all questions of a form. Only per-question summary rows leave
+the database, never the answers themselves. Answers group by question_id,
+or by lineage_key to combine a question's copies across form versions.
+
+Every summary can be scoped to a SELECT of submission ids (see
+services/filters.py); only those submissions' answers are then aggregated.
+"""
+from typing import Dict, Any, List, Iterable, Optional, Tuple, Union
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy import Float, Select, bindparam, case, cast, func, text
+from sqlalchemy.dialects.postgresql import psycopg2 as postgresql_psycopg2
+
+from ..models import Answer
+from .sketches import KLLSketch
+from .numeric_analytics import FIXED, NUMBER_PATTERN, describe_array, summary_bin_count
+from . import text_analytics
+
+logger = logging.getLogger(__name__)
+
+
+
+# Answer columns the summaries can group by (both are indexed on answers)
+GROUP_KEYS = ('question_id', 'lineage_key')
+
+
+_numeric_value = case((Answer.value.op('~')(NUMBER_PATTERN), cast(Answer.value, Float)))
+
+# Equal-width histogram per question, each with its own bin count; the max
+# lands in the last bin like the other values
+_HISTOGRAM_SQL = r"""
+    WITH vals AS (
+        SELECT {key} AS key, value::double precision AS num
+        FROM answers
+        WHERE {key} IN :keys AND value ~ :number_pattern {scope}
+    ), bounded AS (
+        SELECT v.key, v.num, b.bins,
+               min(v.num) OVER (PARTITION BY v.key) AS lo,
+               max(v.num) OVER (PARTITION BY v.key) AS hi
+        FROM vals v
+        JOIN unnest(CAST(:keys_array AS integer[]), CAST(:bins_array AS integer[])) AS b(key, bins) ON b.key = v.key
+    )
+    SELECT key, least(width_bucket(num, lo, hi, bins), bins) AS bucket, count(*) AS n
+    FROM bounded
+    WHERE hi > lo
+    GROUP BY key, bucket
+"""
+
+# Top words per question: tokenize like text_analytics, filter stop words, rank with a window
+_COMMON_WORDS_SQL = r"""
+    WITH words AS (
+        SELECT a.{key} AS key, m.token[1] AS word
+        FROM answers a
+        CROSS JOIN LATERAL regexp_matches(lower(a.value), :token_pattern, 'g') AS m(token)
+        WHERE a.{key} IN :keys {scope}
+          AND length(m.token[1]) BETWEEN :min_length AND :max_length
+          AND m.token[1] <> ALL(:stop_words)
+    ), ranked AS (
+        SELECT key, word, count(*) AS n,
+               row_number() OVER (PARTITION BY key ORDER BY count(*) DESC, word) AS rank
+        FROM words
+        GROUP BY key, word
+    )
+    SELECT key, word, n FROM ranked WHERE rank <= :top_n ORDER BY key, rank
+"""
+
+
+def _group_column(by: str):
+    if by not in GROUP_KEYS:
+        raise ValueError(f"Unknown answer grouping: {by}")
+    return getattr(Answer, by)
+
+
+def _grouped_sql(template: str, by: str, scope: str = ''):
+    """One of the SQL templates above for a GROUP_KEYS column"""
+    _group_column(by)
+    return text(template.format(key=by, scope=scope)).bindparams(bindparam('keys', expanding=True))
+
+
+# Renders scopes with :name parameters, as text() expects
+_scope_dialect = postgresql_psycopg2.dialect(paramstyle='named')
+
+
+def _scope_sql(submissions: Optional[Select], column: str) -> Tuple[str, Dict[str, Any]]:
+    """AND clause limiting a SQL template's answers to a SELECT of submission ids, and its parameters"""
+    if submissions is None:
+        return '', {}
+    compiled = submissions.compile(dialect=_scope_dialect, compile_kwargs={'render_postcompile': True})
+    return f"AND {column} IN ({compiled})", dict(compiled.params)
+
+
+def _scoped(query, submissions: Optional[Select]):
+    return query if submissions is None else query.filter(Answer.submission_id.in_(submissions))
+
+
+def _distribution(low: float, high: float, count: int, bucket_counts: Dict[int, int],
+                  bins: int) -> List[Dict[str, Any]]:
+    """Histogram rows in the 'distribution' format of get_question_analytics"""
+    if count < 2:
+        return []
+    if low == high:
+        return [{'range': f'{low}', 'count': count}]
+    bin_width = (high - low) / bins
+    distribution = []
+    for i in range(bins):
+        bin_start = low + i * bin_width
+        distribution.append({
+            'range': f'{bin_start:.1f} - {bin_start + bin_width:.1f}',
+            'count': bucket_counts.get(i + 1, 0)
+        })
+    return distribution
+
+
+def numeric_summaries(session: Session, question_ids: Iterable[int], bins: Union[str, int] = FIXED,
+                      by: str = 'question_id', submissions: Optional[Select] = None) -> Dict[int, Dict[str, Any]]:
+    """Count, min/max/avg/std, quartiles and histogram per numeric question, in two queries
+
+    bins is a bin count or a numeric_analytics strategy, applied per
+    question from its count and quartiles. With by='lineage_key' the ids
+    are lineage keys and each summary covers the question in every form
+    version. With submissions (a SELECT of submission ids) only their
+    answers are summarized.
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+
+    key = _group_column(by)
+    rows = _scoped(session.query(
+        key,
+        func.count(_numeric_value),
+        func.min(_numeric_value),
+        func.max(_numeric_value),
+        func.avg(_numeric_value),
+        func.stddev_pop(_numeric_value),
+        func.percentile_cont(0.25).within_group(_numeric_value),
+        func.percentile_cont(0.5).within_group(_numeric_value),
+        func.percentile_cont(0.75).within_group(_numeric_value),
+    ).filter(key.in_(question_ids)), submissions).group_by(key).all()
+
+    bin_counts = {
+        question_id: summary_bin_count(bins, count, low, high, q1, q3)
+        for question_id, count, low, high, _, _, q1, _, q3 in rows
+        if count >= 2 and high > low
+    }
+    bucket_counts: Dict[int, Dict[int, int]] = {}
+    if bin_counts:
+        scope, scope_params = _scope_sql(submissions, 'submission_id')
+        for question_id, bucket, n in session.execute(
+            _grouped_sql(_HISTOGRAM_SQL, by, scope), {
+                'keys': list(bin_counts), 'keys_array': list(bin_counts), 'bins_array': list(bin_counts.values()),
+                'number_pattern': NUMBER_PATTERN, **scope_params
+            }
+        ):
+            bucket_counts.setdefault(question_id, {})[bucket] = n
+
+    summaries = {}
+    for question_id, count, low, high, mean, std_dev, q1, median, q3 in rows:
+        if not count:
+            continue
+        question_bins = bin_counts.get(question_id, 1)
+        summaries[question_id] = {
+            'count': count,
+            'min': low,
+            'max': high,
+            'avg': float(mean),
+            'std_dev': float(std_dev or 0.0),
+            'median': median,
+            'q1': q1,
+            'q3': q3,
+            'iqr': q3 - q1,
+            'distribution': _distribution(low, high, count, bucket_counts.get(question_id, {}), question_bins),
+        }
+    return summaries
+
+
+def text_summaries(session: Session, question_ids: Iterable[int], top_n: int = 10,
+                   by: str = 'question_id', submissions: Optional[Select] = None) -> Dict[int, Dict[str, Any]]:
+    """Length statistics and most common words per text question, in two queries
+
+    See numeric_summaries for by and submissions.
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+
+    key = _group_column(by)
+    non_blank = Answer.value.op('~')(r'\S')
+    length = func.length(Answer.value)
+    rows = _scoped(session.query(
+        key, func.count(Answer.id), func.avg(length), func.min(length), func.max(length)
+    ).filter(key.in_(question_ids), non_blank), submissions).group_by(key).all()
+
+    scope, scope_params = _scope_sql(submissions, 'a.submission_id')
+    common_words: Dict[int, List[Dict[str, Any]]] = {}
+    for question_id, word, n in session.execute(
+        _grouped_sql(_COMMON_WORDS_SQL, by, scope), {
+            'keys': question_ids, 'token_pattern': text_analytics.SQL_TOKEN_PATTERN,
+            'min_length': text_analytics.MIN_TERM_LENGTH, 'max_length': text_analytics.MAX_TERM_LENGTH,
+            'stop_words': sorted(text_analytics.stop_words()), 'top_n': top_n, **scope_params
+        }
+    ):
+        common_words.setdefault(question_id, []).append({'word': word, 'count': n})
+
+    return {
+        question_id: {
+            'response_count': count,
+            'avg_length': float(avg_length),
+            'min_length': min_length,
+            'max_length': max_length,
+            'common_words': common_words.get(question_id, []),
+        }
+        for question_id, count, avg_length, min_length, max_length in rows
+    }
+
+
+def response_counts(session: Session, question_ids: Iterable[int],
+                    submissions: Optional[Select] = None) -> Dict[int, int]:
+    """Answers per question, counted like QuestionStats.response_count; see numeric_summaries for submissions"""
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+    rows = _scoped(session.query(Answer.question_id, func.count(Answer.id)).filter(
+        Answer.question_id.in_(question_ids)
+    ), submissions).group_by(Answer.question_id)
+    return {question_id: count for question_id, count in rows}
+
+
+def choice_counts(session: Session, question_ids: Iterable[int],
+                  submissions: Optional[Select] = None) -> Dict[int, Dict[str, int]]:
+    """Stored answer values per choice question with their counts; see numeric_summaries for submissions
+
+    Values are counted as stored: a checkbox answer is one JSON list (see
+    aggregates.parse_selections), so only distinct combinations leave the
+    database.
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+    rows = _scoped(session.query(Answer.question_id, Answer.value, func.count(Answer.id)).filter(
+        Answer.question_id.in_(question_ids), Answer.value.isnot(None)
+    ), submissions).group_by(Answer.question_id, Answer.value)
+    counts: Dict[int, Dict[str, int]] = {}
+    for question_id, value, count in rows:
+        counts.setdefault(question_id, {})[value] = count
+    return counts
+
+
+def sketch_numeric_summary(stats: Dict[str, Any], sketch: KLLSketch,
+                           bins: Union[str, int] = FIXED) -> Dict[str, Any]:
+    """numeric_summaries() entry from stored moments and a quantile sketch, without reading answers
+
+    Count, min, max, mean and std are exact; quartiles and histogram carry
+    the sketch's rank error (see services/sketches.py).
+    """
+    count = stats['numeric_count']
+    mean = stats['numeric_sum'] / count
+    low, high = stats['numeric_min'], stats['numeric_max']
+    q1, median, q3 = sketch.quantile(0.25), sketch.quantile(0.5), sketch.quantile(0.75)
+    bin_total = summary_bin_count(bins, count, low, high, q1, q3) if count >= 2 and high > low else 1
+    return {
+        'count': count,
+        'min': low,
+        'max': high,
+        'avg': mean,
+        'std_dev': max(stats['numeric_sumsq'] / count - mean * mean, 0.0) ** 0.5,
+        'median': median,
+        'q1': q1,
+        'q3': q3,
+        'iqr': q3 - q1,
+        'distribution': _distribution(low, high, count, sketch.bin_counts(low, high, bin_total), bin_total),
+    }
+
+
+def array_numeric_summary(values, bins: Union[str, int] = FIXED) -> Optional[Dict[str, Any]]:
+    """numeric_summaries() entry from a float array (NaN = missing), e.g. a snapshot column"""
+    summary = describe_array(values, bins)
+    if summary is None:
+        return None
+    return {
+        'count': summary['count'],
+        'min': summary['min'],
+        'max': summary['max'],
+        'avg': summary['mean'],
+        'std_dev': summary['std'],
+        'median': summary['median'],
+        'q1': summary['q1'],
+        'q3': summary['q3'],
+        'iqr': summary['iqr'],
+        'distribution': summary['distribution'],
+    }
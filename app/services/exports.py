@@ -0,0 +1,460 @@
+"""
+Streaming response exports for FormMind-AI
+A form's responses are read with one submissions-answers join through a
+server-side cursor, newest submission first, and pivoted into one row per
+submission as the rows arrive. Rows are written as CSV, NDJSON or a JSON
+array in chunks, so memory stays flat however many responses a form has.
+
+Columns follow question lineages (see Question.lineage_key): the copies of a
+question in different form versions share one column, labelled as in the
+newest version.
+
+Background exports (spool_export) split the submission id range into chunks
+read in parallel and write one gzip spool file per form, format and state of
+the form, which later downloads reuse.
+
+Large exports can also be written from the command line:
+    python -m app.services.exports 42 --format ndjson --output responses.ndjson
+"""
+from typing import Dict, Any, List, Optional, Iterable, Iterator, IO, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+from sqlalchemy.orm import Session
+from sqlalchemy import desc, func, or_, select
+
+from ..models import Submission, Answer, Question, FormVersion, FormVersionStats, AggregateQueueEntry
+from ..db import get_read_session
+from .filters import FilterSpec
+from .jobs import JobContext
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'json', 'ndjson')
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+# Submissions per yielded chunk
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+# Background exports: gzip spool files, and id range chunks read at once (one connection each)
+EXPORT_SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR", "data/exports")
+EXPORT_PARALLELISM = int(os.getenv("EXPORT_PARALLELISM", "4"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+CSV_FIXED_HEADERS = ['Submission ID', 'Submitted At', 'Submitted By']
+MEDIA_TYPES = {'csv': 'text/csv', 'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+
+
+class ExportColumn:
+    """One answer column: a question lineage"""
+
+    __slots__ = ('label', 'field_type')
+
+    def __init__(self, label: str, field_type: str):
+        self.label = label
+        self.field_type = field_type
+
+
+def _queued_versions(form_id: int):
+    # Versions whose only submissions are still queued for the aggregate fold
+    return select(Submission.form_version_id).join(
+        AggregateQueueEntry, AggregateQueueEntry.submission_id == Submission.id
+    ).where(Submission.form_id == form_id)
+
+
+def load_export_columns(session: Session, form_id: int) -> Tuple[List[ExportColumn], Dict[int, int]]:
+    """Answer columns of a form's versions with submissions, and question id -> column index"""
+    rows = session.query(
+        Question.id, Question.lineage_key, Question.label, Question.field_type, Question.order_index,
+        FormVersion.version_number
+    ).join(FormVersion, Question.form_version_id == FormVersion.id).outerjoin(
+        FormVersionStats, FormVersionStats.form_version_id == FormVersion.id
+    ).filter(
+        FormVersion.form_id == form_id,
+        or_(FormVersionStats.submission_count > 0, FormVersion.id.in_(_queued_versions(form_id)))
+    ).order_by(desc(FormVersion.version_number), Question.order_index, Question.id).all()
+
+    # The newest version with submissions decides labels and order; questions
+    # dropped since keep their last label and follow
+    columns: List[ExportColumn] = []
+    column_of_lineage: Dict[int, int] = {}
+    column_of_question: Dict[int, int] = {}
+    for question_id, lineage_key, label, field_type, _, _ in rows:
+        key = lineage_key or question_id
+        if key not in column_of_lineage:
+            column_of_lineage[key] = len(columns)
+            columns.append(ExportColumn(label, field_type))
+        column_of_question[question_id] = column_of_lineage[key]
+    return columns, column_of_question
+
+
+def pivot_answers(rows: Iterable[Tuple], column_of_question: Dict[int, int]
+                  ) -> Iterator[Tuple[int, Optional[datetime], Optional[int], Dict[int, str]]]:
+    """(submission id, submitted_at, user id, {column: value}) per submission
+
+    rows are (submission id, submitted_at, user id, question id, value),
+    one per answer (question id None for a submission without answers),
+    with each submission's rows adjacent.
+    """
+    current = None
+    values: Dict[int, str] = {}
+    for submission_id, submitted_at, user_id, question_id, value in rows:
+        if current is None or submission_id != current[0]:
+            if current is not None:
+                yield current[0], current[1], current[2], values
+            current = (submission_id, submitted_at, user_id)
+            values = {}
+        column = column_of_question.get(question_id)
+        if column is not None and value is not None:
+            values[column] = value
+    if current is not None:
+        yield current[0], current[1], current[2], values
+
+
+def iter_submissions(session: Session, form_id: int, column_of_question: Dict[int, int],
+                     id_range: Optional[Tuple[int, int]] = None, filters: Optional[FilterSpec] = None
+                     ) -> Iterator[Tuple[int, Optional[datetime], Optional[int], Dict[int, str]]]:
+    """A form's submissions pivoted to columns, newest first
+
+    One query streamed with yield_per; a submission's answers arrive
+    together because the join is ordered by submission. With an id_range
+    (inclusive) only those submissions are read, by descending id; with
+    filters only the matching ones.
+    """
+    conditions = filters.conditions(form_id) if filters is not None else [Submission.form_id == form_id]
+    stmt = select(
+        Submission.id, Submission.submitted_at, Submission.user_id, Answer.question_id, Answer.value
+    ).outerjoin(Answer, Answer.submission_id == Submission.id).where(*conditions)
+    if id_range is None:
+        stmt = stmt.order_by(desc(Submission.submitted_at), desc(Submission.id))
+    else:
+        stmt = stmt.where(Submission.id.between(*id_range)).order_by(desc(Submission.id))
+    # Core execution: plain rows, without the ORM result machinery
+    rows = session.connection().execute(stmt.execution_options(yield_per=EXPORT_FETCH_SIZE))
+    return pivot_answers(rows, column_of_question)
+
+
+def checkbox_selections(value: str) -> Optional[List[str]]:
+    """Selections of a checkbox answer stored as a JSON list, else None"""
+    if not value.startswith('['):
+        return None
+    try:
+        selections = json.loads(value)
+    except ValueError:
+        return None
+    return selections if isinstance(selections, list) else None
+
+
+def csv_header(columns: List[ExportColumn]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_FIXED_HEADERS + [column.label for column in columns])
+    return buffer.getvalue()
+
+
+def csv_rows(columns: List[ExportColumn], submissions: Iterator[Tuple], chunk_rows: int = EXPORT_CHUNK_ROWS
+             ) -> Iterator[str]:
+    """CSV lines of submissions, chunk_rows per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    checkbox_columns = {index for index, column in enumerate(columns) if column.field_type == 'checkbox'}
+    rows = 0
+    for submission_id, submitted_at, user_id, values in submissions:
+        row = [
+            submission_id,
+            submitted_at.strftime('%Y-%m-%d %H:%M:%S') if submitted_at else '',
+            user_id or 'Anonymous'
+        ]
+        for index in range(len(columns)):
+            value = values.get(index, '')
+            if index in checkbox_columns and value:
+                selections = checkbox_selections(value)
+                if selections is not None:
+                    value = ', '.join(str(selection) for selection in selections)
+            row.append(value)
+        writer.writerow(row)
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def csv_chunks(columns: List[ExportColumn], submissions: Iterator[Tuple], chunk_rows: int = EXPORT_CHUNK_ROWS
+               ) -> Iterator[str]:
+    yield csv_header(columns)
+    yield from csv_rows(columns, submissions, chunk_rows)
+
+
+def _json_keys(columns: List[ExportColumn]) -> List[str]:
+    """Answer keys by column; repeated labels get a numeric suffix"""
+    keys = []
+    seen: Dict[str, int] = {}
+    for column in columns:
+        seen[column.label] = seen.get(column.label, 0) + 1
+        keys.append(column.label if seen[column.label] == 1 else f"{column.label} ({seen[column.label]})")
+    return keys
+
+
+def json_records(columns: List[ExportColumn], submissions: Iterator[Tuple]) -> Iterator[Dict[str, Any]]:
+    keys = _json_keys(columns)
+    for submission_id, submitted_at, user_id, values in submissions:
+        answers = {}
+        for index, column in enumerate(columns):
+            value = values.get(index)
+            if value and column.field_type == 'checkbox':
+                selections = checkbox_selections(value)
+                if selections is not None:
+                    value = selections
+            answers[keys[index]] = value
+        yield {
+            'submission_id': submission_id,
+            'submitted_at': submitted_at.isoformat() if submitted_at else None,
+            'user_id': user_id,
+            'answers': answers
+        }
+
+
+def ndjson_chunks(columns: List[ExportColumn], submissions: Iterator[Tuple], chunk_rows: int = EXPORT_CHUNK_ROWS
+                  ) -> Iterator[str]:
+    lines = []
+    for record in json_records(columns, submissions):
+        lines.append(json.dumps(record))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def json_array_items(columns: List[ExportColumn], submissions: Iterator[Tuple],
+                     chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """Comma-separated records of a JSON array, without its brackets"""
+    parts = []
+    separator = ''
+    for record in json_records(columns, submissions):
+        parts.append('\n  ' + json.dumps(record, indent=2).replace('\n', '\n  '))
+        if len(parts) >= chunk_rows:
+            yield separator + ','.join(parts)
+            parts = []
+            separator = ','
+    if parts:
+        yield separator + ','.join(parts)
+
+
+def json_array_chunks(columns: List[ExportColumn], submissions: Iterator[Tuple],
+                      chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[str]:
+    """A JSON array written record by record, formatted like json.dumps(indent=2)"""
+    yield '['
+    empty = True
+    for chunk in json_array_items(columns, submissions, chunk_rows):
+        yield chunk
+        empty = False
+    yield ']' if empty else '\n]'
+
+
+def stream_export(session: Session, form_id: int, format_type: str = 'csv',
+                  filters: Optional[FilterSpec] = None) -> Iterator[str]:
+    """Chunks of a form's responses in an export format (see EXPORT_FORMATS), optionally filtered"""
+    columns, column_of_question = load_export_columns(session, form_id)
+    submissions = iter_submissions(session, form_id, column_of_question, filters=filters)
+    if format_type == 'csv':
+        return csv_chunks(columns, submissions)
+    if format_type == 'ndjson':
+        return ndjson_chunks(columns, submissions)
+    if format_type == 'json':
+        return json_array_chunks(columns, submissions)
+    raise ValueError(f"Unknown export format {format_type!r}")
+
+
+def stream_form_export(form_id: int, user_id: Optional[int], format_type: str = 'csv',
+                       filters: Optional[FilterSpec] = None) -> Iterator[str]:
+    """stream_export over its own read session, held open until the last chunk (or close())"""
+    with get_read_session(user_id) as session:
+        yield from stream_export(session, form_id, format_type, filters)
+
+
+def write_export(chunks: Iterator[str], target: IO[str]) -> int:
+    """Write export chunks to a text file object; returns the characters written"""
+    written = 0
+    for chunk in chunks:
+        written += target.write(chunk)
+    return written
+
+
+# ----------------------------------------------------------------------------
+# Spooled exports
+# ----------------------------------------------------------------------------
+
+def id_ranges(low: int, high: int, chunks: int) -> List[Tuple[int, int]]:
+    """Inclusive submission id ranges covering low..high, highest first"""
+    size = max(1, math.ceil((high - low + 1) / max(1, chunks)))
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)][::-1]
+
+
+def spool_prefix(form_id: int, format_type: str, filters: Optional[FilterSpec] = None) -> str:
+    """Start of the spool file names of one form, format and filter"""
+    scope = 'all'
+    if filters is not None and filters.active:
+        scope = hashlib.sha1(repr(filters.key()).encode('utf-8')).hexdigest()[:12]
+    return f"form_{form_id}_{format_type}_{scope}_"
+
+
+def _counted(submissions: Iterator[Tuple], counter: List[int]) -> Iterator[Tuple]:
+    for submission in submissions:
+        counter[0] += 1
+        yield submission
+
+
+def _write_part(form_id: int, user_id: Optional[int], format_type: str, columns: List[ExportColumn],
+                column_of_question: Dict[int, int], id_range: Tuple[int, int], path: str,
+                context: Optional[JobContext], filters: Optional[FilterSpec]) -> int:
+    """Write one id range as its own gzip member file; returns the submissions written"""
+    counter = [0]
+    with get_read_session(user_id) as session:
+        submissions = _counted(iter_submissions(session, form_id, column_of_question, id_range, filters), counter)
+        if format_type == 'csv':
+            chunks = csv_rows(columns, submissions)
+        elif format_type == 'ndjson':
+            chunks = ndjson_chunks(columns, submissions)
+        else:
+            chunks = json_array_items(columns, submissions)
+        with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=EXPORT_GZIP_LEVEL) as part:
+            for chunk in chunks:
+                if context is not None:
+                    context.check()
+                part.write(chunk)
+    return counter[0]
+
+
+def merge_parts(columns: List[ExportColumn], format_type: str, parts: Iterable[Tuple[str, int]],
+                target: IO[bytes]) -> None:
+    """Concatenate gzip part files of (path, submissions), in order, into one export
+
+    Parts are copied as they are, without recompressing: consecutive gzip
+    members decompress as one stream. The CSV header and the JSON array's
+    brackets and separating commas are added as members of their own.
+    """
+    if format_type == 'csv':
+        target.write(gzip.compress(csv_header(columns).encode('utf-8')))
+    elif format_type == 'json':
+        target.write(gzip.compress(b'['))
+    written = 0
+    for path, rows in parts:
+        if not rows:
+            continue
+        if format_type == 'json' and written:
+            target.write(gzip.compress(b','))
+        with open(path, 'rb') as part:
+            shutil.copyfileobj(part, target)
+        written += rows
+    if format_type == 'json':
+        target.write(gzip.compress(b'\n]' if written else b']'))
+
+
+def spool_export(form_id: int, user_id: Optional[int], format_type: str = 'csv',
+                 context: Optional[JobContext] = None, filters: Optional[FilterSpec] = None) -> Dict[str, Any]:
+    """Write a form's (matching) responses to a gzip spool file, or reuse the one already written
+
+    The submission id range is split into chunks that are read and
+    compressed in parallel, each on its own connection and into its own
+    gzip member; the members are then concatenated, which is itself a valid
+    gzip file. Spools are named after the filter and the form's submission
+    id range, count and columns, so an unchanged form reuses its spool.
+    Unlike stream_export, rows are ordered by descending submission id.
+    """
+    if format_type not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {format_type!r}")
+    with get_read_session(user_id) as session:
+        columns, column_of_question = load_export_columns(session, form_id)
+        low, high, count = session.query(
+            func.min(Submission.id), func.max(Submission.id), func.count(Submission.id)
+        ).filter(Submission.form_id == form_id).one()
+        matching = count
+        if count and filters is not None and filters.active:
+            matching = session.query(func.count(Submission.id)).filter(*filters.conditions(form_id)).scalar()
+
+    signature = json.dumps([
+        low, high, count, [(column.label, column.field_type) for column in columns], sorted(column_of_question.items())
+    ])
+    stamp = hashlib.sha1(signature.encode('utf-8')).hexdigest()[:16]
+    prefix = spool_prefix(form_id, format_type, filters)
+    path = os.path.join(EXPORT_SPOOL_DIR, f"{prefix}{stamp}.gz")
+    result = {'path': path, 'filename': f"form_{form_id}_responses.{format_type}.gz",
+              'format': format_type, 'rows': matching, 'reused': True}
+    if os.path.exists(path):
+        os.utime(path)
+        result['size'] = os.path.getsize(path)
+        return result
+
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="spooling_", dir=EXPORT_SPOOL_DIR)
+    try:
+        ranges = id_ranges(low, high, EXPORT_PARALLELISM * 4) if matching else []
+        part_paths = [os.path.join(work_dir, f"part_{index:05d}.gz") for index in range(len(ranges))]
+        rows = [0] * len(ranges)
+        if ranges:
+            with ThreadPoolExecutor(max_workers=EXPORT_PARALLELISM, thread_name_prefix="export") as pool:
+                futures = {
+                    pool.submit(_write_part, form_id, user_id, format_type, columns, column_of_question,
+                                id_range, part_path, context, filters): index
+                    for index, (id_range, part_path) in enumerate(zip(ranges, part_paths))
+                }
+                try:
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        rows[futures[future]] = future.result()
+                        if context is not None:
+                            context.set_progress(done / (len(ranges) + 1))
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        merged = os.path.join(work_dir, "merged.gz")
+        with open(merged, 'wb') as target:
+            merge_parts(columns, format_type, zip(part_paths, rows), target)
+        os.replace(merged, path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Older spools of this form, format and filter are superseded
+    for name in os.listdir(EXPORT_SPOOL_DIR):
+        if name.startswith(prefix) and name.endswith('.gz') and os.path.join(EXPORT_SPOOL_DIR, name) != path:
+            try:
+                os.remove(os.path.join(EXPORT_SPOOL_DIR, name))
+            except OSError:
+                pass
+    result.update(rows=sum(rows), reused=False, size=os.path.getsize(path))
+    logger.info(f"Spooled {result['rows']} submissions of form {form_id} to {path} ({result['size']} bytes)")
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream a FormMind form's responses to a file")
+    parser.add_argument("form_id", type=int)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    chunks = stream_form_export(args.form_id, None, args.format)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as target:
+            written = write_export(chunks, target)
+        print(f"Wrote {written} characters to {args.output}")
+    else:
+        write_export(chunks, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Analytics filters for FormMind-AI
+A FilterSpec narrows the submissions that summary metrics, question analytics
+and exports cover: a submitted_at range, form versions, the kind of
+submitter (signed-in user or guest) and predicates on answers. It compiles
+into SQL conditions on submissions, so filtering happens in the database and
+only matching rows (or their aggregates) are read.
+
+The same spec matches submission dicts in memory (FilterSpec.matches), for
+pages that work on data that is already loaded.
+"""
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from datetime import datetime
+from sqlalchemy import Float, Select, and_, case, cast, exists, func, not_, or_, select
+
+from ..models import Submission, Answer, Question, FormVersion
+from .aggregates import parse_selections
+from .numeric_analytics import NUMBER_PATTERN, parse_number
+
+SUBMITTER_TYPES = ('all', 'user', 'guest')
+
+# equals also matches one selection of a checkbox answer; contains is a
+# case-insensitive substring; gt/gte/lt/lte compare numeric answers only;
+# not_equals and not_answered also match submissions without the answer
+ANSWER_OPERATORS = ('equals', 'not_equals', 'contains', 'gt', 'gte', 'lt', 'lte', 'answered', 'not_answered')
+NUMERIC_OPERATORS = ('gt', 'gte', 'lt', 'lte')
+NEGATED_OPERATORS = {'not_equals': 'equals', 'not_answered': 'answered'}
+
+SUBMITTER_LABELS = {'all': 'Everyone', 'user': 'Signed-in users', 'guest': 'Guests'}
+OPERATOR_LABELS = {
+    'equals': 'equals', 'not_equals': 'does not equal', 'contains': 'contains',
+    'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'answered': 'is answered', 'not_answered': 'is not answered',
+}
+
+_numeric_value = case((Answer.value.op('~')(NUMBER_PATTERN), cast(Answer.value, Float)))
+
+
+class AnswerPredicate:
+    """A condition on one question's answer; copies of the question in other versions count too"""
+
+    __slots__ = ('question_id', 'operator', 'value')
+
+    def __init__(self, question_id: int, operator: str, value: Any = None):
+        if operator not in ANSWER_OPERATORS:
+            raise ValueError(f"Unknown answer operator {operator!r}")
+        if operator in NUMERIC_OPERATORS:
+            value = float(value)
+        elif operator in ('answered', 'not_answered'):
+            value = None
+        elif value is None:
+            raise ValueError(f"Answer operator {operator!r} needs a value")
+        else:
+            value = str(value)
+        self.question_id = int(question_id)
+        self.operator = operator
+        self.value = value
+
+    def key(self) -> Tuple[int, str, Any]:
+        return self.question_id, self.operator, self.value
+
+    def _value_condition(self, operator: str):
+        """Condition on answers.value for a non-negated operator"""
+        if operator == 'equals':
+            # Checkbox answers are stored as JSON lists, e.g. ["a", "b"]
+            selection = '"' + self.value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            return or_(Answer.value == self.value,
+                       and_(Answer.value.startswith('['), Answer.value.contains(selection, autoescape=True)))
+        if operator == 'contains':
+            return Answer.value.icontains(self.value, autoescape=True)
+        if operator == 'answered':
+            return Answer.value.op('~')(r'\S')
+        return {
+            'gt': _numeric_value > self.value, 'gte': _numeric_value >= self.value,
+            'lt': _numeric_value < self.value, 'lte': _numeric_value <= self.value,
+        }[operator]
+
+    def condition(self):
+        """EXISTS (or NOT EXISTS) condition on the submissions table"""
+        lineage = select(func.coalesce(Question.lineage_key, Question.id)).where(
+            Question.id == self.question_id
+        ).correlate(None).scalar_subquery()
+        operator = NEGATED_OPERATORS.get(self.operator, self.operator)
+        # Correlated to submissions only: the spec also scopes queries on answers
+        answer = exists().where(
+            Answer.submission_id == Submission.id,
+            or_(Answer.question_id == self.question_id, Answer.lineage_key == lineage),
+            self._value_condition(operator)
+        ).correlate(Submission)
+        return not_(answer) if operator != self.operator else answer
+
+    def matches(self, value: Optional[str]) -> bool:
+        """The predicate for one stored answer value (None when unanswered)"""
+        operator = NEGATED_OPERATORS.get(self.operator, self.operator)
+        if value is None:
+            matched = False
+        elif operator == 'equals':
+            matched = value == self.value or (
+                value.startswith('[') and self.value in parse_selections('checkbox', value)
+            )
+        elif operator == 'contains':
+            matched = self.value.lower() in value.lower()
+        elif operator == 'answered':
+            matched = bool(value.strip())
+        else:
+            number = parse_number(value)
+            matched = number is not None and {
+                'gt': number > self.value, 'gte': number >= self.value,
+                'lt': number < self.value, 'lte': number <= self.value,
+            }[operator]
+        return not matched if operator != self.operator else matched
+
+
+class FilterSpec:
+    """Submissions to include in analytics and exports; an empty spec includes all"""
+
+    __slots__ = ('start', 'end', 'version_numbers', 'submitter', 'answers')
+
+    def __init__(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 version_numbers: Optional[Iterable[int]] = None, submitter: str = 'all',
+                 answers: Optional[Iterable[AnswerPredicate]] = None):
+        if submitter not in SUBMITTER_TYPES:
+            raise ValueError(f"Unknown submitter type {submitter!r}")
+        self.start = start
+        self.end = end
+        self.version_numbers = sorted(set(version_numbers)) if version_numbers else []
+        self.submitter = submitter
+        self.answers = list(answers or [])
+
+    @classmethod
+    def from_filters(cls, filters: Optional[Dict[str, Any]]) -> 'FilterSpec':
+        """Spec from a filter dict as kept by the analytics pages
+
+        Keys (all optional): start_date, end_date, versions, submitter and
+        answer_filters, a list of {question_id, operator, value} dicts.
+        """
+        filters = filters or {}
+        return cls(
+            start=filters.get('start_date'),
+            end=filters.get('end_date'),
+            version_numbers=filters.get('versions'),
+            submitter=filters.get('submitter') or 'all',
+            answers=[
+                AnswerPredicate(answer['question_id'], answer['operator'], answer.get('value'))
+                for answer in filters.get('answer_filters') or []
+            ],
+        )
+
+    @property
+    def active(self) -> bool:
+        return bool(self.start or self.end or self.version_numbers or self.submitter != 'all' or self.answers)
+
+    def key(self) -> Tuple:
+        """Hashable identity, for cache and job keys"""
+        return (
+            self.start.isoformat() if self.start else None,
+            self.end.isoformat() if self.end else None,
+            tuple(self.version_numbers), self.submitter,
+            tuple(answer.key() for answer in self.answers),
+        )
+
+    def conditions(self, form_id: int) -> List[Any]:
+        """WHERE conditions on the submissions table selecting a form's matching submissions"""
+        conditions = [Submission.form_id == form_id]
+        if self.start:
+            conditions.append(Submission.submitted_at >= self.start)
+        if self.end:
+            conditions.append(Submission.submitted_at <= self.end)
+        if self.version_numbers:
+            conditions.append(Submission.form_version_id.in_(
+                select(FormVersion.id).where(
+                    FormVersion.form_id == form_id, FormVersion.version_number.in_(self.version_numbers)
+                )
+            ))
+        if self.submitter == 'user':
+            conditions.append(Submission.user_id.isnot(None))
+        elif self.submitter == 'guest':
+            conditions.append(Submission.user_id.is_(None))
+        conditions.extend(answer.condition() for answer in self.answers)
+        return conditions
+
+    def submission_ids(self, form_id: int) -> Select:
+        """SELECT of the ids of a form's matching submissions, to scope answer queries with"""
+        return select(Submission.id).where(*self.conditions(form_id))
+
+    def matches(self, submission: Dict[str, Any]) -> bool:
+        """Whether a submission dict matches
+
+        Uses the keys the submission has: submitted_at, version_number,
+        user_id, and answers ({question_id: value}). Answer predicates only
+        see the question ids given, not their copies in other versions.
+        """
+        submitted_at = submission.get('submitted_at')
+        if submitted_at is not None:
+            if self.start and submitted_at < self.start:
+                return False
+            if self.end and submitted_at > self.end:
+                return False
+        if self.version_numbers and 'version_number' in submission \
+                and submission['version_number'] not in self.version_numbers:
+            return False
+        if self.submitter != 'all' and (submission.get('user_id') is None) != (self.submitter == 'guest'):
+            return False
+        if self.answers and 'answers' in submission:
+            answers = submission['answers']
+            return all(answer.matches(answers.get(answer.question_id)) for answer in self.answers)
+        return True
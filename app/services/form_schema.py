@@ -0,0 +1,113 @@
+"""
+Public form schema loading and caching for FormMind-AI
+A form's public page needs the form, its active version, questions and
+options. They are loaded in one joined query and cached by public token,
+so reruns of the fill-form page do not touch the database.
+"""
+from typing import Dict, Any, Optional
+import copy
+import logging
+import os
+from sqlalchemy.orm import Session
+from sqlalchemy import and_
+
+from ..models import Form, FormVersion, Question, QuestionOption
+from ..db import get_db_session, on_commit
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+FORM_SCHEMA_CACHE_SIZE = int(os.getenv("FORM_SCHEMA_CACHE_SIZE", "1024"))
+FORM_SCHEMA_CACHE_TTL = float(os.getenv("FORM_SCHEMA_CACHE_TTL", "300"))
+
+# public_token -> schema dict (see load_form_schema)
+_schema_cache = LRUCache(maxsize=FORM_SCHEMA_CACHE_SIZE, ttl=FORM_SCHEMA_CACHE_TTL, name="form_schemas")
+
+
+def load_form_schema(session: Session, token: str) -> Optional[Dict[str, Any]]:
+    """Form, active version, questions and options for a public token in one query"""
+    rows = session.query(Form, FormVersion, Question, QuestionOption).outerjoin(
+        FormVersion, and_(FormVersion.form_id == Form.id, FormVersion.is_active == True)
+    ).outerjoin(
+        Question, Question.form_version_id == FormVersion.id
+    ).outerjoin(
+        QuestionOption, QuestionOption.question_id == Question.id
+    ).filter(
+        Form.public_token == token
+    ).order_by(
+        Question.order_index, Question.id, QuestionOption.order_index, QuestionOption.id
+    ).all()
+
+    if not rows:
+        return None
+
+    form, version = rows[0][0], rows[0][1]
+    questions: Dict[int, Dict[str, Any]] = {}
+    for _, _, question, option in rows:
+        if question is None:
+            continue
+        entry = questions.get(question.id)
+        if entry is None:
+            entry = questions[question.id] = {
+                'id': question.id,
+                'label': question.label,
+                'placeholder': question.placeholder,
+                'help_text': question.help_text,
+                'field_type': question.field_type,
+                'required': question.required,
+                'default_value': question.default_value,
+                'order_index': question.order_index,
+                'validation_min': question.validation_min,
+                'validation_max': question.validation_max,
+                'options': []
+            }
+        if option is not None:
+            entry['options'].append({'label': option.label, 'value': option.value})
+
+    return {
+        'id': form.id,
+        'title': form.title,
+        'description': form.description,
+        'status': form.status,
+        'access_type': form.access_type,
+        'single_submission': form.single_submission,
+        'submission_start': form.submission_start,
+        'submission_end': form.submission_end,
+        'public_token': form.public_token,
+        'created_by': form.created_by,
+        'created_at': form.created_at,
+        'version_id': version.id if version else None,
+        'version_number': version.version_number if version else None,
+        'questions': list(questions.values())
+    }
+
+
+def get_form_schema(token: str) -> Optional[Dict[str, Any]]:
+    """Cached public form schema; raises on database errors
+
+    Returns a copy, so callers may modify the result freely.
+    """
+    schema = _schema_cache.get(token)
+    if schema is None:
+        with get_db_session() as session:
+            schema = load_form_schema(session, token)
+        if schema is None:
+            return None
+        _schema_cache.set(token, schema)
+    return copy.deepcopy(schema)
+
+
+def invalidate_form_schema(form_id: int, session: Optional[Session] = None) -> None:
+    """Drop cached schemas of a form, again after the session commits if one is given
+
+    The second pass evicts a stale schema another request may have
+    reloaded while the writing transaction was still open.
+    """
+    _schema_cache.pop_where(lambda token, schema: schema['id'] == form_id)
+    if session is not None:
+        on_commit(session, lambda: _schema_cache.pop_where(lambda token, schema: schema['id'] == form_id))
+
+
+def get_form_schema_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the public form schema cache"""
+    return _schema_cache.stats()
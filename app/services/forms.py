@@ -11,9 +11,15 @@ from sqlalchemy import and_, or_, desc
 
 from ..models import (
     Form, FormVersion, Question, QuestionOption, Template, 
-    User, Tenant, Submission
+    User, Tenant
 )
-from ..db import get_db_session
+from ..db import get_db_session, get_read_session, profiled, on_commit
+from .validators import invalidate_validation_plan
+from .form_schema import get_form_schema, invalidate_form_schema
+from .submissions import SubmissionsService
+from .snapshots import remove_form_snapshots
+from .tenant_dashboard import invalidate_tenant_dashboard
+from .aggregates import load_submission_counts
 
 logger = logging.getLogger(__name__)
 
@@ -65,10 +71,11 @@ class FormsService:
     """Service class for form operations"""
     
     @staticmethod
+    @profiled()
     def get_forms_for_user(user_id: int, user_role: str, tenant_id: int) -> List[Dict[str, Any]]:
         """Get forms visible to a user based on their role"""
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 query = session.query(Form).filter(Form.tenant_id == tenant_id)
                 
                 # Apply role-based filtering
@@ -78,13 +85,11 @@ class FormsService:
                 
                 forms = query.order_by(desc(Form.created_at)).all()
                 
+                # Submission counts of every listed form from the maintained counters, in one query
+                submission_counts = load_submission_counts(session, [form.id for form in forms])
+                
                 result = []
                 for form in forms:
-                    # Get submission count for each form
-                    submission_count = session.query(Submission).filter(
-                        Submission.form_id == form.id
-                    ).count()
-                    
                     result.append({
                         'id': form.id,
                         'title': form.title,
@@ -97,7 +102,7 @@ class FormsService:
                         'public_token': form.public_token,
                         'created_by': form.created_by,
                         'created_at': form.created_at,
-                        'submission_count': submission_count
+                        'submission_count': submission_counts.get(form.id, 0)
                     })
                 
                 return result
@@ -129,7 +134,7 @@ class FormsService:
                    access_type: str = "public", single_submission: bool = False) -> Optional[Dict[str, Any]]:
         """Create a new form with initial version"""
         try:
-            with get_db_session() as session:
+            with get_db_session(created_by) as session:
                 # Generate public token for form access
                 public_token = str(uuid.uuid4())
                 
@@ -155,6 +160,7 @@ class FormsService:
                 )
                 session.add(form_version)
                 session.flush()
+                invalidate_tenant_dashboard(tenant_id, session)
                 
                 logger.info(f"Created form {form.id} with version {form_version.id}")
                 
@@ -197,6 +203,7 @@ class FormsService:
             return form_data
     
     @staticmethod
+    @profiled()
     def get_form_by_id(form_id: int, user_id: int, user_role: str) -> Optional[Dict[str, Any]]:
         """Get form details with access control"""
         try:
@@ -299,35 +306,15 @@ class FormsService:
             return None
     
     @staticmethod
+    @profiled()
     def get_form_by_token(token: str) -> Optional[Dict[str, Any]]:
         """Get form by public token for public access"""
         try:
-            with get_db_session() as session:
-                form = session.query(Form).filter(Form.public_token == token).first()
-                
-                if not form:
-                    return None
-                
-                # Get active version
-                active_version = session.query(FormVersion).filter(
-                    and_(FormVersion.form_id == form.id, FormVersion.is_active == True)
-                ).first()
-                
-                return {
-                    'id': form.id,
-                    'title': form.title,
-                    'description': form.description,
-                    'status': form.status,
-                    'access_type': form.access_type,
-                    'single_submission': form.single_submission,
-                    'submission_start': form.submission_start,
-                    'submission_end': form.submission_end,
-                    'public_token': form.public_token,
-                    'created_by': form.created_by,
-                    'created_at': form.created_at,
-                    'version_id': active_version.id if active_version else None,
-                    'version_number': active_version.version_number if active_version else None
-                }
+            schema = get_form_schema(token)
+            if not schema:
+                return None
+            schema.pop('questions')
+            return schema
                 
         except Exception as e:
             logger.error(f"Error getting form by token {token} (trying in-memory fallback): {e}")
@@ -351,12 +338,22 @@ class FormsService:
                     }
             return None
     
+    @staticmethod
+    @profiled()
+    def get_public_form_schema(token: str) -> Optional[Dict[str, Any]]:
+        """Form, active version and questions with options for the public fill page (cached)"""
+        try:
+            return get_form_schema(token)
+        except Exception as e:
+            logger.error(f"Error loading form schema for token {token}: {e}")
+            return None
+    
     @staticmethod
     def update_form_settings(form_id: int, user_id: int, user_role: str, 
                            settings: Dict[str, Any]) -> bool:
         """Update form settings with access control"""
         try:
-            with get_db_session() as session:
+            with get_db_session(user_id) as session:
                 form = session.query(Form).filter(Form.id == form_id).first()
                 
                 if not form:
@@ -373,10 +370,18 @@ class FormsService:
                     'single_submission', 'submission_start', 'submission_end'
                 ]
                 
+                single_submission_was = bool(form.single_submission)
                 for field, value in settings.items():
                     if field in allowed_fields:
                         setattr(form, field, value)
                 
+                if bool(form.single_submission) != single_submission_was:
+                    SubmissionsService.sync_single_submission_flags(
+                        session, form_id, bool(form.single_submission)
+                    )
+                invalidate_form_schema(form_id, session)
+                invalidate_tenant_dashboard(form.tenant_id, session)
+                
                 logger.info(f"Updated form {form_id} settings")
                 return True
                 
@@ -399,7 +404,7 @@ class FormsService:
     def delete_form(form_id: int, user_id: int, user_role: str) -> bool:
         """Delete form with access control"""
         try:
-            with get_db_session() as session:
+            with get_db_session(user_id) as session:
                 form = session.query(Form).filter(Form.id == form_id).first()
                 
                 if not form:
@@ -411,6 +416,9 @@ class FormsService:
                     return False
                 
                 session.delete(form)
+                invalidate_form_schema(form_id, session)
+                invalidate_tenant_dashboard(form.tenant_id, session)
+                on_commit(session, lambda: remove_form_snapshots(form_id))
                 logger.info(f"Deleted form {form_id}")
                 return True
                 
@@ -422,7 +430,7 @@ class FormsService:
     def duplicate_form(form_id: int, user_id: int, user_role: str, new_title: str = None) -> Optional[int]:
         """Create a copy of an existing form with all its questions"""
         try:
-            with get_db_session() as session:
+            with get_db_session(user_id) as session:
                 # Get original form
                 original_form = session.query(Form).filter(Form.id == form_id).first()
                 
@@ -447,6 +455,7 @@ class FormsService:
                 )
                 session.add(new_form)
                 session.flush()
+                invalidate_tenant_dashboard(new_form.tenant_id, session)
                 
                 # Create new form version
                 new_version = FormVersion(
@@ -484,6 +493,8 @@ class FormsService:
                         )
                         session.add(new_question)
                         session.flush()
+                        # A copy in another form starts its own lineage
+                        new_question.lineage_key = new_question.id
                         
                         # Copy question options if any
                         original_options = session.query(QuestionOption).filter(
@@ -512,11 +523,12 @@ class QuestionsService:
     """Service class for question operations"""
     
     @staticmethod
+    @profiled()
     def add_question(form_id: int, user_id: int, user_role: str, 
                     question_data: Dict[str, Any]) -> Optional[int]:
         """Add question to form with versioning logic"""
         try:
-            with get_db_session() as session:
+            with get_db_session(user_id) as session:
                 form = session.query(Form).filter(Form.id == form_id).first()
                 
                 if not form:
@@ -528,9 +540,7 @@ class QuestionsService:
                     return None
                 
                 # Check if we need a new version
-                submission_count = session.query(Submission).filter(
-                    Submission.form_id == form_id
-                ).count()
+                submission_count = load_submission_counts(session, [form_id]).get(form_id, 0)
                 
                 if needs_new_version_on_edit(form_dict, submission_count):
                     version_id = QuestionsService._create_new_version(session, form_id)
@@ -567,6 +577,7 @@ class QuestionsService:
                 )
                 session.add(question)
                 session.flush()
+                question.lineage_key = question.id
                 
                 # Add options for choice questions
                 options = question_data.get('options', [])
@@ -580,6 +591,10 @@ class QuestionsService:
                         )
                         session.add(option_obj)
                 
+                # Drafts are edited in place, so the version's compiled validators are stale
+                invalidate_validation_plan(version_id, session)
+                invalidate_form_schema(form_id, session)
+                
                 logger.info(f"Added question {question.id} to form {form_id}")
                 return question.id
                 
@@ -647,7 +662,9 @@ class QuestionsService:
                         order_index=old_q.order_index,
                         validation_min=old_q.validation_min,
                         validation_max=old_q.validation_max,
-                        validation_regex=old_q.validation_regex
+                        validation_regex=old_q.validation_regex,
+                        # Same question in the new version: analytics can follow it across versions
+                        lineage_key=old_q.lineage_key or old_q.id
                     )
                     session.add(new_question)
                     session.flush()
@@ -666,6 +683,7 @@ class QuestionsService:
                         )
                         session.add(new_option)
             
+            invalidate_form_schema(form_id, session)
             logger.info(f"Created new version {new_version.id} for form {form_id}")
             return new_version.id
             
@@ -674,6 +692,7 @@ class QuestionsService:
             return None
     
     @staticmethod
+    @profiled()
     def get_questions_for_form(form_id: int) -> List[Dict[str, Any]]:
         """Get all questions for a form (public access)"""
         try:
@@ -0,0 +1,330 @@
+"""
+Background analytics jobs for FormMind-AI
+CPU-heavy analytics (tokenizing and scoring text answers, building
+distributions) would otherwise run on the Streamlit script thread, freezing
+that session and, through the GIL, slowing every other session of the server
+process. Jobs are submitted here instead and the page polls for the result.
+
+A job's work function runs on a small coordinator thread, where it can read
+from the database, and hands its CPU-bound parts to a process pool shared by
+the whole server through JobContext.map(), which splits the items into
+chunks across the worker processes. Jobs are queued up to
+ANALYTICS_JOB_QUEUE_SIZE; past that, submit_job() refuses new work instead of
+letting a backlog build up. Cancelling a job (e.g. when its user navigates
+away) drops its queued chunks; a chunk already running finishes and is
+discarded.
+
+With ANALYTICS_WORKERS=0 chunks run on the coordinator thread instead of in
+worker processes.
+"""
+from typing import Dict, Any, List, Optional, Callable, Hashable, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs waiting or running at once; more are refused
+ANALYTICS_JOB_QUEUE_SIZE = int(os.getenv("ANALYTICS_JOB_QUEUE_SIZE", "16"))
+# Jobs whose coordinating (database and merging) part runs at once
+ANALYTICS_JOB_THREADS = int(os.getenv("ANALYTICS_JOB_THREADS", "2"))
+# How long a finished job's result can still be polled
+ANALYTICS_JOB_RESULT_TTL = float(os.getenv("ANALYTICS_JOB_RESULT_TTL", "600"))
+# spawn: workers never inherit the server's threads or database connections
+ANALYTICS_WORKER_START_METHOD = os.getenv("ANALYTICS_WORKER_START_METHOD", "spawn")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work function once the job is cancelled"""
+
+
+def partition(items: Sequence[Any], chunks: int) -> List[Sequence[Any]]:
+    """Split items into at most `chunks` contiguous, nearly equal slices"""
+    if not items:
+        return []
+    size = math.ceil(len(items) / max(1, chunks))
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+class Job:
+    """State of one submitted job, shared by its coordinator and pollers"""
+
+    def __init__(self, work: Callable[['JobContext'], Any], key: Optional[Hashable], owner: Optional[Hashable]):
+        self.id = uuid.uuid4().hex
+        self.work = work
+        self.key = key
+        self.owner = owner
+        self.state = QUEUED
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self.futures: List[Any] = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'state': self.state,
+            'progress': self.progress,
+            'result': self.result if self.state == DONE else None,
+            'error': self.error,
+            'elapsed': (self.finished_at or time.time()) - self.submitted_at,
+        }
+
+
+class JobContext:
+    """Handle given to a job's work function"""
+
+    def __init__(self, job: Job, runner: 'JobRunner'):
+        self._job = job
+        self._runner = runner
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job.cancel_event.is_set()
+
+    def check(self) -> None:
+        """Raise JobCancelled if the job was cancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+
+    def set_progress(self, fraction: float) -> None:
+        self._job.progress = max(0.0, min(1.0, fraction))
+
+    def map(self, fn: Callable[[Sequence[Any]], Any], items: Sequence[Any],
+            chunks: Optional[int] = None) -> List[Any]:
+        """fn applied to chunks of items in the worker processes, results in chunk order
+
+        fn must be a module-level function (it is pickled by reference).
+        Items are split into one chunk per worker unless `chunks` is given.
+        """
+        self.check()
+        parts = partition(items, chunks or max(1, self._runner.workers))
+        if not parts:
+            return []
+        if not self._runner.workers:
+            results = []
+            for position, part in enumerate(parts):
+                self.check()
+                results.append(fn(part))
+                self.set_progress((position + 1) / len(parts))
+            return results
+
+        pool = self._runner.process_pool()
+        futures = []
+        try:
+            futures.extend(pool.submit(fn, part) for part in parts)
+            self._job.futures = futures
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                self.set_progress((len(futures) - len(pending)) / len(futures))
+                if self.cancelled:
+                    raise JobCancelled()
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._runner.reset_pool(pool)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            self._job.futures = []
+
+
+class JobRunner:
+    """Bounded job queue over coordinator threads and a shared process pool"""
+
+    def __init__(self, workers: int = ANALYTICS_WORKERS, queue_size: int = ANALYTICS_JOB_QUEUE_SIZE,
+                 threads: int = ANALYTICS_JOB_THREADS, result_ttl: float = ANALYTICS_JOB_RESULT_TTL,
+                 start_method: str = ANALYTICS_WORKER_START_METHOD):
+        self.workers = max(0, workers)
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self.start_method = start_method
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._jobs: Dict[str, Job] = {}
+        self._active_keys: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="analytics-job")
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def process_pool(self) -> ProcessPoolExecutor:
+        """The shared worker pool, started on first use"""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(self.start_method)
+                )
+                logger.info(f"Started {self.workers} analytics worker processes")
+            return self._pool
+
+    def reset_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a broken pool (a worker died, e.g. killed for memory); the next chunk starts a new one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, work: Callable[[JobContext], Any], key: Optional[Hashable] = None,
+               owner: Optional[Hashable] = None) -> Optional[str]:
+        """Queue work(context); returns the job id, or None when the queue is full
+
+        A job with the same key that has not finished yet is reused rather
+        than queued twice.
+        """
+        with self._lock:
+            self._purge()
+            if key is not None and key in self._active_keys:
+                return self._active_keys[key]
+            active = sum(1 for job in self._jobs.values() if job.state not in FINISHED_STATES)
+            if active >= self.queue_size:
+                self.rejected += 1
+                logger.warning(f"Analytics job queue full ({active} jobs); refusing {key!r}")
+                return None
+            job = Job(work, key, owner)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active_keys[key] = job.id
+        self._threads.submit(self._run, job)
+        return job.id
+
+    def _run(self, job: Job) -> None:
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.state = RUNNING
+        try:
+            job.result = job.work(JobContext(job, self))
+            job.progress = 1.0
+            self._finish(job, DONE)
+        except (JobCancelled, CancelledError):
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            logger.error(f"Analytics job {job.key or job.id} failed: {e}")
+            job.error = str(e)
+            self._finish(job, FAILED)
+
+    def _finish(self, job: Job, state: str) -> None:
+        with self._lock:
+            job.state = state
+            job.finished_at = time.time()
+            job.work = None
+            if job.key is not None and self._active_keys.get(job.key) == job.id:
+                del self._active_keys[job.key]
+            if state == DONE:
+                self.completed += 1
+            elif state == FAILED:
+                self.failed += 1
+            else:
+                self.cancelled += 1
+
+    def _purge(self) -> None:
+        """Forget finished jobs older than the result TTL (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def poll(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """State, progress and (once done) result of a job, or None if unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.cancel_event.set()
+            for future in job.futures:
+                future.cancel()
+            return True
+
+    def cancel_owner(self, owner: Hashable) -> int:
+        """Cancel every unfinished job of an owner (e.g. a browser session)"""
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values() if job.owner == owner and job.state not in FINISHED_STATES]
+        return sum(1 for job_id in job_ids if self.cancel(job_id))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return {
+            'workers': self.workers,
+            'queued': states.count(QUEUED),
+            'running': states.count(RUNNING),
+            'queue_size': self.queue_size,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self, wait_for_jobs: bool = False) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.state not in FINISHED_STATES:
+                self.cancel(job.id)
+        self._threads.shutdown(wait=wait_for_jobs)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait_for_jobs, cancel_futures=True)
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Process-wide job runner; worker processes start with the first chunk"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
+
+
+def submit_job(work: Callable[[JobContext], Any], key: Optional[Hashable] = None,
+               owner: Optional[Hashable] = None) -> Optional[str]:
+    return get_job_runner().submit(work, key=key, owner=owner)
+
+
+def poll_job(job_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    return get_job_runner().poll(job_id) if job_id else None
+
+
+def cancel_job(job_id: str) -> bool:
+    return get_job_runner().cancel(job_id)
+
+
+def cancel_jobs(owner: Hashable) -> int:
+    """Cancel an owner's unfinished jobs; cheap when there are none"""
+    if _runner is None:
+        return 0
+    return _runner.cancel_owner(owner)
+
+
+def get_job_stats() -> Dict[str, Any]:
+    """Queue depth and outcomes of analytics jobs"""
+    if _runner is None:
+        return {'workers': ANALYTICS_WORKERS, 'queued': 0, 'running': 0, 'queue_size': ANALYTICS_JOB_QUEUE_SIZE,
+                'completed': 0, 'failed': 0, 'cancelled': 0, 'rejected': 0}
+    return _runner.stats()
@@ -0,0 +1,124 @@
+"""
+Vectorized numeric analytics for FormMind-AI
+Answer values are parsed into a NumPy float array in one pass, and
+histograms, quantiles and spread are computed on the array. Histograms
+keep the 'distribution' list format of get_question_analytics.
+"""
+from typing import Dict, Any, List, Iterable, Optional, Union
+import math
+import re
+import numpy as np
+
+# Answer text that counts as a number everywhere: parse_number here, and
+# "value ~ NUMBER_PATTERN" before a cast to double precision in SQL. ASCII
+# digits and whitespace only, nan/inf never match, and digit and exponent
+# lengths are bounded so the cast can neither overflow nor underflow.
+NUMBER_PATTERN = (r'^[ \t\n\r\f\v]*[-+]?([0-9]{1,200}(\.[0-9]{0,200})?|\.[0-9]{1,200})'
+                  r'([eE][-+]?[0-9]{1,2})?[ \t\n\r\f\v]*$')
+_number = re.compile(NUMBER_PATTERN)
+
+# Bin strategies understood by histogram(); an int means that many equal-width bins
+FIXED = 'fixed'
+STURGES = 'sturges'
+FREEDMAN_DIACONIS = 'fd'
+BIN_STRATEGIES = (FIXED, STURGES, FREEDMAN_DIACONIS)
+
+DEFAULT_BINS = 5
+BIN_STRATEGY_LABELS = {FIXED: f'{DEFAULT_BINS} equal bins', STURGES: 'Sturges', FREEDMAN_DIACONIS: 'Freedman-Diaconis'}
+# Upper bound for data-driven strategies, which grow with outliers (fd) or n
+MAX_BINS = 50
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Answer value as a float if its text matches NUMBER_PATTERN, else None"""
+    if value is None:
+        return None
+    text = value if isinstance(value, str) else str(value)
+    return float(text) if _number.search(text) else None
+
+
+def _to_float(value: Any) -> float:
+    number = parse_number(value)
+    return math.nan if number is None else number
+
+
+def parse_numbers(values: Iterable[Any]) -> np.ndarray:
+    """Answer values as a float array; values parse_number rejects are dropped"""
+    array = np.fromiter((_to_float(value) for value in values), dtype=float)
+    return array[np.isfinite(array)]
+
+
+def bin_count(array: np.ndarray, bins: Union[str, int] = FIXED) -> int:
+    """Number of equal-width bins for a non-empty array with distinct values"""
+    q1 = q3 = None
+    if bins == FREEDMAN_DIACONIS:
+        q1, q3 = np.quantile(array, [0.25, 0.75])
+    return summary_bin_count(bins, int(array.size), float(array.min()), float(array.max()), q1, q3)
+
+
+def summary_bin_count(bins: Union[str, int], count: int, low: float, high: float,
+                      q1: Optional[float] = None, q3: Optional[float] = None) -> int:
+    """bin_count() from count, range and quartiles (only 'fd' needs those), e.g. computed in SQL
+
+    Data-driven counts are capped at MAX_BINS before any edges are built,
+    since Freedman-Diaconis on a single far outlier asks for billions.
+    """
+    if isinstance(bins, int):
+        return max(bins, 1)
+    if bins == FIXED:
+        return DEFAULT_BINS
+    if bins == STURGES:
+        bin_total = math.ceil(math.log2(count)) + 1
+    elif bins == FREEDMAN_DIACONIS:
+        width = 2.0 * (q3 - q1) * count ** (-1.0 / 3.0)
+        # No spread in the middle half: fall back to Sturges (as numpy "auto" does)
+        if width <= 0:
+            return summary_bin_count(STURGES, count, low, high)
+        bin_total = math.ceil((high - low) / width)
+    else:
+        raise ValueError(f"Unknown bin strategy: {bins}")
+    return int(min(max(bin_total, 1), MAX_BINS))
+
+
+def histogram(array: np.ndarray, bins: Union[str, int] = FIXED) -> List[Dict[str, Any]]:
+    """Distribution rows ({'range', 'count'}); the last bin includes the maximum"""
+    if array.size < 2:
+        return []
+    low, high = array.min(), array.max()
+    if low == high:
+        return [{'range': f'{float(low)}', 'count': int(array.size)}]
+
+    counts, edges = np.histogram(array, bins=bin_count(array, bins))
+    return [
+        {'range': f'{start:.1f} - {end:.1f}', 'count': int(count)}
+        for start, end, count in zip(edges[:-1], edges[1:], counts)
+    ]
+
+
+def describe(values: Iterable[Any], bins: Union[str, int] = FIXED) -> Optional[Dict[str, Any]]:
+    """Count, min/max, mean, std, quartiles, IQR and histogram of answer values
+
+    Returns None when no value parses as a finite number.
+    """
+    return describe_array(parse_numbers(values), bins)
+
+
+def describe_array(array: np.ndarray, bins: Union[str, int] = FIXED) -> Optional[Dict[str, Any]]:
+    """describe() for an already parsed float array; NaN entries count as missing"""
+    array = array[np.isfinite(array)]
+    if array.size == 0:
+        return None
+
+    q1, median, q3 = np.quantile(array, [0.25, 0.5, 0.75])
+    return {
+        'count': int(array.size),
+        'min': float(array.min()),
+        'max': float(array.max()),
+        'mean': float(array.mean()),
+        'std': float(array.std()),
+        'median': float(median),
+        'q1': float(q1),
+        'q3': float(q3),
+        'iqr': float(q3 - q1),
+        'distribution': histogram(array, bins)
+    }
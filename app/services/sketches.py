@@ -0,0 +1,243 @@
+"""
+Mergeable sketches for FormMind-AI analytics
+
+KLLSketch - quantiles of numeric answers
+A KLL sketch (Karnin, Lang & Liberty, 2016) keeps a bounded sample of a
+numeric stream in levels of compactors; an item on level h stands for 2**h
+values. Sketches of disjoint streams merge into a sketch of their union,
+so per-day sketches combine into any time range or set of versions.
+
+Error bounds: with k items on the top level (default 200) the rank of a
+reported quantile is within about 1.7% of n of the true rank with 99%
+probability (the same figure Apache DataSketches documents for its KLL at
+k=200). Memory stays below 3*k items regardless of n. Until the first
+compaction (n < k) the sketch holds every value and answers exactly.
+
+HyperLogLog - distinct counts of respondents
+2**HLL_PRECISION registers each keep the longest run of leading zero bits
+seen among hashed items routed to them. Register-wise max merges sketches,
+so per-form, per-day sketches combine into tenant-wide or date-range
+counts. The standard error is 1.04 / sqrt(2**HLL_PRECISION), 1.6% at the
+default precision; small counts use linear counting and are near exact.
+"""
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+import hashlib
+import json
+import math
+import random
+
+import numpy as np
+
+DEFAULT_K = 200
+# Level capacities shrink by this factor per level below the top
+_CAPACITY_DECAY = 2.0 / 3.0
+# Smallest capacity a level may have
+_MIN_CAPACITY = 2
+
+
+class KLLSketch:
+    """Streaming quantile sketch with exact count, min and max"""
+
+    def __init__(self, k: int = DEFAULT_K, rng: Optional[random.Random] = None):
+        self.k = k
+        self.n = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.levels: List[List[float]] = [[]]
+        self._rng = rng or random.Random()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * _CAPACITY_DECAY ** depth)), _MIN_CAPACITY)
+
+    def _size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value: float) -> None:
+        self.n += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.levels[0].append(value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def extend(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.update(value)
+
+    def _compress(self) -> None:
+        """Compact full levels from the bottom up until the sketch fits"""
+        for level in range(len(self.levels)):
+            items = self.levels[level]
+            if len(items) < self._capacity(level):
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            # Keep every other item of the sorted level, starting at a random
+            # offset; the survivors move up a level and double in weight
+            items.sort()
+            keep_odd = len(items) % 2
+            leftover = [items.pop()] if keep_odd else []
+            offset = self._rng.randint(0, 1)
+            self.levels[level + 1].extend(items[offset::2])
+            self.levels[level] = leftover
+            if self._size() < self._max_size():
+                break
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """Fold another sketch into this one (in place); returns self"""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        while self._size() >= self._max_size():
+            self._compress()
+        return self
+
+    def weighted_items(self) -> List[Tuple[float, int]]:
+        """(value, weight) pairs sorted by value; weights sum to n"""
+        return sorted(
+            (value, 1 << level) for level, items in enumerate(self.levels) for value in items
+        )
+
+    def quantiles(self, fractions: Iterable[float]) -> List[Optional[float]]:
+        """Approximate values at the given ranks in [0, 1]; 0 and 1 give the exact min and max"""
+        fractions = list(fractions)
+        if self.n == 0:
+            return [None] * len(fractions)
+        items = self.weighted_items()
+        total = sum(weight for _, weight in items)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * total
+            cumulative = 0
+            answer = items[-1][0]
+            for value, weight in items:
+                cumulative += weight
+                if cumulative >= target:
+                    answer = value
+                    break
+            results.append(answer)
+        return results
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        return self.quantiles([fraction])[0]
+
+    def bin_counts(self, low: float, high: float, bins: int) -> Dict[int, int]:
+        """Approximate counts per equal-width bin of [low, high], keyed 1..bins
+
+        The last bin includes high, like analytics_engine's histogram.
+        """
+        counts: Dict[int, int] = {}
+        width = (high - low) / bins if high > low else 0.0
+        for value, weight in self.weighted_items():
+            if width == 0.0:
+                bucket = 1
+            else:
+                bucket = min(max(int((value - low) // width) + 1, 1), bins)
+            counts[bucket] = counts.get(bucket, 0) + weight
+        return counts
+
+    def to_json(self) -> str:
+        return json.dumps({'k': self.k, 'n': self.n, 'min': self.min, 'max': self.max, 'levels': self.levels},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str) -> 'KLLSketch':
+        state = json.loads(data)
+        sketch = cls(k=state['k'])
+        sketch.n = state['n']
+        sketch.min = state['min']
+        sketch.max = state['max']
+        sketch.levels = state['levels'] or [[]]
+        return sketch
+
+
+def merge_sketches(sketches: Iterable[KLLSketch], k: int = DEFAULT_K) -> KLLSketch:
+    """Union of several sketches as a new sketch"""
+    merged = KLLSketch(k=k)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+
+def respondent_key(user_id: Optional[int], guest_token: Optional[str]) -> Optional[str]:
+    """Identity a submission counts under for distinct respondents, or None if anonymous"""
+    if user_id is not None:
+        return f"user:{user_id}"
+    if guest_token:
+        return f"guest:{guest_token}"
+    return None
+
+
+class HyperLogLog:
+    """Distinct-count sketch over string items with a fixed number of registers"""
+
+    def __init__(self, registers: Optional[Iterable[int]] = None):
+        if registers is None:
+            self.registers = np.zeros(HLL_REGISTERS, dtype=np.int16)
+        else:
+            self.registers = np.asarray(list(registers), dtype=np.int16)
+            if self.registers.size != HLL_REGISTERS:
+                raise ValueError(f"Expected {HLL_REGISTERS} registers, got {self.registers.size}")
+
+    def add(self, item: str) -> None:
+        # 64-bit hash: the low bits pick a register, the rest give the rank
+        hashed = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed & (HLL_REGISTERS - 1)
+        remaining = hashed >> HLL_PRECISION
+        rank = (64 - HLL_PRECISION) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Fold another sketch into this one (in place); returns self"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def is_empty(self) -> bool:
+        return not self.registers.any()
+
+    def count(self) -> int:
+        """Estimated number of distinct items added"""
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_list(self) -> List[int]:
+        return self.registers.tolist()
+
+    def nonzero_registers(self) -> Dict[int, int]:
+        """{register index: rank} of the registers set so far, for merging into stored registers"""
+        indexes = np.flatnonzero(self.registers)
+        return dict(zip(indexes.tolist(), self.registers[indexes].tolist()))
+
+
+def merge_hyperloglogs(sketches: Iterable[HyperLogLog]) -> HyperLogLog:
+    """Union of several HyperLogLog sketches as a new sketch"""
+    merged = HyperLogLog()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,384 @@
+"""
+Columnar answer snapshots for FormMind-AI analytics
+A form version's answers are pivoted into one column per question and kept
+on local disk, memory-mapped on read and extended incrementally past a
+"last submission id" watermark:
+
+    <SNAPSHOT_DIR>/form_<form id>/v<version id>/meta.json
+    <SNAPSHOT_DIR>/form_<form id>/v<version id>/g<generation>/<column files>
+
+- submission ids and submitted_at (UTC epoch microseconds): int64 per row
+- number questions: float64 per row, NaN when missing or not a number
+- radio / dropdown: int32 dictionary code per row, -1 when missing
+- checkbox: int64 offsets (rows + 1) into a flat int32 code array
+- text questions: int64 offsets (rows + 1) into a UTF-8 blob
+
+meta.json is the commit point: it records the row count, the watermark,
+the choice dictionaries and the size of every file. Bytes past those sizes
+(an interrupted append) are truncated before the next append. A snapshot
+is rebuilt into a new generation when rows at or below the watermark
+appear or disappear (late commits, deleted submissions).
+"""
+from typing import Dict, Any, List, Optional, Iterable
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+
+from ..models import Submission, Answer, Question, FormVersion
+from .aggregates import parse_selections
+from .numeric_analytics import parse_number
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", "data/snapshots")
+# Submissions younger than this are left for the next refresh, so a transaction
+# that took a lower id but commits later is not skipped by the watermark
+SNAPSHOT_SETTLE_SECONDS = float(os.getenv("ANALYTICS_SNAPSHOT_SETTLE_SECONDS", "5"))
+SNAPSHOT_CHUNK = int(os.getenv("ANALYTICS_SNAPSHOT_CHUNK", "20000"))
+
+FORMAT_VERSION = 1
+NUMERIC, CHOICE, MULTI_CHOICE, TEXT = 'numeric', 'choice', 'multi_choice', 'text'
+_KINDS = {
+    'number': NUMERIC,
+    'radio': CHOICE,
+    'dropdown': CHOICE,
+    'checkbox': MULTI_CHOICE,
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# One refresh per snapshot at a time within the process
+_locks: Dict[int, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(form_version_id: int) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(form_version_id, threading.Lock())
+
+
+def _form_dir(form_id: int) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"form_{form_id}")
+
+
+def _version_dir(form_id: int, form_version_id: int) -> str:
+    return os.path.join(_form_dir(form_id), f"v{form_version_id}")
+
+
+def _column_files(column: Dict[str, Any]) -> Dict[str, str]:
+    """Role -> file name of a column's files"""
+    prefix = f"q{column['question_id']}"
+    if column['kind'] == NUMERIC:
+        return {'values': f"{prefix}.f8"}
+    if column['kind'] == CHOICE:
+        return {'codes': f"{prefix}.codes.i4"}
+    if column['kind'] == MULTI_CHOICE:
+        return {'offsets': f"{prefix}.offsets.i8", 'codes': f"{prefix}.codes.i4"}
+    return {'offsets': f"{prefix}.offsets.i8", 'blob': f"{prefix}.blob"}
+
+
+def _to_micros(submitted_at: Optional[datetime]) -> int:
+    if submitted_at is None:
+        return 0
+    return int((submitted_at.astimezone(timezone.utc) - _EPOCH) / timedelta(microseconds=1))
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a committed snapshot"""
+
+    def __init__(self, path: str, meta: Dict[str, Any]):
+        self.path = path
+        self.meta = meta
+        self.rows: int = meta['rows']
+        self.watermark: int = meta['watermark']
+        self.columns = {column['question_id']: column for column in meta['columns']}
+        self._generation_dir = os.path.join(path, f"g{meta['generation']}")
+
+    def _map(self, name: str, dtype) -> np.ndarray:
+        count = self.meta['sizes'].get(name, 0) // np.dtype(dtype).itemsize
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self._generation_dir, name), dtype=dtype, mode='r', shape=(count,))
+
+    @property
+    def submission_ids(self) -> np.ndarray:
+        return self._map('submission_ids.i8', np.int64)
+
+    @property
+    def submitted_at(self) -> np.ndarray:
+        """Submission times as UTC epoch microseconds"""
+        return self._map('submitted_at.i8', np.int64)
+
+    def numeric(self, question_id: int) -> np.ndarray:
+        """Float per row, NaN when the answer is missing or not a number"""
+        return self._map(_column_files(self.columns[question_id])['values'], np.float64)
+
+    def choice_counts(self, question_id: int) -> Dict[str, int]:
+        """Selections per option value (radio, dropdown and checkbox)"""
+        column = self.columns[question_id]
+        codes = self._map(_column_files(column)['codes'], np.int32)
+        codes = codes[codes >= 0]
+        counts = np.bincount(codes, minlength=len(column['dictionary']))
+        return {value: int(count) for value, count in zip(column['dictionary'], counts) if count}
+
+    def texts(self, question_id: int) -> List[str]:
+        """Answer text per row, '' when missing"""
+        files = _column_files(self.columns[question_id])
+        offsets = self._map(files['offsets'], np.int64)
+        if offsets.size == 0:
+            return []
+        blob = self._map(files['blob'], np.uint8)
+        data = blob.tobytes() if blob.size else b''
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(self.rows)]
+
+
+class _ColumnWriter:
+    """Buffers one chunk of rows per column, then appends them to the files"""
+
+    def __init__(self, column: Dict[str, Any], meta: Dict[str, Any]):
+        self.column = column
+        self.files = _column_files(column)
+        self.codes = {value: code for code, value in enumerate(column['dictionary'])}
+        # Running end offset of the variable-length data (codes or blob bytes)
+        if column['kind'] == MULTI_CHOICE:
+            self.next_offset = meta['sizes'].get(self.files['codes'], 0) // 4
+        elif column['kind'] == TEXT:
+            self.next_offset = meta['sizes'].get(self.files['blob'], 0)
+        self.reset()
+
+    def reset(self) -> None:
+        self.values: List[Any] = []
+        self.offsets: List[int] = []
+        self.payload: List[Any] = []
+
+    def _code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.column['dictionary'])
+            self.column['dictionary'].append(value)
+        return code
+
+    def add(self, value: Optional[str]) -> None:
+        kind = self.column['kind']
+        if kind == NUMERIC:
+            number = parse_number(value)
+            self.values.append(np.nan if number is None else number)
+        elif kind == CHOICE:
+            self.values.append(-1 if value is None else self._code(value))
+        elif kind == MULTI_CHOICE:
+            selections = [self._code(selection) for selection in parse_selections('checkbox', value)]
+            self.payload.extend(selections)
+            self.next_offset += len(selections)
+            self.offsets.append(self.next_offset)
+        else:
+            encoded = (value or '').encode('utf-8')
+            self.payload.append(encoded)
+            self.next_offset += len(encoded)
+            self.offsets.append(self.next_offset)
+
+    def flush(self, directory: str, sizes: Dict[str, int]) -> None:
+        kind = self.column['kind']
+        if kind == NUMERIC:
+            chunks = {self.files['values']: np.asarray(self.values, dtype=np.float64).tobytes()}
+        elif kind == CHOICE:
+            chunks = {self.files['codes']: np.asarray(self.values, dtype=np.int32).tobytes()}
+        elif kind == MULTI_CHOICE:
+            chunks = {
+                self.files['offsets']: np.asarray(self.offsets, dtype=np.int64).tobytes(),
+                self.files['codes']: np.asarray(self.payload, dtype=np.int32).tobytes(),
+            }
+        else:
+            chunks = {
+                self.files['offsets']: np.asarray(self.offsets, dtype=np.int64).tobytes(),
+                self.files['blob']: b''.join(self.payload),
+            }
+        for name, data in chunks.items():
+            _append(directory, name, data, sizes)
+        self.reset()
+
+
+def _append(directory: str, name: str, data: bytes, sizes: Dict[str, int]) -> None:
+    if data:
+        with open(os.path.join(directory, name), 'ab') as handle:
+            handle.write(data)
+    sizes[name] = sizes.get(name, 0) + len(data)
+
+
+def _read_meta(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as handle:
+            meta = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('format') == FORMAT_VERSION else None
+
+
+def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+    tmp = os.path.join(path, 'meta.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as handle:
+        json.dump(meta, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+
+def _new_generation(session: Session, path: str, form_id: int, form_version_id: int,
+                    generation: int) -> Dict[str, Any]:
+    """Empty snapshot meta with one column per question of the version, in a fresh directory"""
+    directory = os.path.join(path, f"g{generation}")
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    columns = []
+    sizes = {}
+    for question_id, field_type in session.query(Question.id, Question.field_type).filter(
+        Question.form_version_id == form_version_id
+    ).order_by(Question.order_index, Question.id):
+        column = {'question_id': question_id, 'field_type': field_type,
+                  'kind': _KINDS.get(field_type, TEXT), 'dictionary': []}
+        columns.append(column)
+        offsets = _column_files(column).get('offsets')
+        if offsets:
+            _append(directory, offsets, np.zeros(1, dtype=np.int64).tobytes(), sizes)
+    return {
+        'format': FORMAT_VERSION, 'form_id': form_id, 'form_version_id': form_version_id,
+        'generation': generation, 'rows': 0, 'watermark': 0, 'columns': columns, 'sizes': sizes,
+    }
+
+
+def _truncate_uncommitted(directory: str, meta: Dict[str, Any]) -> None:
+    for name, size in meta['sizes'].items():
+        file_path = os.path.join(directory, name)
+        if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+            with open(file_path, 'r+b') as handle:
+                handle.truncate(size)
+
+
+def _remove_old_generations(path: str, keep: int) -> None:
+    for entry in os.listdir(path):
+        if entry.startswith('g') and entry != f"g{keep}":
+            # Best effort: another reader may still have files of it mapped
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+def refresh_snapshot(session: Session, form_version_id: int) -> Optional[Snapshot]:
+    """Bring a version's snapshot up to date and return it (None if the version does not exist)"""
+    form_id = session.query(FormVersion.form_id).filter(FormVersion.id == form_version_id).scalar()
+    if form_id is None:
+        return None
+    path = _version_dir(form_id, form_version_id)
+
+    with _lock_for(form_version_id):
+        os.makedirs(path, exist_ok=True)
+        meta = _read_meta(path)
+        if meta is not None and meta['rows']:
+            settled = session.query(func.count(Submission.id)).filter(
+                Submission.form_version_id == form_version_id, Submission.id <= meta['watermark']
+            ).scalar()
+            if settled != meta['rows']:
+                logger.info(f"Rebuilding snapshot of form version {form_version_id}: "
+                            f"{settled} submissions at or below the watermark, {meta['rows']} in the snapshot")
+                meta = None
+        if meta is None:
+            previous = _read_meta(path)
+            generation = previous['generation'] + 1 if previous else 1
+            meta = _new_generation(session, path, form_id, form_version_id, generation)
+            _write_meta(path, meta)
+            _remove_old_generations(path, generation)
+
+        directory = os.path.join(path, f"g{meta['generation']}")
+        _truncate_uncommitted(directory, meta)
+        appended = _append_new_rows(session, directory, meta)
+        if appended:
+            logger.info(f"Appended {appended} submissions to snapshot of form version {form_version_id}")
+        return Snapshot(path, meta)
+
+
+def _append_new_rows(session: Session, directory: str, meta: Dict[str, Any]) -> int:
+    """Append settled submissions past the watermark, committing meta after every chunk"""
+    form_version_id = meta['form_version_id']
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS)
+    # Stop below the first unsettled submission, so no lower id can still be in flight
+    unsettled = session.query(func.min(Submission.id)).filter(
+        Submission.form_version_id == form_version_id,
+        Submission.id > meta['watermark'],
+        Submission.submitted_at >= cutoff
+    ).scalar()
+
+    writers = {column['question_id']: _ColumnWriter(column, meta) for column in meta['columns']}
+    rows = session.query(
+        Submission.id, Submission.submitted_at, Answer.question_id, Answer.value
+    ).outerjoin(
+        Answer, Answer.submission_id == Submission.id
+    ).filter(
+        Submission.form_version_id == form_version_id, Submission.id > meta['watermark']
+    )
+    if unsettled is not None:
+        rows = rows.filter(Submission.id < unsettled)
+
+    appended = 0
+    ids: List[int] = []
+    times: List[int] = []
+    answers: Dict[int, str] = {}
+
+    def finish_row() -> None:
+        for question_id, writer in writers.items():
+            writer.add(answers.get(question_id))
+        answers.clear()
+
+    def commit_chunk() -> None:
+        sizes = dict(meta['sizes'])
+        _append(directory, 'submission_ids.i8', np.asarray(ids, dtype=np.int64).tobytes(), sizes)
+        _append(directory, 'submitted_at.i8', np.asarray(times, dtype=np.int64).tobytes(), sizes)
+        for writer in writers.values():
+            writer.flush(directory, sizes)
+        meta['sizes'] = sizes
+        meta['rows'] += len(ids)
+        meta['watermark'] = ids[-1]
+        _write_meta(os.path.dirname(directory), meta)
+        ids.clear()
+        times.clear()
+
+    for submission_id, submitted_at, question_id, value in rows.order_by(Submission.id).execution_options(
+        yield_per=SNAPSHOT_CHUNK
+    ):
+        if not ids or ids[-1] != submission_id:
+            if ids:
+                finish_row()
+                if len(ids) >= SNAPSHOT_CHUNK:
+                    commit_chunk()
+            ids.append(submission_id)
+            times.append(_to_micros(submitted_at))
+            appended += 1
+        if question_id is not None:
+            answers[question_id] = value
+    if ids:
+        finish_row()
+        commit_chunk()
+    return appended
+
+
+def refresh_form_snapshots(session: Session, form_id: int,
+                           form_version_ids: Optional[Iterable[int]] = None) -> Dict[int, Snapshot]:
+    """Refresh the snapshots of a form's versions (all, or the given ones)"""
+    if form_version_ids is None:
+        form_version_ids = [
+            version_id for (version_id,) in
+            session.query(FormVersion.id).filter(FormVersion.form_id == form_id).order_by(FormVersion.id)
+        ]
+    snapshots = {}
+    for form_version_id in form_version_ids:
+        snapshot = refresh_snapshot(session, form_version_id)
+        if snapshot is not None:
+            snapshots[form_version_id] = snapshot
+    return snapshots
+
+
+def remove_form_snapshots(form_id: int) -> None:
+    """Delete a form's snapshot files (best effort)"""
+    shutil.rmtree(_form_dir(form_id), ignore_errors=True)
@@ -0,0 +1,374 @@
+"""
+Write-behind submission queue for FormMind-AI
+Public form submissions are checked against the cached form schema and
+validation plan, appended to a durable local SQLite (WAL) journal and
+acknowledged immediately. A background writer drains the journal into
+PostgreSQL in batches, so a brief database outage delays responses instead
+of losing them.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from sqlalchemy.exc import (
+    DBAPIError, DataError, IntegrityError, OperationalError, InterfaceError, TimeoutError as PoolTimeoutError
+)
+
+from ..db import get_db_session, profile_operation
+from .submissions import SubmissionsService
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_WRITE_BEHIND = os.getenv("SUBMISSION_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+SUBMISSION_JOURNAL_PATH = os.getenv("SUBMISSION_JOURNAL_PATH", "data/submission_journal.db")
+SUBMISSION_DRAIN_BATCH = int(os.getenv("SUBMISSION_DRAIN_BATCH", "500"))
+SUBMISSION_DRAIN_INTERVAL = float(os.getenv("SUBMISSION_DRAIN_INTERVAL", "1.0"))
+SUBMISSION_RETRY_MAX_SECONDS = float(os.getenv("SUBMISSION_RETRY_MAX_SECONDS", "60"))
+
+# A claimed entry that is neither completed nor released within the lease
+# (e.g. the draining process died) becomes claimable again
+CLAIM_LEASE_SECONDS = 300
+
+
+def _encode(item: Dict[str, Any]) -> str:
+    payload = dict(item)
+    if isinstance(payload.get('submitted_at'), datetime):
+        payload['submitted_at'] = payload['submitted_at'].isoformat()
+    payload['answers'] = {str(question_id): value for question_id, value in (item.get('answers') or {}).items()}
+    # Dates and times from the form widgets are stored the way Answer.value stores them
+    return json.dumps(payload, default=str)
+
+
+def _decode(payload: str) -> Dict[str, Any]:
+    item = json.loads(payload)
+    if item.get('submitted_at'):
+        item['submitted_at'] = datetime.fromisoformat(item['submitted_at'])
+    item['answers'] = {int(question_id): value for question_id, value in (item.get('answers') or {}).items()}
+    return item
+
+
+def _is_transient(error: Exception) -> bool:
+    """Errors that say the database is unreachable rather than that the batch is bad"""
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+def _is_row_error(error: Exception) -> bool:
+    """Errors caused by the data of one submission rather than by the schema or permissions"""
+    return isinstance(error, (IntegrityError, DataError))
+
+
+class SubmissionJournal:
+    """Durable SQLite journal of accepted submissions awaiting PostgreSQL"""
+
+    def __init__(self, path: str = SUBMISSION_JOURNAL_PATH):
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit mode; multi-statement work uses explicit BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # The user is told the response is saved once append() returns
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS submission_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    enqueued_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    claimed_until REAL,
+                    dead INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_submission_journal_dead ON submission_journal (dead, id)"
+            )
+
+    def append(self, item: Dict[str, Any]) -> int:
+        """Durably record one submission; returns its journal id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO submission_journal (payload, enqueued_at) VALUES (?, ?)",
+                (_encode(item), time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int, lease_seconds: float = CLAIM_LEASE_SECONDS) -> List[Tuple[int, Dict[str, Any]]]:
+        """Lease the oldest pending entries so no other drainer picks them up"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute("""
+                    UPDATE submission_journal
+                    SET claimed_until = ?, attempts = attempts + 1
+                    WHERE id IN (
+                        SELECT id FROM submission_journal
+                        WHERE dead = 0 AND (claimed_until IS NULL OR claimed_until < ?)
+                        ORDER BY id LIMIT ?
+                    )
+                    RETURNING id, payload
+                """, (now + lease_seconds, now, limit)).fetchall()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(entry_id, _decode(payload)) for entry_id, payload in sorted(rows)]
+
+    def complete(self, entry_ids: List[int]) -> None:
+        """Forget entries that are now stored in PostgreSQL"""
+        if not entry_ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM submission_journal WHERE id = ?", [(i,) for i in entry_ids])
+
+    def release(self, entry_ids: List[int], error: str) -> None:
+        """Return claimed entries to the queue after a failed attempt"""
+        if not entry_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE submission_journal SET claimed_until = NULL, last_error = ? WHERE id = ?",
+                [(error, i) for i in entry_ids]
+            )
+
+    def dead_letter(self, errors: Dict[int, str]) -> None:
+        """Park entries PostgreSQL will never accept, keeping them for inspection"""
+        if not errors:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE submission_journal SET dead = 1, claimed_until = NULL, last_error = ? WHERE id = ?",
+                [(error, entry_id) for entry_id, error in errors.items()]
+            )
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Rejected entries with their last error, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, enqueued_at, attempts, last_error FROM submission_journal "
+                "WHERE dead = 1 ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            {'id': entry_id, 'submission': _decode(payload), 'enqueued_at': datetime.fromtimestamp(enqueued_at),
+             'attempts': attempts, 'error': last_error}
+            for entry_id, payload, enqueued_at, attempts, last_error in rows
+        ]
+
+    def requeue_dead(self) -> int:
+        """Give dead-lettered entries another try (e.g. after reopening a form)"""
+        with self._lock:
+            cursor = self._conn.execute("UPDATE submission_journal SET dead = 0 WHERE dead = 1")
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, dead letters and the age of the oldest pending entry"""
+        with self._lock:
+            pending, dead, oldest = self._conn.execute("""
+                SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0),
+                       MIN(CASE WHEN dead = 0 THEN enqueued_at END)
+                FROM submission_journal
+            """).fetchone()
+        return {
+            'pending': pending,
+            'dead': dead,
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SubmissionWriter:
+    """Background thread draining the journal into PostgreSQL in batches"""
+
+    def __init__(self, journal: SubmissionJournal, batch_size: int = SUBMISSION_DRAIN_BATCH,
+                 interval: float = SUBMISSION_DRAIN_INTERVAL):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.interval = interval
+        self.drained = 0
+        self.rejected = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.alert: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Submission writer started (journal {self.journal.path})")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wake(self) -> None:
+        """Drain now instead of waiting for the next interval (not while backing off)"""
+        if not self.consecutive_failures:
+            self._wake.set()
+
+    def drain_once(self) -> int:
+        """Write one batch; returns the number of entries taken off the queue
+
+        Raises when the database is unreachable or refuses the whole batch
+        (e.g. a schema or permission error); the batch stays journaled.
+        """
+        entries = self.journal.claim(self.batch_size)
+        if not entries:
+            return 0
+        with profile_operation("SubmissionWriter.drain"):
+            self._write(entries)
+        return len(entries)
+
+    def _write(self, entries: List[Tuple[int, Dict[str, Any]]]) -> None:
+        entry_ids = [entry_id for entry_id, _ in entries]
+        try:
+            with get_db_session() as session:
+                # Answers were checked before journaling; checked again here
+                # in case the plan could not be loaded then
+                results = SubmissionsService.ingest_batch(session, [item for _, item in entries])
+        except Exception as e:
+            if _is_transient(e):
+                self.journal.release(entry_ids, str(e))
+                raise
+            if not _is_row_error(e):
+                # A schema or permission problem would reject every entry; keep them pending
+                self.journal.release(entry_ids, str(e))
+                self.alert = str(e)
+                logger.critical(f"Submission writer cannot store journaled submissions, "
+                                f"{len(entries)} entries left pending: {e}")
+                raise
+            if len(entries) > 1:
+                # A bad row fails the whole batch; retry one by one to isolate it
+                logger.warning(f"Submission batch of {len(entries)} failed ({e}); retrying individually")
+                for position, entry in enumerate(entries):
+                    try:
+                        self._write([entry])
+                    except Exception:
+                        self.journal.release(entry_ids[position + 1:], str(e))
+                        raise
+                return
+            logger.error(f"Dead-lettering journal entry {entry_ids[0]}: {e}")
+            self.journal.dead_letter({entry_ids[0]: str(e)})
+            self.rejected += 1
+            return
+
+        written = [entry_id for entry_id, result in zip(entry_ids, results) if result['success']]
+        rejected = {
+            entry_id: "; ".join(result['errors'])
+            for entry_id, result in zip(entry_ids, results) if not result['success']
+        }
+        self.journal.complete(written)
+        self.journal.dead_letter(rejected)
+        self.alert = None
+        self.drained += len(written)
+        self.rejected += len(rejected)
+        if rejected:
+            logger.warning(f"Dead-lettered {len(rejected)} journaled submissions")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            delay = self.interval
+            try:
+                drained = self.drain_once()
+                self.consecutive_failures = 0
+                if drained >= self.batch_size:
+                    continue  # Backlog: keep going without waiting
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                delay = min(self.interval * 2 ** self.consecutive_failures, SUBMISSION_RETRY_MAX_SECONDS)
+                logger.warning(f"Submission writer could not write a batch, retrying in {delay:.0f}s: {e}")
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'drained': self.drained,
+            'rejected': self.rejected,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'alert': self.alert,
+        }
+
+
+_writer: Optional[SubmissionWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_submission_writer() -> SubmissionWriter:
+    """Process-wide writer over the configured journal, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SubmissionWriter(SubmissionJournal(SUBMISSION_JOURNAL_PATH))
+        _writer.start()
+        return _writer
+
+
+def resume_submission_writer() -> None:
+    """Start draining at startup when write-behind is on or a journal was left behind"""
+    if SUBMISSION_WRITE_BEHIND or os.path.exists(SUBMISSION_JOURNAL_PATH):
+        try:
+            get_submission_writer()
+        except Exception as e:
+            logger.error(f"Could not start submission writer: {e}")
+
+
+def enqueue_submission(form: Dict[str, Any], answers: Dict[int, Any], user_id: Optional[int] = None,
+                       ip_address: Optional[str] = None) -> Tuple[Optional[int], List[str]]:
+    """Check and journal a submission for background writing
+
+    form is the public form schema the respondent filled in. Returns the
+    journal id (None if not journaled) and the errors that rejected it,
+    including the journal itself failing.
+    """
+    submitted_at = datetime.now()
+    try:
+        errors = SubmissionsService.precheck_submission(form, answers, user_id, ip_address, submitted_at)
+    except Exception as e:
+        # Plan not cached and the database unreachable: the writer validates on drain
+        logger.warning(f"Could not pre-check submission for form {form['id']}, journaling unchecked: {e}")
+        errors = []
+    if errors:
+        return None, errors
+
+    try:
+        writer = get_submission_writer()
+        entry_id = writer.journal.append({
+            'form_id': form['id'],
+            'answers': answers,
+            'user_id': user_id,
+            'ip_address': ip_address,
+            'submitted_at': submitted_at,
+        })
+        writer.wake()
+        return entry_id, []
+    except Exception as e:
+        logger.error(f"Error journaling submission for form {form['id']}: {e}")
+        return None, ["Your response could not be saved; please try again"]
+
+
+def get_submission_queue_stats() -> Dict[str, Any]:
+    """Journal depth and writer progress"""
+    if _writer is None:
+        return {'pending': 0, 'dead': 0, 'oldest_pending_seconds': 0.0, 'running': False}
+    return {**_writer.journal.stats(), **_writer.stats()}
@@ -4,142 +4,181 @@ Handles form submissions, validation, single-submission enforcement, and submiss
 """
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
+import json
 import logging
+import os
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, desc, func
+from sqlalchemy import and_, case, desc, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from ..models import Form, FormVersion, Question, QuestionOption, Submission, Answer, User
-from ..db import get_db_session
+from ..db import get_db_session, get_read_session, profiled
+from .validators import get_validation_plans
+from .form_schema import get_form_schema
+from .aggregates import record_submission_aggregates
+from .cache import LRUCache
+from .tenant_dashboard import invalidate_tenant_dashboard
 
 logger = logging.getLogger(__name__)
 
+SINGLE_SUBMISSION_CACHE_TTL = float(os.getenv("SINGLE_SUBMISSION_CACHE_TTL", "600"))
+
+# Respondents known to have used their one submission, keyed by _submitter_key().
+# Only filled from unique-index conflicts, i.e. rows that are committed.
+_known_submitters = LRUCache(maxsize=100_000, ttl=SINGLE_SUBMISSION_CACHE_TTL, name="single_submitters")
+
+
+def _submitter_key(form_id: int, user_id: Optional[int], guest_token: Optional[str]) -> Optional[Tuple]:
+    """Identity a single-submission form counts responses by (None if anonymous)"""
+    if user_id:
+        return (form_id, 'user', user_id)
+    if guest_token:
+        return (form_id, 'guest', guest_token)
+    return None
+
+
+def _duplicate_message(key: Tuple) -> str:
+    if key[1] == 'user':
+        return "You have already submitted this form"
+    return "A submission from this IP address already exists"
+
 
 class SubmissionsService:
     """Service class for form submission operations"""
     
     @staticmethod
-    def validate_submission_window(form: Form) -> Tuple[bool, str]:
+    def validate_submission_window(form: Form, at: Optional[datetime] = None) -> Tuple[bool, str]:
         """Check if form is accepting submissions based on time window"""
-        now = datetime.now()
+        return SubmissionsService.check_submission_window(form.submission_start, form.submission_end, at)
+    
+    @staticmethod
+    def check_submission_window(start: Optional[datetime], end: Optional[datetime],
+                                at: Optional[datetime] = None) -> Tuple[bool, str]:
+        """Check a submission time against a form's submission_start and submission_end"""
+        now = at or datetime.now()
+        window_bound = start or end
+        if window_bound is not None and window_bound.tzinfo is not None and now.tzinfo is None:
+            now = now.astimezone()  # Compare local wall-clock time against timestamptz columns
         
-        if form.submission_start and now < form.submission_start:
-            return False, f"Submission period starts on {form.submission_start.strftime('%Y-%m-%d %H:%M')}"
+        if start and now < start:
+            return False, f"Submission period starts on {start.strftime('%Y-%m-%d %H:%M')}"
         
-        if form.submission_end and now > form.submission_end:
-            return False, f"Submission period ended on {form.submission_end.strftime('%Y-%m-%d %H:%M')}"
+        if end and now > end:
+            return False, f"Submission period ended on {end.strftime('%Y-%m-%d %H:%M')}"
         
         return True, "Submission window is open"
     
     @staticmethod
-    def check_single_submission_rule(form: Form, user_id: Optional[int] = None, 
-                                   ip_address: Optional[str] = None) -> Tuple[bool, str]:
-        """Check if user can submit based on single submission rules"""
-        if not form.single_submission:
-            return True, "Multiple submissions allowed"
+    def precheck_submission(form: Dict[str, Any], answers: Dict[int, Any], user_id: Optional[int] = None,
+                            ip_address: Optional[str] = None, at: Optional[datetime] = None) -> List[str]:
+        """Errors that reject a submission before it is journaled for write-behind
         
-        try:
-            with get_db_session() as session:
-                # Check for existing submissions
-                query = session.query(Submission).filter(Submission.form_id == form.id)
-                
-                if user_id:
-                    # For authenticated users, check by user_id
-                    existing = query.filter(Submission.user_id == user_id).first()
-                    if existing:
-                        return False, "You have already submitted this form"
-                
-                elif ip_address:
-                    # For anonymous users, check by guest_token (IP address)
-                    existing = query.filter(Submission.guest_token == ip_address).first()
-                    if existing:
-                        return False, "A submission from this IP address already exists"
-                
-                return True, "Submission allowed"
-                
-        except Exception as e:
-            logger.error(f"Error checking single submission rule: {e}")
-            return False, "Error validating submission rules"
+        form is a public form schema (see get_form_schema). Checks the
+        submission window, respondents known to have used a single-submission
+        form and the answers against the version's validation plan. Needs no
+        database work when the plan is cached; raises when it cannot be loaded.
+        """
+        submitter_key = _submitter_key(form['id'], user_id, ip_address)
+        if submitter_key is not None and submitter_key in _known_submitters:
+            return [_duplicate_message(submitter_key)]
+        
+        window_valid, window_message = SubmissionsService.check_submission_window(
+            form.get('submission_start'), form.get('submission_end'), at
+        )
+        if not window_valid:
+            return [window_message]
+        
+        version_id = form.get('version_id')
+        if not version_id:
+            return ["Form version not found"]
+        with get_db_session() as session:
+            plan = get_validation_plans(session, [version_id])[version_id]
+        return plan.validate({f"question_{question_id}": value for question_id, value in answers.items()})
     
     @staticmethod
     def validate_submission_data(form_version_id: int, submission_data: Dict[str, Any]) -> Tuple[bool, List[str]]:
-        """Validate submission data against form questions"""
-        errors = []
+        """Validate submission data against form questions
         
+        Uses the compiled plan cached for the form version. The session only
+        checks out a connection on a cache miss, so a hit does no database work.
+        """
         try:
             with get_db_session() as session:
-                # Get all questions for this form version
-                questions = session.query(Question).filter(
-                    Question.form_version_id == form_version_id
-                ).order_by(Question.order_index).all()
-                
-                for question in questions:
-                    field_key = f"question_{question.id}"
-                    value = submission_data.get(field_key)
-                    
-                    # Check required fields
-                    if question.required and (value is None or str(value).strip() == ""):
-                        errors.append(f"Question '{question.label}' is required")
-                        continue
-                    
-                    if value is None or str(value).strip() == "":
-                        continue  # Skip validation for empty optional fields
-                    
-                    # Type-specific validation
-                    if question.field_type == "number":
-                        try:
-                            num_value = float(value)
-                            if question.validation_min is not None and num_value < question.validation_min:
-                                errors.append(f"'{question.label}' must be at least {question.validation_min}")
-                            if question.validation_max is not None and num_value > question.validation_max:
-                                errors.append(f"'{question.label}' must be at most {question.validation_max}")
-                        except ValueError:
-                            errors.append(f"'{question.label}' must be a valid number")
-                    
-                    elif question.field_type == "email":
-                        if "@" not in str(value) or "." not in str(value):
-                            errors.append(f"'{question.label}' must be a valid email address")
-                    
-                    elif question.field_type in ["short_text", "long_text"]:
-                        text_length = len(str(value))
-                        if question.validation_min is not None and text_length < question.validation_min:
-                            errors.append(f"'{question.label}' must be at least {question.validation_min} characters")
-                        if question.validation_max is not None and text_length > question.validation_max:
-                            errors.append(f"'{question.label}' must be at most {question.validation_max} characters")
-                    
-                    elif question.field_type in ["radio", "dropdown"]:
-                        # Validate choice options
-                        valid_options = session.query(QuestionOption.value).filter(
-                            QuestionOption.question_id == question.id
-                        ).all()
-                        valid_values = [opt[0] for opt in valid_options]
-                        
-                        if str(value) not in valid_values:
-                            errors.append(f"'{question.label}' has an invalid selection")
-                    
-                    elif question.field_type == "checkbox":
-                        # Validate multiple choice options
-                        if isinstance(value, list):
-                            valid_options = session.query(QuestionOption.value).filter(
-                                QuestionOption.question_id == question.id
-                            ).all()
-                            valid_values = [opt[0] for opt in valid_options]
-                            
-                            for selected_value in value:
-                                if str(selected_value) not in valid_values:
-                                    errors.append(f"'{question.label}' has an invalid selection: {selected_value}")
-                        else:
-                            errors.append(f"'{question.label}' must be a list for checkbox type")
-                
-                return len(errors) == 0, errors
+                plan = get_validation_plans(session, [form_version_id])[form_version_id]
+            errors = plan.validate(submission_data)
+            return len(errors) == 0, errors
                 
         except Exception as e:
             logger.error(f"Error validating submission data: {e}")
             return False, ["Error validating submission data"]
     
     @staticmethod
+    def _serialize_answer(value: Any) -> Optional[str]:
+        """Convert an answer to its stored text form (None for empty answers)"""
+        if value is None or value == "":
+            return None
+        if isinstance(value, (list, tuple)):
+            return ", ".join(str(v) for v in value)
+        return str(value)
+    
+    @staticmethod
+    def _insert_answers(session: Session, answer_rows: List[Dict[str, Any]]) -> None:
+        """Insert answer rows with batched multi-row INSERT statements"""
+        if answer_rows:
+            session.execute(insert(Answer), answer_rows)
+    
+    @staticmethod
+    def _insert_submission(session: Session, form: Form, row: Dict[str, Any]) -> Optional[int]:
+        """Insert one submission; None if the respondent already used a single-submission form
+        
+        The partial unique indexes on submissions make this race-free and
+        need no SELECT beforehand: a duplicate is skipped by ON CONFLICT.
+        """
+        row = dict(row, enforce_single=bool(form.single_submission))
+        submission_id = session.execute(
+            pg_insert(Submission).values(**row).on_conflict_do_nothing().returning(Submission.id)
+        ).scalar()
+        if submission_id is None:
+            key = _submitter_key(row['form_id'], row.get('user_id'), row.get('guest_token'))
+            if key is not None:
+                _known_submitters.set(key, True)
+        return submission_id
+    
+    @staticmethod
+    def sync_single_submission_flags(session: Session, form_id: int, enabled: bool) -> None:
+        """Re-stamp enforce_single after a form's single_submission setting changes
+        
+        When enabled, each respondent's earliest submission becomes the one that counts.
+        """
+        session.execute(
+            update(Submission)
+            .where(and_(Submission.form_id == form_id, Submission.enforce_single == True))
+            .values(enforce_single=False)
+        )
+        if enabled:
+            identity = case((Submission.user_id.is_(None), Submission.guest_token))
+            first_ids = select(func.min(Submission.id)).where(
+                and_(
+                    Submission.form_id == form_id,
+                    (Submission.user_id.isnot(None)) | (Submission.guest_token.isnot(None))
+                )
+            ).group_by(Submission.user_id, identity)
+            session.execute(
+                update(Submission).where(Submission.id.in_(first_ids)).values(enforce_single=True)
+            )
+        else:
+            _known_submitters.pop_where(lambda key, _: key[0] == form_id)
+    
+    @staticmethod
+    @profiled()
     def submit_form(form_id: int, submission_data: Dict[str, Any], 
                    user_id: Optional[int] = None, ip_address: Optional[str] = None) -> Tuple[bool, str, Optional[int]]:
         """Submit form with full validation and rule enforcement"""
+        # Repeat attempts by a known respondent are refused without touching the database
+        submitter_key = _submitter_key(form_id, user_id, ip_address)
+        if submitter_key is not None and submitter_key in _known_submitters:
+            return False, _duplicate_message(submitter_key), None
+        
         try:
             with get_db_session() as session:
                 # Get form details
@@ -156,13 +195,6 @@ class SubmissionsService:
                 if not window_valid:
                     return False, window_message, None
                 
-                # Check single submission rules
-                single_valid, single_message = SubmissionsService.check_single_submission_rule(
-                    form, user_id, ip_address
-                )
-                if not single_valid:
-                    return False, single_message, None
-                
                 # Get active form version
                 active_version = session.query(FormVersion).filter(
                     and_(FormVersion.form_id == form_id, FormVersion.is_active == True)
@@ -172,29 +204,26 @@ class SubmissionsService:
                     return False, "Form version not found", None
                 
                 # Validate submission data
-                data_valid, validation_errors = SubmissionsService.validate_submission_data(
-                    active_version.id, submission_data
-                )
-                if not data_valid:
+                plan = get_validation_plans(session, [active_version.id])[active_version.id]
+                validation_errors = plan.validate(submission_data)
+                if validation_errors:
                     return False, "; ".join(validation_errors), None
                 
-                # Create submission record
-                submission = Submission(
-                    form_id=form_id,
-                    form_version_id=active_version.id,
-                    user_id=user_id,
-                    ip_address=ip_address,
-                    submitted_at=datetime.now()
-                )
-                session.add(submission)
-                session.flush()  # Get submission ID
+                # Create submission record; the single-submission rule is enforced by the insert
+                submitted_at = datetime.now()
+                submission_id = SubmissionsService._insert_submission(session, form, {
+                    'form_id': form_id,
+                    'form_version_id': active_version.id,
+                    'user_id': user_id,
+                    'guest_token': ip_address,
+                    'submitted_at': submitted_at
+                })
+                if submission_id is None:
+                    return False, _duplicate_message(submitter_key), None
                 
                 # Store answers
-                questions = session.query(Question).filter(
-                    Question.form_version_id == active_version.id
-                ).all()
-                
-                for question in questions:
+                answer_rows = []
+                for question in plan.questions:
                     field_key = f"question_{question.id}"
                     value = submission_data.get(field_key)
                     
@@ -202,30 +231,33 @@ class SubmissionsService:
                         # Handle different field types
                         if question.field_type == "checkbox" and isinstance(value, list):
                             # Store as JSON string for multiple values
-                            import json
                             value_str = json.dumps(value)
                         else:
                             value_str = str(value)
                         
-                        answer = Answer(
-                            submission_id=submission.id,
-                            question_id=question.id,
-                            value=value_str
-                        )
-                        session.add(answer)
-                
-                logger.info(f"Created submission {submission.id} for form {form_id}")
-                return True, "Submission successful", submission.id
+                        answer_rows.append({
+                            'submission_id': submission_id,
+                            'question_id': question.id,
+                            'lineage_key': question.lineage_key,
+                            'value': value_str
+                        })
+                SubmissionsService._insert_answers(session, answer_rows)
+                record_submission_aggregates(session, [{'submission_id': submission_id, 'form_id': form_id}])
+                invalidate_tenant_dashboard(form.tenant_id, session)
+                
+                logger.info(f"Created submission {submission_id} for form {form_id}")
+                return True, "Submission successful", submission_id
                 
         except Exception as e:
             logger.error(f"Error submitting form {form_id}: {e}")
             return False, f"Error processing submission: {str(e)}", None
     
     @staticmethod
+    @profiled()
     def get_form_submissions(form_id: int, user_id: int, user_role: str) -> List[Dict[str, Any]]:
         """Get submissions for a form with access control"""
         try:
-            with get_db_session() as session:
+            with get_read_session(user_id) as session:
                 # Check form access
                 form = session.query(Form).filter(Form.id == form_id).first()
                 if not form:
@@ -300,7 +332,6 @@ class SubmissionsService:
                     value = answer.value
                     if question.field_type == "checkbox":
                         try:
-                            import json
                             value = json.loads(answer.value)
                         except:
                             pass
@@ -326,71 +357,38 @@ class SubmissionsService:
             return None
     
     @staticmethod
+    @profiled()
     def get_form_by_public_token(public_token: str) -> Optional[Dict[str, Any]]:
         """Get form details for public submission using token"""
         try:
-            with get_db_session() as session:
-                form = session.query(Form).filter(Form.public_token == public_token).first()
-                
-                if not form or form.status != "published":
-                    return None
-                
-                # Get active version and questions
-                active_version = session.query(FormVersion).filter(
-                    and_(FormVersion.form_id == form.id, FormVersion.is_active == True)
-                ).first()
-                
-                if not active_version:
-                    return None
-                
-                questions = session.query(Question).filter(
-                    Question.form_version_id == active_version.id
-                ).order_by(Question.order_index).all()
-                
-                question_list = []
-                for question in questions:
-                    # Get options for choice questions
-                    options = session.query(QuestionOption).filter(
-                        QuestionOption.question_id == question.id
-                    ).order_by(QuestionOption.order_index).all()
-                    
-                    question_list.append({
-                        'id': question.id,
-                        'label': question.label,
-                        'placeholder': question.placeholder,
-                        'help_text': question.help_text,
-                        'field_type': question.field_type,
-                        'required': question.required,
-                        'default_value': question.default_value,
-                        'validation_min': question.validation_min,
-                        'validation_max': question.validation_max,
-                        'options': [
-                            {
-                                'label': opt.label,
-                                'value': opt.value
-                            }
-                            for opt in options
-                        ]
-                    })
-                
-                return {
-                    'id': form.id,
-                    'title': form.title,
-                    'description': form.description,
-                    'single_submission': form.single_submission,
-                    'submission_start': form.submission_start,
-                    'submission_end': form.submission_end,
-                    'questions': question_list
-                }
-                
+            schema = get_form_schema(public_token)
+            if not schema or schema['status'] != "published" or not schema['version_id']:
+                return None
+            
+            return {
+                'id': schema['id'],
+                'title': schema['title'],
+                'description': schema['description'],
+                'single_submission': schema['single_submission'],
+                'submission_start': schema['submission_start'],
+                'submission_end': schema['submission_end'],
+                'questions': schema['questions']
+            }
+            
         except Exception as e:
             logger.error(f"Error getting form by token {public_token}: {e}")
             return None
     
     @staticmethod
+    @profiled()
     def create_submission(form_id: int, answers: Dict[int, Any], 
                          user_id: Optional[int] = None, ip_address: Optional[str] = None) -> Optional[int]:
         """Create a new form submission with answers"""
+        submitter_key = _submitter_key(form_id, user_id, ip_address)
+        if submitter_key is not None and submitter_key in _known_submitters:
+            logger.error(f"Single submission check failed: {_duplicate_message(submitter_key)}")
+            return None
+        
         try:
             with get_db_session() as session:
                 # Get form to validate
@@ -405,14 +403,6 @@ class SubmissionsService:
                     logger.error(f"Submission window check failed: {time_msg}")
                     return None
                 
-                # Check single submission rule
-                can_submit_single, single_msg = SubmissionsService.check_single_submission_rule(
-                    form, user_id, ip_address
-                )
-                if not can_submit_single:
-                    logger.error(f"Single submission check failed: {single_msg}")
-                    return None
-                
                 # Get the active form version
                 active_version = session.query(FormVersion).filter(
                     and_(FormVersion.form_id == form_id, FormVersion.is_active == True)
@@ -423,40 +413,211 @@ class SubmissionsService:
                     return None
                 
                 # Create submission record
-                submission = Submission(
-                    form_id=form_id,
-                    form_version_id=active_version.id,
-                    user_id=user_id,
-                    guest_token=ip_address,  # Use guest_token field for IP tracking
-                    submitted_at=datetime.now()
-                )
-                session.add(submission)
-                session.flush()  # Get submission ID
+                submitted_at = datetime.now()
+                submission_id = SubmissionsService._insert_submission(session, form, {
+                    'form_id': form_id,
+                    'form_version_id': active_version.id,
+                    'user_id': user_id,
+                    'guest_token': ip_address,  # Use guest_token field for IP tracking
+                    'submitted_at': submitted_at
+                })
+                if submission_id is None:
+                    logger.error(f"Single submission check failed: {_duplicate_message(submitter_key)}")
+                    return None
                 
                 # Create answer records
+                lineage_keys = get_validation_plans(session, [active_version.id])[active_version.id].lineage_keys
+                answer_rows = []
                 for question_id, answer_value in answers.items():
-                    if answer_value is not None and answer_value != "":
-                        # Convert answer to string for storage
-                        if isinstance(answer_value, (list, tuple)):
-                            answer_text = ", ".join(str(v) for v in answer_value)
-                        else:
-                            answer_text = str(answer_value)
-                        
-                        answer = Answer(
-                            submission_id=submission.id,
-                            question_id=question_id,
-                            value=answer_text
-                        )
-                        session.add(answer)
-                
-                session.commit()
-                logger.info(f"Created submission {submission.id} for form {form_id}")
-                return submission.id
+                    answer_text = SubmissionsService._serialize_answer(answer_value)
+                    if answer_text is not None:
+                        answer_rows.append({
+                            'submission_id': submission_id,
+                            'question_id': question_id,
+                            'lineage_key': lineage_keys.get(question_id),
+                            'value': answer_text
+                        })
+                SubmissionsService._insert_answers(session, answer_rows)
+                record_submission_aggregates(session, [{'submission_id': submission_id, 'form_id': form_id}])
+                invalidate_tenant_dashboard(form.tenant_id, session)
+                
+                logger.info(f"Created submission {submission_id} for form {form_id}")
+                return submission_id
                 
         except Exception as e:
             logger.error(f"Error creating submission for form {form_id}: {e}")
             return None
 
+    
+    @staticmethod
+    @profiled()
+    def submit_many(submissions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Ingest a batch of submissions (kiosk replays, partner imports) in one transaction
+        
+        Each item is a dict with 'form_id' and 'answers' ({question_id: value}),
+        plus optional 'user_id', 'ip_address', 'submitted_at' and
+        'completion_time_ms'. Forms and versions are loaded once per batch and
+        validation runs against one compiled plan per form version.
+        Returns one result per item, in input order:
+        {'success': bool, 'submission_id': Optional[int], 'errors': List[str]}
+        """
+        if not submissions:
+            return []
+        
+        try:
+            with get_db_session() as session:
+                return SubmissionsService.ingest_batch(session, submissions)
+                
+        except Exception as e:
+            logger.error(f"Error ingesting submission batch: {e}")
+            return [
+                {'success': False, 'submission_id': None,
+                 'errors': [f"Error processing submission batch: {str(e)}"]}
+                for _ in submissions
+            ]
+    
+    @staticmethod
+    def ingest_batch(session: Session, submissions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch of submissions in the caller's transaction (see submit_many)
+        
+        Per-item rule violations are reported in the results; database errors
+        propagate so the caller can roll back and retry the whole batch.
+        """
+        results = [{'success': False, 'submission_id': None, 'errors': []} for _ in submissions]
+        if not submissions:
+            return results
+        
+        form_ids = {item.get('form_id') for item in submissions}
+        forms = {
+            form.id: form
+            for form in session.query(Form).filter(Form.id.in_(form_ids)).all()
+        }
+        active_versions = {
+            version.form_id: version.id
+            for version in session.query(FormVersion).filter(
+                and_(FormVersion.form_id.in_(form_ids), FormVersion.is_active == True)
+            ).all()
+        }
+        # Plans validate answers and give each answer its question's lineage key
+        plans = get_validation_plans(session, active_versions.values())
+        
+        # Single-submission identities seen earlier in this batch
+        seen = set()
+        
+        accepted = []  # (result index, submission row, {question_id: answer text}, submitter key)
+        for index, item in enumerate(submissions):
+            errors = results[index]['errors']
+            form = forms.get(item.get('form_id'))
+            if not form:
+                errors.append("Form not found")
+                continue
+            version_id = active_versions.get(form.id)
+            if not version_id:
+                errors.append("Form version not found")
+                continue
+            
+            submitted_at = item.get('submitted_at') or datetime.now()
+            window_valid, window_message = SubmissionsService.validate_submission_window(form, submitted_at)
+            if not window_valid:
+                errors.append(window_message)
+                continue
+            
+            user_id = item.get('user_id')
+            guest_token = item.get('ip_address')
+            submitter_key = _submitter_key(form.id, user_id, guest_token) if form.single_submission else None
+            if submitter_key is not None:
+                if submitter_key in seen or submitter_key in _known_submitters:
+                    errors.append(_duplicate_message(submitter_key))
+                    continue
+                seen.add(submitter_key)
+            
+            answers = item.get('answers') or {}
+            validation_errors = plans[version_id].validate(
+                {f"question_{question_id}": value for question_id, value in answers.items()}
+            )
+            if validation_errors:
+                errors.extend(validation_errors)
+                continue
+            
+            answer_texts = {}
+            for question_id, value in answers.items():
+                answer_text = SubmissionsService._serialize_answer(value)
+                if answer_text is not None:
+                    answer_texts[question_id] = answer_text
+            
+            accepted.append((index, {
+                'form_id': form.id,
+                'form_version_id': version_id,
+                'user_id': user_id,
+                'guest_token': guest_token,
+                'submitted_at': submitted_at,
+                'completion_time_ms': item.get('completion_time_ms'),
+                'enforce_single': bool(form.single_submission),
+            }, answer_texts, submitter_key))
+        
+        if not accepted:
+            return results
+        
+        inserted = []  # (result index, submission id, {question_id: answer text})
+        accepted_rows = {index: row for index, row, _, _ in accepted}
+        
+        # One multi-row INSERT ... RETURNING for unrestricted submissions, ids in input order
+        unrestricted = [entry for entry in accepted if entry[3] is None]
+        if unrestricted:
+            submission_ids = session.execute(
+                insert(Submission).returning(Submission.id, sort_by_parameter_order=True),
+                [row for _, row, _, _ in unrestricted]
+            ).scalars().all()
+            inserted.extend(
+                (index, submission_id, answer_texts)
+                for (index, _, answer_texts, _), submission_id in zip(unrestricted, submission_ids)
+            )
+        
+        # Single-submission respondents: the partial unique indexes skip anyone
+        # who already submitted, and the returned identities tell us who got in
+        restricted = [entry for entry in accepted if entry[3] is not None]
+        if restricted:
+            returned = session.execute(
+                pg_insert(Submission).on_conflict_do_nothing().returning(
+                    Submission.id, Submission.form_id, Submission.user_id, Submission.guest_token
+                ),
+                [row for _, row, _, _ in restricted]
+            ).all()
+            ids_by_key = {
+                _submitter_key(form_id, user_id, guest_token): submission_id
+                for submission_id, form_id, user_id, guest_token in returned
+            }
+            for index, _, answer_texts, submitter_key in restricted:
+                submission_id = ids_by_key.get(submitter_key)
+                if submission_id is None:
+                    _known_submitters.set(submitter_key, True)
+                    results[index]['errors'].append(_duplicate_message(submitter_key))
+                else:
+                    inserted.append((index, submission_id, answer_texts))
+        
+        answer_rows = []
+        aggregate_items = []
+        for index, submission_id, answer_texts in inserted:
+            row = accepted_rows[index]
+            lineage_keys = plans[row['form_version_id']].lineage_keys
+            aggregate_items.append({'submission_id': submission_id, 'form_id': row['form_id']})
+            results[index]['success'] = True
+            results[index]['submission_id'] = submission_id
+            for question_id, answer_text in answer_texts.items():
+                answer_rows.append({
+                    'submission_id': submission_id,
+                    'question_id': question_id,
+                    'lineage_key': lineage_keys.get(question_id),
+                    'value': answer_text
+                })
+        SubmissionsService._insert_answers(session, answer_rows)
+        record_submission_aggregates(session, aggregate_items)
+        for tenant_id in {forms[item['form_id']].tenant_id for item in aggregate_items}:
+            invalidate_tenant_dashboard(tenant_id, session)
+        
+        logger.info(f"Ingested {len(inserted)} of {len(submissions)} submissions "
+                    f"({len(answer_rows)} answers) for {len(form_ids)} forms")
+        return results
 
 # Legacy helper functions for compatibility with existing tests
 def can_submit(user_id, form: Dict, existing_submissions: List[Dict]) -> bool:
@@ -0,0 +1,107 @@
+"""
+Text analytics pipeline for FormMind-AI
+Answers are tokenized by one compiled pattern into lowercase terms. Term
+frequencies of every text question are kept in the question_terms index,
+updated with the other aggregates as answers arrive (see aggregates.py),
+so common words and length statistics are read from the index instead of
+re-tokenizing every answer.
+
+Stop words are filtered when terms are read, not when they are indexed, so
+changing TEXT_STOP_WORDS needs no rebuild. With TEXT_STOP_WORDS=nltk the
+NLTK stopwords corpus for TEXT_STOP_WORDS_LANGUAGE is added to the built-in
+list (python -m nltk.downloader stopwords).
+"""
+from typing import Dict, Any, List, Iterable, FrozenSet
+from collections import Counter
+import functools
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELD_TYPES = ('short_text', 'long_text', 'email')
+
+# builtin, or nltk for the builtin list plus NLTK's corpus
+STOP_WORDS_SOURCE = os.getenv("TEXT_STOP_WORDS", "builtin").lower()
+STOP_WORDS_LANGUAGE = os.getenv("TEXT_STOP_WORDS_LANGUAGE", "english")
+# Comma-separated words to ignore on top of the list above
+EXTRA_STOP_WORDS = os.getenv("TEXT_EXTRA_STOP_WORDS", "")
+
+BUILTIN_STOP_WORDS = (
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should'
+)
+
+# Shorter tokens are never indexed; longer ones are usually URLs or pasted junk
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 64
+DEFAULT_TOP_N = 10
+
+# Runs of letters and digits, keeping inner apostrophes ("don't").
+# SQL_TOKEN_PATTERN is the same for PostgreSQL (see analytics_engine), which
+# before version 14 rejects \W inside brackets
+TOKEN_PATTERN = r"[^\W_]+(?:'[^\W_]+)*"
+SQL_TOKEN_PATTERN = r"[[:alnum:]]+(?:'[[:alnum:]]+)*"
+_TOKEN_PATTERN = re.compile(TOKEN_PATTERN)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens of a text, in order"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def terms(text: str) -> List[str]:
+    """Tokens of a text that are indexed (stop words included; they are filtered on read)"""
+    return [token for token in tokenize(text) if MIN_TERM_LENGTH <= len(token) <= MAX_TERM_LENGTH]
+
+
+@functools.lru_cache(maxsize=None)
+def stop_words() -> FrozenSet[str]:
+    """Configured stop words, loaded once per process"""
+    words = set(BUILTIN_STOP_WORDS)
+    if STOP_WORDS_SOURCE == 'nltk':
+        try:
+            from nltk.corpus import stopwords
+            words.update(stopwords.words(STOP_WORDS_LANGUAGE))
+        except (ImportError, LookupError, OSError) as e:
+            logger.warning(f"NLTK stop words unavailable, using the built-in list: {e}")
+    elif STOP_WORDS_SOURCE != 'builtin':
+        logger.warning(f"Unknown TEXT_STOP_WORDS={STOP_WORDS_SOURCE!r}, using the built-in list")
+    words.update(word.strip().lower() for word in EXTRA_STOP_WORDS.split(',') if word.strip())
+    return frozenset(words)
+
+
+def top_terms(counts: Dict[str, int], top_n: int = DEFAULT_TOP_N) -> List[Dict[str, Any]]:
+    """Most frequent non-stop-word terms as common_words rows (ties by term)"""
+    ignored = stop_words()
+    ranked = sorted(
+        ((term, count) for term, count in counts.items() if term not in ignored),
+        key=lambda item: (-item[1], item[0])
+    )
+    return [{'word': term, 'count': count} for term, count in ranked[:top_n]]
+
+
+def summarize(values: Iterable[str], top_n: int = DEFAULT_TOP_N) -> Dict[str, Any]:
+    """Length statistics and common words of in-memory answers, in the index's format"""
+    count = 0
+    total_length = 0
+    min_length = max_length = 0
+    term_counts: Counter = Counter()
+    for value in values:
+        if not value or not value.strip():
+            continue
+        length = len(value)
+        min_length = length if count == 0 else min(min_length, length)
+        max_length = max(max_length, length)
+        count += 1
+        total_length += length
+        term_counts.update(terms(value))
+    return {
+        'response_count': count,
+        'avg_length': total_length / count if count else 0.0,
+        'min_length': min_length,
+        'max_length': max_length,
+        'common_words': top_terms(term_counts, top_n),
+    }
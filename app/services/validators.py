@@ -0,0 +1,184 @@
+"""
+Compiled submission validators for FormMind-AI
+Form versions are immutable once they have submissions, so each version's
+questions are compiled once into a validation plan and cached by
+form_version_id. Validating against a cached plan needs no database work.
+"""
+from typing import Dict, Any, List, Iterable, Optional
+import logging
+import os
+import re
+from sqlalchemy.orm import Session
+
+from ..db import on_commit
+from ..models import Question, QuestionOption
+from .cache import LRUCache
+from .numeric_analytics import parse_number
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "2048"))
+
+_plan_cache = LRUCache(maxsize=VALIDATION_CACHE_SIZE, name="validation_plans")
+
+
+class CompiledQuestion:
+    """One question's validation rules, precomputed for fast checks"""
+
+    __slots__ = ('id', 'lineage_key', 'label', 'field_type', 'required', 'min_value', 'max_value', 'pattern', 'options')
+
+    def __init__(self, question: Dict[str, Any]):
+        self.id = question['id']
+        self.lineage_key = question.get('lineage_key') or question['id']
+        self.label = question['label']
+        self.field_type = question['field_type']
+        self.required = bool(question['required'])
+        self.min_value = float(question['validation_min']) if question.get('validation_min') is not None else None
+        self.max_value = float(question['validation_max']) if question.get('validation_max') is not None else None
+        self.options = frozenset(str(value) for value in question.get('options', []))
+        self.pattern = None
+        regex = question.get('validation_regex')
+        if regex:
+            try:
+                self.pattern = re.compile(regex)
+            except re.error as e:
+                # A broken pattern must not block every submission to the form
+                logger.warning(f"Ignoring invalid validation_regex on question {self.id}: {e}")
+
+    def validate(self, value: Any) -> List[str]:
+        """Return the error messages for one answer value"""
+        label = self.label
+        if value is None or str(value).strip() == "":
+            return [f"Question '{label}' is required"] if self.required else []
+
+        errors = []
+        field_type = self.field_type
+        if field_type == "number":
+            # Numbers as analytics count them, so every accepted answer is in the statistics
+            num_value = parse_number(value)
+            if num_value is None:
+                errors.append(f"'{label}' must be a valid number")
+            else:
+                if self.min_value is not None and num_value < self.min_value:
+                    errors.append(f"'{label}' must be at least {_format_bound(self.min_value)}")
+                if self.max_value is not None and num_value > self.max_value:
+                    errors.append(f"'{label}' must be at most {_format_bound(self.max_value)}")
+
+        elif field_type == "email":
+            if "@" not in str(value) or "." not in str(value):
+                errors.append(f"'{label}' must be a valid email address")
+
+        elif field_type in ["short_text", "long_text"]:
+            text_length = len(str(value))
+            if self.min_value is not None and text_length < self.min_value:
+                errors.append(f"'{label}' must be at least {_format_bound(self.min_value)} characters")
+            if self.max_value is not None and text_length > self.max_value:
+                errors.append(f"'{label}' must be at most {_format_bound(self.max_value)} characters")
+
+        elif field_type in ["radio", "dropdown"]:
+            if str(value) not in self.options:
+                errors.append(f"'{label}' has an invalid selection")
+
+        elif field_type == "checkbox":
+            if isinstance(value, list):
+                for selected_value in value:
+                    if str(selected_value) not in self.options:
+                        errors.append(f"'{label}' has an invalid selection: {selected_value}")
+            else:
+                errors.append(f"'{label}' must be a list for checkbox type")
+
+        if self.pattern is not None and not isinstance(value, list):
+            if not self.pattern.fullmatch(str(value)):
+                errors.append(f"'{label}' has an invalid format")
+
+        return errors
+
+
+class ValidationPlan:
+    """Compiled validators for every question of one form version"""
+
+    __slots__ = ('form_version_id', 'questions', 'lineage_keys')
+
+    def __init__(self, form_version_id: int, questions: Iterable[Dict[str, Any]]):
+        self.form_version_id = form_version_id
+        self.questions = tuple(CompiledQuestion(question) for question in questions)
+        # Stored on each answer row so analytics can follow a question across versions
+        self.lineage_keys = {question.id: question.lineage_key for question in self.questions}
+
+    def validate(self, submission_data: Dict[str, Any]) -> List[str]:
+        """Validate answers keyed as 'question_<id>'"""
+        errors = []
+        for question in self.questions:
+            errors.extend(question.validate(submission_data.get(f"question_{question.id}")))
+        return errors
+
+
+def _format_bound(value: float) -> str:
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def load_question_rows(session: Session, form_version_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Load questions and option values for form versions in two queries"""
+    rows: Dict[int, List[Dict[str, Any]]] = {version_id: [] for version_id in form_version_ids}
+    if not form_version_ids:
+        return rows
+
+    questions = session.query(Question).filter(
+        Question.form_version_id.in_(form_version_ids)
+    ).order_by(Question.form_version_id, Question.order_index).all()
+
+    option_rows = session.query(QuestionOption.question_id, QuestionOption.value).join(
+        Question, QuestionOption.question_id == Question.id
+    ).filter(Question.form_version_id.in_(form_version_ids)).all()
+    options_by_question: Dict[int, List[str]] = {}
+    for question_id, value in option_rows:
+        options_by_question.setdefault(question_id, []).append(value)
+
+    for question in questions:
+        rows[question.form_version_id].append({
+            'id': question.id,
+            'lineage_key': question.lineage_key,
+            'label': question.label,
+            'field_type': question.field_type,
+            'required': question.required,
+            'validation_min': question.validation_min,
+            'validation_max': question.validation_max,
+            'validation_regex': question.validation_regex,
+            'options': options_by_question.get(question.id, []),
+        })
+    return rows
+
+
+def get_validation_plans(session: Session, form_version_ids: Iterable[int]) -> Dict[int, ValidationPlan]:
+    """Plans for several versions; only cache misses are loaded, in one batch"""
+    plans = {}
+    missing = []
+    for version_id in set(form_version_ids):
+        plan = _plan_cache.get(version_id)
+        if plan is None:
+            missing.append(version_id)
+        else:
+            plans[version_id] = plan
+
+    if missing:
+        for version_id, questions in load_question_rows(session, missing).items():
+            plan = ValidationPlan(version_id, questions)
+            _plan_cache.set(version_id, plan)
+            plans[version_id] = plan
+    return plans
+
+
+def invalidate_validation_plan(form_version_id: int, session: Optional[Session] = None) -> None:
+    """Drop a cached plan after its version's questions were edited in place
+
+    With a session the plan is dropped again after it commits, evicting a
+    stale plan a concurrent submit may have reloaded in the meantime.
+    """
+    _plan_cache.pop(form_version_id)
+    if session is not None:
+        on_commit(session, lambda: _plan_cache.pop(form_version_id))
+
+
+def get_validation_cache_stats() -> Dict[str, Any]:
+    """Hit rate and size of the validation plan cache"""
+    return _plan_cache.stats()
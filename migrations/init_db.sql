@@ -53,7 +53,8 @@ CREATE TABLE IF NOT EXISTS questions (
     order_index INTEGER DEFAULT 0,
     validation_min NUMERIC,
     validation_max NUMERIC,
-    validation_regex TEXT
+    validation_regex TEXT,
+    lineage_key INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS question_options (
@@ -71,14 +72,16 @@ CREATE TABLE IF NOT EXISTS submissions (
     user_id INTEGER REFERENCES users(id),
     guest_token TEXT,
     submitted_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-    completion_time_ms INTEGER
+    completion_time_ms INTEGER,
+    enforce_single BOOLEAN NOT NULL DEFAULT false
 );
 
 CREATE TABLE IF NOT EXISTS answers (
     id SERIAL PRIMARY KEY,
     submission_id INTEGER REFERENCES submissions(id) ON DELETE CASCADE,
     question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
-    value TEXT
+    value TEXT,
+    lineage_key INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS templates (
@@ -90,3 +93,184 @@ CREATE TABLE IF NOT EXISTS templates (
     created_by INTEGER REFERENCES users(id),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
 );
+
+-- Single-submission enforcement. The first submission per respondent to a
+-- single-submission form carries enforce_single, and partial unique indexes
+-- reject any other flagged row, so inserts use ON CONFLICT DO NOTHING instead
+-- of a SELECT beforehand.
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS enforce_single BOOLEAN NOT NULL DEFAULT false;
+
+UPDATE submissions SET enforce_single = true
+WHERE NOT enforce_single AND id IN (
+    SELECT min(s.id)
+    FROM submissions s JOIN forms f ON f.id = s.form_id
+    WHERE f.single_submission AND (s.user_id IS NOT NULL OR s.guest_token IS NOT NULL)
+    GROUP BY s.form_id, s.user_id, CASE WHEN s.user_id IS NULL THEN s.guest_token END
+);
+
+CREATE INDEX IF NOT EXISTS idx_submission_form_guest ON submissions (form_id, guest_token);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_submission_single_user ON submissions (form_id, user_id)
+    WHERE enforce_single AND user_id IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_submission_single_guest ON submissions (form_id, guest_token)
+    WHERE enforce_single AND user_id IS NULL AND guest_token IS NOT NULL;
+
+-- Analytics aggregates, folded in from the submissions (services/aggregates.py).
+-- Rebuild from raw answers with: python -m app.services.aggregates rebuild
+CREATE TABLE IF NOT EXISTS form_version_stats (
+    form_version_id INTEGER PRIMARY KEY REFERENCES form_versions(id) ON DELETE CASCADE,
+    form_id INTEGER NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+    submission_count INTEGER NOT NULL DEFAULT 0,
+    last_submitted_at TIMESTAMP WITH TIME ZONE
+);
+CREATE INDEX IF NOT EXISTS idx_form_version_stats_form ON form_version_stats (form_id);
+
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id INTEGER PRIMARY KEY REFERENCES questions(id) ON DELETE CASCADE,
+    form_id INTEGER NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+    response_count INTEGER NOT NULL DEFAULT 0,
+    numeric_count INTEGER NOT NULL DEFAULT 0,
+    numeric_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    numeric_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    numeric_min DOUBLE PRECISION,
+    numeric_max DOUBLE PRECISION
+);
+CREATE INDEX IF NOT EXISTS idx_question_stats_form ON question_stats (form_id);
+
+CREATE TABLE IF NOT EXISTS question_option_stats (
+    question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+    value TEXT,
+    selection_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (question_id, value)
+);
+
+-- Quantile sketches (KLL, serialized as JSON) of numeric answers per question
+-- and submission day, maintained with the aggregates above
+CREATE TABLE IF NOT EXISTS question_sketches (
+    question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+    bucket_date DATE,
+    form_id INTEGER NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+    value_count INTEGER NOT NULL DEFAULT 0,
+    sketch TEXT NOT NULL,
+    PRIMARY KEY (question_id, bucket_date)
+);
+CREATE INDEX IF NOT EXISTS idx_question_sketches_form ON question_sketches (form_id);
+
+-- Submissions not yet merged into the aggregates (all but the submission
+-- counters); a folder merges them in batches off the submission path
+CREATE TABLE IF NOT EXISTS aggregate_queue (
+    submission_id INTEGER PRIMARY KEY REFERENCES submissions(id) ON DELETE CASCADE
+);
+
+-- HyperLogLog registers of distinct respondents (user id, else guest token)
+-- per form and per tenant and submission day; folds merge register-wise
+CREATE TABLE IF NOT EXISTS form_respondent_sketches (
+    form_id INTEGER REFERENCES forms(id) ON DELETE CASCADE,
+    bucket_date DATE,
+    tenant_id INTEGER NOT NULL REFERENCES tenants(id) ON DELETE CASCADE,
+    registers SMALLINT[] NOT NULL,
+    PRIMARY KEY (form_id, bucket_date)
+);
+
+CREATE TABLE IF NOT EXISTS tenant_respondent_sketches (
+    tenant_id INTEGER REFERENCES tenants(id) ON DELETE CASCADE,
+    bucket_date DATE,
+    registers SMALLINT[] NOT NULL,
+    PRIMARY KEY (tenant_id, bucket_date)
+);
+
+-- Analytics snapshots (services/snapshots.py) read a version's submissions
+-- past a watermark id and count those at or below it
+CREATE INDEX IF NOT EXISTS idx_submission_version_id ON submissions (form_version_id, id);
+
+-- Submission rollups per form and UTC hour / day for trend charts and heatmaps,
+-- maintained with the aggregates above
+CREATE TABLE IF NOT EXISTS form_hourly_submissions (
+    form_id INTEGER REFERENCES forms(id) ON DELETE CASCADE,
+    bucket_start TIMESTAMP WITH TIME ZONE,
+    submission_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS form_daily_submissions (
+    form_id INTEGER REFERENCES forms(id) ON DELETE CASCADE,
+    bucket_date DATE,
+    submission_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, bucket_date)
+);
+
+-- Question lineage: a question and its copies in later form versions share
+-- lineage_key (the id of the original), denormalized onto answers so
+-- analytics across versions is one indexed aggregate
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS lineage_key INTEGER;
+ALTER TABLE answers ADD COLUMN IF NOT EXISTS lineage_key INTEGER;
+
+-- Existing copies are linked best-effort: the n-th question with a given label
+-- and type in each version of a form joins the earliest such question
+UPDATE questions q SET lineage_key = origin.lineage_key
+FROM (
+    SELECT ranked.id, min(ranked.id) OVER (
+               PARTITION BY ranked.form_id, ranked.label, ranked.field_type, ranked.occurrence
+           ) AS lineage_key
+    FROM (
+        SELECT q2.id, fv.form_id, q2.label, q2.field_type,
+               row_number() OVER (
+                   PARTITION BY q2.form_version_id, q2.label, q2.field_type ORDER BY q2.order_index, q2.id
+               ) AS occurrence
+        FROM questions q2
+        JOIN form_versions fv ON fv.id = q2.form_version_id
+    ) ranked
+) origin
+WHERE q.id = origin.id AND q.lineage_key IS NULL;
+UPDATE questions SET lineage_key = id WHERE lineage_key IS NULL;
+
+UPDATE answers a SET lineage_key = q.lineage_key
+FROM questions q
+WHERE q.id = a.question_id AND a.lineage_key IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_question_lineage ON questions (lineage_key);
+CREATE INDEX IF NOT EXISTS idx_answer_lineage ON answers (lineage_key);
+
+-- Total submissions per form, spread over shards (SUBMISSION_COUNTER_SHARDS) so
+-- concurrent submissions to one form do not queue on a single row; a form's
+-- count is the sum of its shards
+CREATE TABLE IF NOT EXISTS form_submission_counters (
+    form_id INTEGER REFERENCES forms(id) ON DELETE CASCADE,
+    shard SMALLINT,
+    submission_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (form_id, shard)
+);
+
+-- Backfill only forms without any counter row: a counted form's shards need
+-- not include shard 0, so re-running this file must not count it again
+-- (repair drifted counters with "python -m app.services.aggregates reconcile")
+INSERT INTO form_submission_counters (form_id, shard, submission_count)
+SELECT form_id, 0, count(*) FROM submissions s
+WHERE form_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM form_submission_counters c WHERE c.form_id = s.form_id)
+GROUP BY form_id
+ON CONFLICT DO NOTHING;
+
+-- Text analytics index (services/text_analytics.py): length statistics and
+-- term frequencies of text answers per question, maintained with the
+-- aggregates above; backfill with "python -m app.services.aggregates rebuild"
+CREATE TABLE IF NOT EXISTS question_text_stats (
+    question_id INTEGER PRIMARY KEY REFERENCES questions(id) ON DELETE CASCADE,
+    form_id INTEGER NOT NULL REFERENCES forms(id) ON DELETE CASCADE,
+    answer_count INTEGER NOT NULL DEFAULT 0,
+    length_sum BIGINT NOT NULL DEFAULT 0,
+    length_min INTEGER,
+    length_max INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_question_text_stats_form ON question_text_stats (form_id);
+
+CREATE TABLE IF NOT EXISTS question_terms (
+    question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
+    term TEXT,
+    term_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (question_id, term)
+);
+CREATE INDEX IF NOT EXISTS idx_question_terms_top ON question_terms (question_id, term_count DESC, term);
+
+-- AI insights (services/ai_insights.py) read a question's answers past the
+-- highest answer id they already include
+CREATE INDEX IF NOT EXISTS idx_answer_question ON answers (question_id, id);
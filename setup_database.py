@@ -3,9 +3,14 @@
 Database setup script for FormMind-AI
 Run this to create all database tables
 """
+import os
 import psycopg2
+import subprocess
 import sys
 
+# Indexes, constraints and data migrations on top of the tables below
+MIGRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'init_db.sql')
+
 def setup_database():
     """Create all database tables"""
     
@@ -86,7 +91,8 @@ def setup_database():
             order_index INTEGER DEFAULT 0,
             validation_min NUMERIC,
             validation_max NUMERIC,
-            validation_regex TEXT
+            validation_regex TEXT,
+            lineage_key INTEGER
         );
         """,
         
@@ -110,7 +116,8 @@ def setup_database():
             user_id INTEGER REFERENCES users(id),
             guest_token TEXT,
             submitted_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-            completion_time_ms INTEGER
+            completion_time_ms INTEGER,
+            enforce_single BOOLEAN NOT NULL DEFAULT false
         );
         """,
         
@@ -120,7 +127,8 @@ def setup_database():
             id SERIAL PRIMARY KEY,
             submission_id INTEGER REFERENCES submissions(id) ON DELETE CASCADE,
             question_id INTEGER REFERENCES questions(id) ON DELETE CASCADE,
-            value TEXT
+            value TEXT,
+            lineage_key INTEGER
         );
         """,
         
@@ -155,6 +163,13 @@ def setup_database():
             except Exception as e:
                 print(f"❌ {i}. Failed to create table {table_name}: {e}")
                 
+        # The single-submission unique indexes that ON CONFLICT inserts rely on
+        # (and the rest of the schema) are kept in the migration file
+        print("\n📜 Applying migrations/init_db.sql...")
+        with open(MIGRATION_FILE) as migration:
+            cur.execute(migration.read())
+        print("✅ Applied schema migrations")
+        
         # Commit all changes
         conn.commit()
         print("\n💾 All changes committed!")
@@ -175,7 +190,19 @@ def setup_database():
         # Close connections
         cur.close()
         conn.close()
-        print("\n✅ Database connection closed. Setup successful! 🚀")
+        print("\n✅ Database connection closed.")
+        
+        # Backfill the analytics aggregates, sketches, rollups, counters and
+        # term index from any existing submissions (connects via DATABASE_URL)
+        print("\n📊 Rebuilding analytics aggregates...")
+        rebuild = subprocess.run(
+            [sys.executable, '-m', 'app.services.aggregates', 'rebuild'],
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if rebuild.returncode != 0:
+            print("❌ Aggregate rebuild failed; retry with: python -m app.services.aggregates rebuild")
+            return False
+        print("✅ Setup successful! 🚀")
         return True
         
     except psycopg2.Error as e:
@@ -0,0 +1,118 @@
+"""
+Tests for incremental analytics aggregates (app.services.aggregates)
+"""
+
+from datetime import datetime, date, timedelta, timezone
+
+import pytest
+
+from app.services.aggregates import AggregateDelta, hour_bucket, parse_number, parse_selections
+
+
+class TestParsing:
+    """Answer text as stored in answers.value"""
+
+    def test_parse_number(self):
+        assert parse_number("4.5") == 4.5
+        assert parse_number(" 7 ") == 7.0
+        assert parse_number("abc") is None
+        assert parse_number(None) is None
+        assert parse_number("nan") is None
+        assert parse_number("inf") is None
+
+    def test_checkbox_json_list(self):
+        assert parse_selections('checkbox', '["a", "b"]') == ["a", "b"]
+
+    def test_checkbox_plain_value(self):
+        assert parse_selections('checkbox', 'a') == ["a"]
+        assert parse_selections('checkbox', '[not json') == ["[not json"]
+
+    def test_radio_value_is_not_split(self):
+        assert parse_selections('radio', '["a"]') == ['["a"]']
+
+
+class TestAggregateDelta:
+    """Accumulating increments before the upsert"""
+
+    def test_submission_counts_per_version(self):
+        delta = AggregateDelta()
+        delta.add_submission(1, 10)
+        delta.add_submission(1, 10)
+        delta.add_submission(1, 11, count=5)
+        assert delta.versions[10][1] == 2
+        assert delta.versions[11][1] == 5
+
+    def test_form_counters_cover_every_version(self):
+        delta = AggregateDelta()
+        delta.add_submission(1, 10)
+        delta.add_submission(1, 11, count=5)
+        delta.add_submission(2, None)
+        assert delta.forms == {1: 6, 2: 1}
+        assert None not in delta.versions
+
+    def test_numeric_moments(self):
+        delta = AggregateDelta()
+        for value in ["2", "4", "oops", "6"]:
+            delta.add_answer(1, 7, 'number', value)
+        form_id, responses, n, total, total_sq, low, high = delta.questions[7]
+        assert responses == 4
+        assert n == 3
+        assert total == 12.0
+        assert total_sq == 56.0
+        assert (low, high) == (2.0, 6.0)
+
+    def test_sketches_only_with_a_bucket(self):
+        delta = AggregateDelta()
+        delta.add_answer(1, 7, 'number', '3')
+        assert not delta.sketches
+        day = date(2024, 3, 1)
+        delta.add_answer(1, 7, 'number', '5', day)
+        delta.add_sketch_value(1, 7, day, 8.0)
+        form_id, sketch = delta.sketches[(7, day)]
+        assert (form_id, sketch.n, sketch.min, sketch.max) == (1, 2, 5.0, 8.0)
+
+    def test_choice_and_checkbox_counts(self):
+        delta = AggregateDelta()
+        delta.add_answer(1, 3, 'radio', 'a')
+        delta.add_answer(1, 3, 'radio', 'a')
+        delta.add_answer(1, 4, 'checkbox', '["a", "b"]')
+        assert delta.options[(3, 'a')] == 2
+        assert delta.options[(4, 'a')] == 1
+        assert delta.options[(4, 'b')] == 1
+        assert delta.questions[4][1] == 1
+
+    def test_text_answers_only_count_responses(self):
+        delta = AggregateDelta()
+        delta.add_answer(1, 5, 'long_text', 'hello')
+        assert delta.questions[5][1] == 1
+        assert not delta.options
+
+    def test_text_lengths_and_terms(self):
+        delta = AggregateDelta()
+        delta.add_answer(1, 6, 'long_text', 'Great service, great food')
+        delta.add_answer(1, 6, 'long_text', 'ok')
+        delta.add_answer(1, 6, 'long_text', '   ')
+        assert delta.texts[6] == [1, 2, 27, 2, 25]
+        assert delta.terms[(6, 'great')] == 2
+        assert (6, 'ok') not in delta.terms
+
+    def test_empty_delta_is_falsy(self):
+        assert not AggregateDelta()
+
+    def test_hourly_rollups_sum_into_days(self):
+        delta = AggregateDelta()
+        late = datetime(2024, 3, 1, 23, 0, tzinfo=timezone.utc)
+        delta.add_rollup(1, late)
+        delta.add_rollup(1, late, count=2)
+        delta.add_rollup(1, late + timedelta(hours=1))
+        delta.add_rollup(2, late)
+        assert delta.hourly[(1, late)] == 3
+        assert delta.daily() == {(1, date(2024, 3, 1)): 3, (1, date(2024, 3, 2)): 1, (2, date(2024, 3, 1)): 1}
+
+
+class TestBuckets:
+    """Time buckets used by the rollups"""
+
+    def test_hour_bucket_is_utc(self):
+        submitted = datetime(2024, 3, 1, 9, 45, 12, tzinfo=timezone(timedelta(hours=2)))
+        assert hour_bucket(submitted) == datetime(2024, 3, 1, 7, 0, tzinfo=timezone.utc)
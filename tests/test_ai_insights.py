@@ -0,0 +1,114 @@
+"""
+Tests for the AI insights engine (app.services.ai_insights), checked against
+the scenarios in sample_analytics_data.json
+"""
+
+import json
+import os
+
+import pytest
+
+from app.services import ai_insights
+from app.services.ai_insights import (
+    TextInsights, analyze_answers, answer_set_hash, answer_tokens, document_term_matrix,
+    get_insights, score_answers, sentiment_label
+)
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_analytics_data.json')
+
+
+@pytest.fixture(scope="module")
+def sample_data():
+    with open(SAMPLE_DATA, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class TestSentimentScenarios:
+    """Lexicon sentiment of the sample scenarios"""
+
+    @pytest.mark.parametrize("scenario,label", [
+        ('highly_positive', 'positive'),
+        ('highly_negative', 'negative'),
+        ('mixed_sentiment', 'neutral'),
+        ('neutral', 'neutral'),
+    ])
+    def test_scenario_labels(self, sample_data, scenario, label):
+        answers = sample_data['test_cases']['sentiment_analysis_scenarios'][scenario]
+        assert [sentiment_label(score) for score in score_answers(answers)] == [label] * len(answers)
+
+    def test_negation_flips_polarity(self):
+        assert score_answers(["Horrible product, don't recommend", "Fast service, no complaints"]) == [-1.0, 1.0]
+
+    def test_negation_marks_following_tokens(self):
+        assert answer_tokens("not good at all") == ['not', 'not_good', 'not_at', 'all']
+
+    def test_summary_counts(self, sample_data):
+        scenarios = sample_data['test_cases']['sentiment_analysis_scenarios']
+        sentiment = analyze_answers(scenarios['highly_positive'] + scenarios['neutral'])['sentiment']
+        assert sentiment['counts'] == {'positive': 3, 'neutral': 4, 'negative': 0}
+        assert sentiment['overall'] == 'positive'
+
+
+class TestKeywords:
+    """TF-IDF keyword ranking"""
+
+    def test_expected_keywords(self, sample_data):
+        case = sample_data['test_cases']['keyword_extraction_expected']
+        keywords = analyze_answers(case['input'], top_n=5)['keywords']
+        assert [{'word': k['word'], 'count': k['count']} for k in keywords] == case['expected_top_keywords']
+
+    def test_common_terms_are_discounted(self):
+        # "product" occurs more often, but in every answer
+        answers = ["product shipping shipping", "product", "product"]
+        assert [k['word'] for k in analyze_answers(answers, top_n=2)['keywords']] == ['shipping', 'product']
+
+    def test_stop_words_and_negated_terms_are_not_keywords(self):
+        words = [k['word'] for k in analyze_answers(["the product is not great", "the end"])['keywords']]
+        assert words == ['end', 'product']
+
+    def test_edge_cases(self, sample_data):
+        edge = sample_data['edge_cases']
+        assert analyze_answers(edge['empty_and_null'])['response_count'] == 0
+        summary = analyze_answers(edge['special_characters'])
+        assert summary['response_count'] == 4
+        assert 'satisfied' in [k['word'] for k in summary['keywords']]
+
+
+class TestSparseMatrix:
+    """Document-term coordinate arrays"""
+
+    def test_counts_are_coalesced(self):
+        vocabulary = {}
+        rows, cols, counts = document_term_matrix([['b', 'a', 'b'], [], ['a']], vocabulary)
+        assert vocabulary == {'b': 0, 'a': 1}
+        assert list(zip(rows.tolist(), cols.tolist(), counts.tolist())) == [(0, 0, 2), (0, 1, 1), (2, 1, 1)]
+
+
+class TestIncrementalUpdates:
+    """Batched and incremental state matches a full recomputation"""
+
+    def test_batches_match_one_pass(self, sample_data, monkeypatch):
+        answers = [answer for group in sample_data['sample_text_responses'].values() for answer in group]
+        full = analyze_answers(answers)
+        monkeypatch.setattr(ai_insights, 'INSIGHTS_BATCH_SIZE', 4)
+        assert TextInsights().update(answers[:10]).update(answers[10:]).summary() == full
+
+    def test_answer_set_hash_is_additive_and_order_independent(self):
+        assert answer_set_hash(['a', 'b', 'c']) == answer_set_hash(['c', 'a', 'b'])
+        assert answer_set_hash(['a', 'b']) != answer_set_hash(['a', 'a'])
+        assert TextInsights().update(['a', None]).update(['b']).fingerprint == answer_set_hash(['a', None, 'b'])
+
+    def test_cache_extends_and_rebuilds(self, monkeypatch):
+        processed = []
+        original = TextInsights.update
+        monkeypatch.setattr(TextInsights, 'update', lambda self, answers: processed.append(list(answers))
+                            or original(self, answers))
+        key = ('tests', 'cache_extends_and_rebuilds')
+        get_insights(["great service", "slow"], cache_key=key)
+        extended = get_insights(["great service", "slow", "great price"], cache_key=key)
+        assert processed == [["great service", "slow"], ["great price"]]
+        assert extended == analyze_answers(["great service", "slow", "great price"])
+
+        # A changed earlier answer no longer matches the cached hash
+        get_insights(["great service", "fast", "great price"], cache_key=key)
+        assert processed[-1] == ["great service", "fast", "great price"]
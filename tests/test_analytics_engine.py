@@ -0,0 +1,63 @@
+"""
+Tests for the SQL push-down analytics engine (app.services.analytics_engine)
+The queries themselves need PostgreSQL; these cover the pure parts.
+"""
+
+import re
+
+import pytest
+
+from app.services.aggregates import parse_number
+from app.services.analytics_engine import NUMBER_PATTERN, _distribution, _grouped_sql, _HISTOGRAM_SQL
+
+
+class TestNumberPattern:
+    """Answers the database treats as numbers"""
+
+    def test_matches_what_parse_number_accepts(self):
+        for value in ["4", " 7 ", "-3.5", "+.5", "1.", "2e10", "1E-3"]:
+            assert re.match(NUMBER_PATTERN, value), value
+            assert parse_number(value) is not None
+
+    def test_rejects_non_numbers(self):
+        for value in ["abc", "", "nan", "inf", "1.2.3", "1e", "1e400"]:
+            assert not re.match(NUMBER_PATTERN, value), value
+
+    def test_agrees_with_parse_number_on_edge_inputs(self):
+        edge = ["1e100", "1_000", "inf", "-Infinity", "1.5E+300", "1.5E+30", "\u0663", "1\u00a0", " 2\n",
+                "0x10", "1,5", "9" * 201, "9" * 200, "." + "0" * 199 + "1e-99", "-0", "+", ".", "1 2"]
+        for value in edge:
+            matched = re.search(NUMBER_PATTERN, value) is not None
+            assert matched == (parse_number(value) is not None), value
+            if matched:
+                # What the SQL casts to double precision must be in range there too
+                assert 0 < abs(float(value)) < 1e308 or float(value) == 0, value
+
+
+class TestDistribution:
+    """Histogram rows built from per-bucket counts"""
+
+    def test_fills_empty_buckets(self):
+        distribution = _distribution(0.0, 10.0, 3, {1: 2, 5: 1}, 5)
+        assert [row['count'] for row in distribution] == [2, 0, 0, 0, 1]
+        assert distribution[0]['range'] == '0.0 - 2.0'
+        assert distribution[-1]['range'] == '8.0 - 10.0'
+
+    def test_single_value_range(self):
+        assert _distribution(3.0, 3.0, 4, {}, 5) == [{'range': '3.0', 'count': 4}]
+
+    def test_too_few_values(self):
+        assert _distribution(3.0, 3.0, 1, {}, 5) == []
+
+
+class TestGrouping:
+    """Summaries per question or per lineage across versions"""
+
+    def test_lineage_grouping(self):
+        sql = str(_grouped_sql(_HISTOGRAM_SQL, 'lineage_key'))
+        assert 'lineage_key IN' in sql
+        assert 'question_id' not in sql
+
+    def test_rejects_other_columns(self):
+        with pytest.raises(ValueError):
+            _grouped_sql(_HISTOGRAM_SQL, 'value')
@@ -0,0 +1,53 @@
+"""
+Tests for the in-process LRU/TTL cache used by services
+"""
+
+import time
+
+from app.services.cache import LRUCache
+
+
+class TestLRUCache:
+    """Eviction, expiry and statistics"""
+
+    def test_get_and_set(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('missing') is None
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'b' not in cache
+        assert 'a' in cache and 'c' in cache
+        assert cache.stats()['evictions'] == 1
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(maxsize=10, ttl=0.05)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        time.sleep(0.06)
+        assert cache.get('a') is None
+
+    def test_hit_rate(self):
+        cache = LRUCache(maxsize=10)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+        assert stats['hit_rate'] == round(2 / 3, 4)
+
+    def test_pop_where(self):
+        cache = LRUCache(maxsize=10)
+        cache.set(('form', 1), 'x')
+        cache.set(('form', 2), 'y')
+        assert cache.pop_where(lambda key, value: key[1] == 1) == 1
+        assert ('form', 1) not in cache
+        assert ('form', 2) in cache
@@ -0,0 +1,110 @@
+"""
+Tests for the instrumented connection pool in app.db
+
+Uses a file-backed SQLite engine so no PostgreSQL server is required.
+"""
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, TimeoutError as SQLAlchemyTimeoutError
+
+from app import db
+from app.db import InstrumentedQueuePool, PoolMetrics
+
+
+@pytest.fixture
+def pooled_engine(tmp_path):
+    """Small instrumented pool over a SQLite database file."""
+    sqlite_engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=5,
+        connect_args={'check_same_thread': False},
+    )
+    metrics = PoolMetrics("test")
+    sqlite_engine.pool.attach_metrics(metrics)
+    yield sqlite_engine, metrics
+    sqlite_engine.dispose()
+
+
+class TestPoolMetrics:
+    """Checkout latency, wait counts and gauges"""
+
+    def test_checkouts_are_counted(self, pooled_engine):
+        sqlite_engine, metrics = pooled_engine
+        for _ in range(3):
+            with sqlite_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        data = metrics.to_dict()
+        assert data['checkouts'] == 3
+        assert data['waits'] == 0
+        assert data['in_use'] == 0
+        assert data['size'] == 2
+
+    def test_exhausted_pool_records_waits(self, pooled_engine):
+        sqlite_engine, metrics = pooled_engine
+        held = [sqlite_engine.connect() for _ in range(2)]
+        assert metrics.to_dict()['in_use'] == 2
+
+        def release_later():
+            time.sleep(0.1)
+            held[0].close()
+
+        releaser = threading.Thread(target=release_later)
+        releaser.start()
+        with sqlite_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        releaser.join()
+        held[1].close()
+
+        data = metrics.to_dict()
+        assert data['waits'] == 1
+        assert data['max_checkout_ms'] >= 50
+        assert data['peak_in_use'] == 2
+
+    def test_metrics_survive_dispose(self, pooled_engine):
+        sqlite_engine, metrics = pooled_engine
+        sqlite_engine.dispose()
+        with sqlite_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert metrics.to_dict()['checkouts'] == 1
+
+    def test_only_pool_timeouts_count_as_timeouts(self, tmp_path):
+        sqlite_engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05,
+        )
+        metrics = PoolMetrics("timeouts")
+        sqlite_engine.pool.attach_metrics(metrics)
+        held = sqlite_engine.connect()
+        with pytest.raises(SQLAlchemyTimeoutError):
+            sqlite_engine.connect()
+        held.close()
+        sqlite_engine.dispose()
+
+        broken_engine = create_engine(
+            f"sqlite:///{tmp_path / 'missing' / 'pool.db'}", poolclass=InstrumentedQueuePool
+        )
+        broken_engine.pool.attach_metrics(metrics)
+        with pytest.raises(OperationalError):
+            broken_engine.connect()
+
+        data = metrics.to_dict()
+        assert data['timeouts'] == 1
+        assert data['checkout_errors'] == 1
+
+    def test_idle_connections_are_pinged(self, pooled_engine, monkeypatch):
+        sqlite_engine, metrics = pooled_engine
+        monkeypatch.setattr(db, "DB_PRE_PING_IDLE_SECONDS", 0)
+        db._install_idle_ping(sqlite_engine, metrics)
+        for _ in range(3):
+            with sqlite_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        # The first checkout opens the connection, so only returning ones are pinged
+        assert metrics.to_dict()['idle_pings'] == 2
+        assert metrics.to_dict()['stale_connections'] == 0
@@ -0,0 +1,108 @@
+"""
+Tests for the SQL statement profiler in app.db
+
+Uses an in-memory SQLite engine so no PostgreSQL server is required.
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import db
+from app.db import OperationStats, QueryProfiler
+
+
+@pytest.fixture
+def profiler():
+    """Profiler attached to a throwaway SQLite engine."""
+    sqlite_engine = create_engine("sqlite://")
+    profiler = QueryProfiler()
+    profiler.instrument(sqlite_engine)
+    return profiler, sqlite_engine
+
+
+class TestOperationStats:
+    """Statement bookkeeping for a single operation"""
+
+    def test_counts_and_total_time(self):
+        stats = OperationStats("op")
+        stats.record("SELECT 1", 2.0)
+        stats.record("SELECT 2", 3.0)
+        assert stats.statement_count == 2
+        assert stats.total_sql_ms == 5.0
+
+    def test_repeated_statements_detect_n_plus_one(self):
+        stats = OperationStats("op")
+        stats.record("SELECT * FROM forms", 1.0)
+        for _ in range(5):
+            stats.record("SELECT count(*) FROM submissions WHERE form_id = ?", 0.5)
+        repeated = stats.repeated_statements
+        assert len(repeated) == 1
+        assert repeated[0]['count'] == 5
+
+    def test_slowest_statements_are_bounded_and_sorted(self):
+        stats = OperationStats("op")
+        for i in range(20):
+            stats.record(f"SELECT {i}", float(i))
+        slowest = stats.slowest_statements
+        assert len(slowest) == OperationStats.SLOWEST_KEPT
+        assert [s['duration_ms'] for s in slowest] == [19.0, 18.0, 17.0, 16.0, 15.0]
+
+
+class TestQueryProfiler:
+    """Engine event integration"""
+
+    def test_operation_records_statements(self, profiler):
+        profiler, sqlite_engine = profiler
+        with profiler.operation("demo"):
+            with sqlite_engine.connect() as conn:
+                for _ in range(3):
+                    conn.execute(text("SELECT 1"))
+
+        recent = profiler.recent("demo")
+        assert len(recent) == 1
+        assert recent[0]['statement_count'] == 3
+        assert recent[0]['repeated_statements'][0]['count'] == 3
+
+    def test_nested_operations_fold_into_outer(self, profiler):
+        profiler, sqlite_engine = profiler
+        with profiler.operation("outer"):
+            with profiler.operation("inner"):
+                with sqlite_engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+
+        summary = profiler.summary()
+        assert "inner" not in summary
+        assert summary["outer"]['calls'] == 1
+        assert summary["outer"]['statements'] == 1
+
+    def test_statements_outside_operations_are_not_attributed(self, profiler):
+        profiler, sqlite_engine = profiler
+        with sqlite_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert profiler.summary() == {}
+
+    def test_only_slow_or_repetitive_operations_are_logged(self, profiler, monkeypatch):
+        profiler, sqlite_engine = profiler
+        logged = []
+        monkeypatch.setattr(profiler, "_write_log", logged.append)
+        monkeypatch.setattr(db, "SQL_REPEAT_WARN_THRESHOLD", 3)
+        with sqlite_engine.connect() as conn:
+            with profiler.operation("quick"):
+                conn.execute(text("SELECT 1"))
+            with profiler.operation("n_plus_one"):
+                for _ in range(3):
+                    conn.execute(text("SELECT 2"))
+            monkeypatch.setattr(db, "SQL_PROFILE_LOG_ALL", True)
+            with profiler.operation("everything"):
+                conn.execute(text("SELECT 1"))
+        assert [record['operation'] for record in logged] == ["n_plus_one", "everything"]
+        assert profiler.summary()["quick"]['calls'] == 1
+
+    def test_failed_statement_does_not_leak_start_time(self, profiler):
+        profiler, sqlite_engine = profiler
+        with sqlite_engine.connect() as conn:
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing_table"))
+            assert conn.info.get("query_start_time") == []
+            conn.execute(text("SELECT 1"))
+            assert conn.info.get("query_start_time") == []
@@ -0,0 +1,85 @@
+"""
+Tests for unit-of-work session propagation in app.db
+
+SessionLocal is pointed at an in-memory SQLite engine so no PostgreSQL
+server is required.
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import db
+
+
+@pytest.fixture
+def sqlite_sessions(monkeypatch):
+    """Route get_db_session() to a shared in-memory SQLite database."""
+    sqlite_engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={'check_same_thread': False}
+    )
+    with sqlite_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (name TEXT)"))
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=sqlite_engine))
+    return sqlite_engine
+
+
+def count_items(sqlite_engine):
+    with sqlite_engine.connect() as conn:
+        return conn.execute(text("SELECT count(*) FROM items")).scalar()
+
+
+class TestUnitOfWork:
+    """Nested get_db_session() calls share one session and transaction"""
+
+    def test_nested_calls_reuse_outer_session(self, sqlite_sessions):
+        with db.get_db_session() as outer:
+            with db.get_db_session() as inner:
+                assert inner is outer
+            assert db.current_session() is outer
+        assert db.current_session() is None
+
+    def test_read_session_joins_unit_of_work(self, sqlite_sessions):
+        with db.get_db_session() as outer:
+            with db.get_read_session() as reader:
+                assert reader is outer
+
+    def test_inner_writes_roll_back_with_outer(self, sqlite_sessions):
+        with db.get_db_session() as outer:
+            with db.get_db_session() as inner:
+                inner.execute(text("INSERT INTO items VALUES ('a')"))
+            outer.rollback()
+        assert count_items(sqlite_sessions) == 0
+
+    def test_error_rolls_back_whole_unit_of_work(self, sqlite_sessions):
+        with pytest.raises(RuntimeError):
+            with db.get_db_session() as outer:
+                outer.execute(text("INSERT INTO items VALUES ('a')"))
+                with db.get_db_session() as inner:
+                    inner.execute(text("INSERT INTO items VALUES ('b')"))
+                raise RuntimeError("boom")
+        assert count_items(sqlite_sessions) == 0
+
+    def test_outer_block_commits_everything(self, sqlite_sessions):
+        with db.get_db_session() as outer:
+            outer.execute(text("INSERT INTO items VALUES ('a')"))
+            with db.get_db_session() as inner:
+                inner.execute(text("INSERT INTO items VALUES ('b')"))
+        assert count_items(sqlite_sessions) == 2
+
+    def test_on_commit_runs_after_outermost_commit(self, sqlite_sessions):
+        calls = []
+        with db.get_db_session():
+            with db.get_db_session() as inner:
+                db.on_commit(inner, lambda: calls.append("committed"))
+            assert calls == []
+        assert calls == ["committed"]
+
+    def test_on_commit_dropped_on_rollback(self, sqlite_sessions):
+        calls = []
+        with pytest.raises(RuntimeError):
+            with db.get_db_session() as session:
+                db.on_commit(session, lambda: calls.append("committed"))
+                raise RuntimeError("boom")
+        assert calls == []
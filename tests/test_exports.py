@@ -0,0 +1,113 @@
+"""
+Tests for streaming response exports (app.services.exports)
+"""
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+from app.services.exports import (
+    ExportColumn, csv_chunks, csv_rows, id_ranges, json_array_chunks, json_array_items, merge_parts,
+    ndjson_chunks, pivot_answers
+)
+
+COLUMNS = [ExportColumn('Name', 'short_text'), ExportColumn('Topics', 'checkbox'), ExportColumn('Name', 'number')]
+WHEN = datetime(2025, 1, 2, 3, 4, 5)
+
+
+def submissions(count=3):
+    return [(count - i, WHEN, None if i % 2 else 7, {0: f"user {i}", 1: '["a", "b"]'}) for i in range(count)]
+
+
+class TestPivot:
+    """Answer rows pivoted into one row per submission"""
+
+    def test_rows_are_grouped_by_submission(self):
+        rows = [
+            (2, WHEN, 7, 10, 'Ann'), (2, WHEN, 7, 11, '["x"]'),
+            (1, WHEN, None, 20, 'Bob'),
+            (3, WHEN, None, None, None),
+        ]
+        # Questions 10 and 20 are copies of one question in two form versions
+        pivoted = list(pivot_answers(rows, {10: 0, 11: 1, 20: 0}))
+        assert pivoted == [
+            (2, WHEN, 7, {0: 'Ann', 1: '["x"]'}),
+            (1, WHEN, None, {0: 'Bob'}),
+            (3, WHEN, None, {}),
+        ]
+
+    def test_unknown_questions_are_dropped(self):
+        assert list(pivot_answers([(1, WHEN, None, 99, 'x')], {})) == [(1, WHEN, None, {})]
+
+    def test_is_lazy(self):
+        def rows():
+            yield (1, WHEN, None, 10, 'a')
+            yield (2, WHEN, None, 10, 'b')
+            raise AssertionError("read past the second submission")
+
+        assert next(pivot_answers(rows(), {10: 0})) == (1, WHEN, None, {0: 'a'})
+
+
+class TestFormats:
+    """CSV, NDJSON and JSON array chunks"""
+
+    def test_csv(self):
+        text = ''.join(csv_chunks(COLUMNS, iter(submissions(2))))
+        assert list(csv.reader(io.StringIO(text))) == [
+            ['Submission ID', 'Submitted At', 'Submitted By', 'Name', 'Topics', 'Name'],
+            ['2', '2025-01-02 03:04:05', '7', 'user 0', 'a, b', ''],
+            ['1', '2025-01-02 03:04:05', 'Anonymous', 'user 1', 'a, b', ''],
+        ]
+
+    def test_chunks_hold_chunk_rows_submissions(self):
+        chunks = list(csv_chunks(COLUMNS, iter(submissions(5)), chunk_rows=2))
+        assert [chunk.count('\r\n') for chunk in chunks] == [1, 2, 2, 1]
+
+    def test_ndjson(self):
+        chunks = list(ndjson_chunks(COLUMNS, iter(submissions(3)), chunk_rows=2))
+        records = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        assert len(chunks) == 2 and len(records) == 3
+        assert records[0] == {
+            'submission_id': 3, 'submitted_at': WHEN.isoformat(), 'user_id': 7,
+            'answers': {'Name': 'user 0', 'Topics': ['a', 'b'], 'Name (2)': None}
+        }
+
+    def test_json_array_matches_json_dumps(self):
+        text = ''.join(json_array_chunks(COLUMNS, iter(submissions(3)), chunk_rows=2))
+        records = [json.loads(line) for line in ''.join(ndjson_chunks(COLUMNS, iter(submissions(3)))).splitlines()]
+        assert text == json.dumps(records, indent=2)
+
+    def test_empty_json_array(self):
+        assert ''.join(json_array_chunks(COLUMNS, iter([]))) == '[]'
+
+
+class TestSpooledExports:
+    """Id range chunks written as gzip parts and merged into one export"""
+
+    def test_id_ranges_cover_the_range_highest_first(self):
+        assert id_ranges(1, 10, 3) == [(9, 10), (5, 8), (1, 4)]
+        assert id_ranges(5, 5, 4) == [(5, 5)]
+
+    def merged(self, tmp_path, format_type, formatter, parts):
+        paths = []
+        for index, part in enumerate(parts):
+            path = tmp_path / f"part_{index}.gz"
+            with gzip.open(path, 'wt', encoding='utf-8', newline='') as target:
+                target.write(''.join(formatter(COLUMNS, iter(part), chunk_rows=2)))
+            paths.append((str(path), len(part)))
+        target = io.BytesIO()
+        merge_parts(COLUMNS, format_type, paths, target)
+        return gzip.decompress(target.getvalue()).decode('utf-8')
+
+    def test_merged_csv_matches_the_stream(self, tmp_path):
+        rows = submissions(5)
+        text = self.merged(tmp_path, 'csv', csv_rows, [rows[:3], [], rows[3:]])
+        assert text == ''.join(csv_chunks(COLUMNS, iter(rows)))
+
+    def test_merged_json_matches_the_stream(self, tmp_path):
+        rows = submissions(5)
+        text = self.merged(tmp_path, 'json', json_array_items, [rows[:1], [], rows[1:]])
+        assert text == ''.join(json_array_chunks(COLUMNS, iter(rows)))
+        assert self.merged(tmp_path, 'json', json_array_items, [[]]) == '[]'
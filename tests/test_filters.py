@@ -0,0 +1,103 @@
+"""
+Tests for analytics filters (app.services.filters)
+The compiled conditions run on PostgreSQL; these cover matching in memory
+and what the conditions compile to.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.services.analytics_engine import _scope_sql
+from app.services.filters import AnswerPredicate, FilterSpec
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+def compiled(condition):
+    return str(condition.compile(dialect=postgresql.dialect()))
+
+
+class TestAnswerPredicate:
+    """One condition on an answer value"""
+
+    def test_equals_matches_checkbox_selections(self):
+        predicate = AnswerPredicate(3, 'equals', 'a')
+        assert predicate.matches('a')
+        assert predicate.matches('["b", "a"]')
+        assert not predicate.matches('["ab"]')
+        assert not predicate.matches(None)
+
+    def test_negated_operators_match_missing_answers(self):
+        assert AnswerPredicate(3, 'not_equals', 'a').matches(None)
+        assert not AnswerPredicate(3, 'not_equals', 'a').matches('["a"]')
+        assert AnswerPredicate(3, 'not_answered').matches('   ')
+        assert not AnswerPredicate(3, 'answered').matches('')
+
+    def test_numeric_comparisons_skip_non_numbers(self):
+        predicate = AnswerPredicate(2, 'gte', '7')
+        assert predicate.matches(' 7 ') and predicate.matches('1e1')
+        assert not predicate.matches('6.5')
+        assert not predicate.matches('n/a')
+
+    def test_contains_ignores_case(self):
+        assert AnswerPredicate(1, 'contains', 'GREAT').matches('great service')
+
+    def test_invalid_predicates(self):
+        with pytest.raises(ValueError):
+            AnswerPredicate(1, 'like', 'x')
+        with pytest.raises(ValueError):
+            AnswerPredicate(1, 'gt', 'many')
+        with pytest.raises(ValueError):
+            AnswerPredicate(1, 'equals')
+
+    def test_conditions_are_exists_subqueries(self):
+        assert compiled(AnswerPredicate(1, 'contains', '50%').condition()).startswith('EXISTS (SELECT')
+        assert compiled(AnswerPredicate(1, 'not_answered').condition()).startswith('NOT (EXISTS (SELECT')
+
+
+class TestFilterSpec:
+    """Specs from the analytics pages' filter dicts"""
+
+    def test_from_filters(self):
+        spec = FilterSpec.from_filters({
+            'start_date': NOW - timedelta(days=7), 'end_date': NOW, 'min_submissions': 0, 'question_filter': 'all',
+            'versions': [2, 1, 2], 'submitter': 'guest',
+            'answer_filters': [{'question_id': '4', 'operator': 'lt', 'value': '3'}],
+        })
+        assert spec.active and spec.version_numbers == [1, 2] and spec.answers[0].key() == (4, 'lt', 3.0)
+        assert spec.key() == FilterSpec.from_filters({
+            'start_date': NOW - timedelta(days=7), 'end_date': NOW, 'versions': [1, 2], 'submitter': 'guest',
+            'answer_filters': [{'question_id': 4, 'operator': 'lt', 'value': 3}],
+        }).key()
+
+    def test_empty_spec_is_inactive(self):
+        assert not FilterSpec.from_filters({'min_submissions': 10, 'question_filter': 'all'}).active
+        assert not FilterSpec().active
+
+    def test_matches(self):
+        spec = FilterSpec(start=NOW - timedelta(days=1), submitter='user',
+                          answers=[AnswerPredicate(5, 'equals', 'yes')])
+        submission = {'submitted_at': NOW, 'user_id': 7, 'answers': {5: 'yes'}}
+        assert spec.matches(submission)
+        assert not spec.matches({**submission, 'user_id': None})
+        assert not spec.matches({**submission, 'submitted_at': NOW - timedelta(days=2)})
+        assert not spec.matches({**submission, 'answers': {}})
+
+    def test_conditions(self):
+        spec = FilterSpec(end=NOW, version_numbers=[3], submitter='guest')
+        sql = [compiled(condition) for condition in spec.conditions(42)]
+        assert len(sql) == 4
+        assert sql[0].startswith('submissions.form_id =')
+        assert sql[1].startswith('submissions.submitted_at <=')
+        assert sql[2].startswith('submissions.form_version_id IN (SELECT form_versions.id')
+        assert sql[3] == 'submissions.user_id IS NULL'
+
+    def test_scope_for_sql_templates(self):
+        spec = FilterSpec(version_numbers=[1, 2], answers=[AnswerPredicate(9, 'gt', 4)])
+        clause, params = _scope_sql(spec.submission_ids(42), 'a.submission_id')
+        assert clause.startswith('AND a.submission_id IN (SELECT submissions.id')
+        assert ':version_number_1_1' in clause and ':version_number_1_2' in clause
+        assert params['form_id_1'] == 42 and params['version_number_1_2'] == 2
+        assert _scope_sql(None, 'submission_id') == ('', {})
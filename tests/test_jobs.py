@@ -0,0 +1,113 @@
+"""
+Tests for background analytics jobs (app.services.jobs)
+"""
+
+import threading
+import time
+
+import pytest
+
+from app.services import ai_insights
+from app.services.jobs import CANCELLED, DONE, FAILED, JobRunner, partition
+
+
+def wait_for(runner, job_id, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.poll(job_id)
+        if job['state'] in (DONE, FAILED, CANCELLED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(workers=0, queue_size=2, threads=2)
+    yield runner
+    runner.shutdown()
+
+
+class TestPartition:
+    """Chunking of job items"""
+
+    def test_nearly_equal_contiguous_chunks(self):
+        assert partition(list(range(10)), 3) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+    def test_never_more_chunks_than_items(self):
+        assert partition([1, 2], 8) == [[1], [2]]
+        assert partition([], 4) == []
+
+
+class TestJobRunner:
+    """Queueing, polling and cancellation (chunks run in-thread)"""
+
+    def test_result_is_polled(self, runner):
+        job_id = runner.submit(lambda context: sum(context.map(sum, list(range(100)), chunks=4)))
+        job = wait_for(runner, job_id)
+        assert job['state'] == DONE and job['result'] == 4950 and job['progress'] == 1.0
+
+    def test_failures_are_reported(self, runner):
+        job = wait_for(runner, runner.submit(lambda context: 1 / 0))
+        assert job['state'] == FAILED and 'division' in job['error']
+        assert runner.stats()['failed'] == 1
+
+    def test_queue_is_bounded_and_keys_are_shared(self, runner):
+        release = threading.Event()
+        first = runner.submit(lambda context: release.wait(5), key='a')
+        assert runner.submit(lambda context: None, key='a') == first
+        second = runner.submit(lambda context: release.wait(5))
+        assert runner.submit(lambda context: None) is None
+        assert runner.stats()['rejected'] == 1
+        release.set()
+        wait_for(runner, first)
+        wait_for(runner, second)
+        assert runner.submit(lambda context: None, key='a') not in (None, first)
+
+    def test_cancel_owner(self, runner):
+        started = threading.Event()
+
+        def work(context):
+            started.set()
+            while True:
+                context.check()
+                time.sleep(0.01)
+
+        job_id = runner.submit(work, owner='session-1')
+        started.wait(5)
+        assert runner.cancel_owner('session-2') == 0
+        assert runner.cancel_owner('session-1') == 1
+        assert wait_for(runner, job_id)['state'] == CANCELLED
+
+    def test_finished_jobs_expire(self):
+        runner = JobRunner(workers=0, result_ttl=0)
+        try:
+            job_id = runner.submit(lambda context: 1)
+            wait_for(runner, job_id)
+            runner.submit(lambda context: 2)
+            assert runner.poll(job_id) is None
+        finally:
+            runner.shutdown()
+
+
+class TestProcessPool:
+    """Chunks analyzed in worker processes"""
+
+    def test_insights_chunks_merge_to_one_pass(self):
+        answers = ["great service", "slow delivery", "not good", "great price", None, "terrible support"] * 50
+        runner = JobRunner(workers=2)
+        try:
+            def work(context):
+                state = ai_insights.TextInsights()
+                for part in context.map(ai_insights.insights_chunk, answers, chunks=4):
+                    state.merge(part)
+                return state.summary()
+
+            job = wait_for(runner, runner.submit(work))
+        finally:
+            runner.shutdown()
+        assert job['state'] == DONE
+        expected = ai_insights.analyze_answers(answers)
+        assert job['result']['keywords'] == expected['keywords']
+        assert job['result']['sentiment']['counts'] == expected['sentiment']['counts']
+        assert job['result']['sentiment']['average_score'] == pytest.approx(expected['sentiment']['average_score'])
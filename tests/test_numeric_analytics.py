@@ -0,0 +1,74 @@
+"""
+Tests for vectorized numeric analytics (app.services.numeric_analytics)
+"""
+
+import numpy as np
+import pytest
+
+from app.services.numeric_analytics import parse_numbers, histogram, describe, bin_count, summary_bin_count, MAX_BINS
+
+
+class TestParseNumbers:
+    """Parsing answer values into a float array"""
+
+    def test_invalid_values_are_masked(self):
+        array = parse_numbers(["1", " 2.5 ", "abc", None, "nan", "inf", "-3"])
+        assert array.tolist() == [1.0, 2.5, -3.0]
+
+    def test_empty(self):
+        assert parse_numbers([]).size == 0
+
+
+class TestHistogram:
+    """Bin strategies and the distribution format"""
+
+    def test_fixed_bins_include_maximum(self):
+        distribution = histogram(np.array([0.0, 1.0, 2.0, 3.0, 10.0]))
+        assert len(distribution) == 5
+        assert distribution[0] == {'range': '0.0 - 2.0', 'count': 2}
+        assert distribution[-1] == {'range': '8.0 - 10.0', 'count': 1}
+        assert sum(row['count'] for row in distribution) == 5
+
+    def test_explicit_bin_count(self):
+        assert len(histogram(np.arange(100.0), 10)) == 10
+
+    def test_sturges(self):
+        # ceil(log2(128)) + 1 bins
+        assert len(histogram(np.arange(128.0), 'sturges')) == 8
+
+    def test_freedman_diaconis_is_capped(self):
+        array = np.concatenate([np.zeros(50), np.ones(50), [1e9]])
+        distribution = histogram(array, 'fd')
+        assert len(distribution) <= MAX_BINS
+        assert sum(row['count'] for row in distribution) == array.size
+
+    def test_degenerate_inputs(self):
+        assert histogram(np.array([4.0])) == []
+        assert histogram(np.array([4.0, 4.0, 4.0])) == [{'range': '4.0', 'count': 3}]
+
+    def test_summary_bin_count_matches_array(self):
+        # The SQL and sketch paths bin from count, range and quartiles only
+        array = np.concatenate([np.arange(200.0), [5000.0]])
+        q1, q3 = np.quantile(array, [0.25, 0.75])
+        for bins in ('fixed', 'sturges', 'fd', 7):
+            assert summary_bin_count(bins, array.size, array.min(), array.max(), q1, q3) == bin_count(array, bins)
+
+    def test_unknown_strategy(self):
+        with pytest.raises(ValueError):
+            histogram(np.arange(10.0), 'auto-magic')
+
+
+class TestDescribe:
+    """Summary statistics"""
+
+    def test_quartiles_and_spread(self):
+        summary = describe([str(v) for v in range(1, 10)])
+        assert summary['count'] == 9
+        assert summary['median'] == 5.0
+        assert summary['q1'] == 3.0
+        assert summary['q3'] == 7.0
+        assert summary['iqr'] == 4.0
+        assert summary['std'] == pytest.approx(np.std(np.arange(1, 10)))
+
+    def test_no_numbers(self):
+        assert describe(["a", ""]) is None
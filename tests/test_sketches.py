@@ -0,0 +1,111 @@
+"""
+Tests for mergeable quantile sketches (app.services.sketches)
+"""
+
+import random
+
+import numpy as np
+
+from app.services.sketches import (
+    KLLSketch, merge_sketches, DEFAULT_K, HyperLogLog, merge_hyperloglogs, respondent_key
+)
+
+
+def _rank_error(sketch, sorted_values, fraction):
+    value = sketch.quantile(fraction)
+    return abs(np.searchsorted(sorted_values, value, side='right') / len(sorted_values) - fraction)
+
+
+class TestExactMode:
+    """Small streams are held in full"""
+
+    def test_exact_below_k(self):
+        sketch = KLLSketch()
+        sketch.extend([5.0, 1.0, 4.0, 2.0, 3.0])
+        assert sketch.quantile(0.5) == 3.0
+        assert sketch.quantile(0) == 1.0
+        assert sketch.quantile(1) == 5.0
+        assert sketch.bin_counts(1.0, 5.0, 2) == {1: 2, 2: 3}
+
+    def test_empty(self):
+        assert KLLSketch().quantile(0.5) is None
+
+
+class TestApproximation:
+    """Bounded size and rank error on large streams"""
+
+    def test_error_and_size_bounds(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(0, 1) for _ in range(50000)]
+        sketch = KLLSketch(rng=random.Random(1))
+        sketch.extend(values)
+
+        assert sketch.n == len(values)
+        assert sum(weight for _, weight in sketch.weighted_items()) == len(values)
+        assert sum(len(level) for level in sketch.levels) < 3 * DEFAULT_K
+        sorted_values = np.sort(values)
+        for fraction in (0.1, 0.5, 0.9):
+            assert _rank_error(sketch, sorted_values, fraction) < 0.02
+
+    def test_merge_after_serialization(self):
+        rng = random.Random(3)
+        values = [rng.uniform(0, 100) for _ in range(20000)]
+        parts = [KLLSketch(rng=random.Random(i)) for i in range(10)]
+        for i, value in enumerate(values):
+            parts[i % 10].update(value)
+
+        merged = merge_sketches(KLLSketch.from_json(part.to_json()) for part in parts)
+        assert merged.n == len(values)
+        assert merged.min == min(values) and merged.max == max(values)
+        assert _rank_error(merged, np.sort(values), 0.5) < 0.02
+        assert sum(merged.bin_counts(0, 100, 5).values()) == len(values)
+
+
+class TestHyperLogLog:
+    """Distinct respondent counts"""
+
+    def test_small_counts_are_exact(self):
+        sketch = HyperLogLog()
+        for i in range(50):
+            sketch.add(f"user:{i % 10}")
+        assert sketch.count() == 10
+        assert HyperLogLog().count() == 0
+
+    def test_large_count_within_error(self):
+        sketch = HyperLogLog()
+        for i in range(100000):
+            sketch.add(f"guest:{i}")
+        assert abs(sketch.count() - 100000) / 100000 < 0.05
+
+    def test_merge_is_union(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(3000):
+            first.add(str(i))
+        for i in range(2000, 6000):
+            second.add(str(i))
+        merged = merge_hyperloglogs([first, second])
+        assert abs(merged.count() - 6000) / 6000 < 0.05
+        # Merging the same respondents again changes nothing
+        assert merged.to_list() == merge_hyperloglogs([merged, first]).to_list()
+
+    def test_registers_round_trip(self):
+        sketch = HyperLogLog()
+        sketch.add("user:1")
+        assert HyperLogLog(sketch.to_list()).count() == 1
+
+    def test_nonzero_registers_rebuild_the_sketch(self):
+        sketch = HyperLogLog()
+        for i in range(20):
+            sketch.add(f"user:{i}")
+        registers = sketch.nonzero_registers()
+        assert 0 < len(registers) <= 20
+        rebuilt = [0] * len(sketch.to_list())
+        for index, rank in registers.items():
+            rebuilt[index] = rank
+        assert rebuilt == sketch.to_list()
+        assert HyperLogLog().nonzero_registers() == {}
+
+    def test_respondent_key(self):
+        assert respondent_key(5, "10.0.0.1") == "user:5"
+        assert respondent_key(None, "10.0.0.1") == "guest:10.0.0.1"
+        assert respondent_key(None, None) is None
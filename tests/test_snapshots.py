@@ -0,0 +1,67 @@
+"""
+Tests for columnar answer snapshots (app.services.snapshots)
+Refreshing needs PostgreSQL; these cover the file format round trip.
+"""
+
+import math
+import os
+
+import numpy as np
+
+from app.services import snapshots
+from app.services.snapshots import Snapshot, _ColumnWriter, _append, _column_files
+
+
+def _write_snapshot(tmp_path, columns, rows):
+    """Write rows ({question_id: answer text}) the way refresh_snapshot does, in one chunk"""
+    path = tmp_path / "v1"
+    directory = path / "g1"
+    os.makedirs(directory)
+    meta = {'format': snapshots.FORMAT_VERSION, 'form_id': 1, 'form_version_id': 1, 'generation': 1,
+            'rows': 0, 'watermark': 0, 'columns': columns, 'sizes': {}}
+    for column in columns:
+        offsets = _column_files(column).get('offsets')
+        if offsets:
+            _append(str(directory), offsets, np.zeros(1, dtype=np.int64).tobytes(), meta['sizes'])
+
+    writers = [_ColumnWriter(column, meta) for column in columns]
+    for row in rows:
+        for writer in writers:
+            writer.add(row.get(writer.column['question_id']))
+    sizes = dict(meta['sizes'])
+    ids = np.arange(1, len(rows) + 1, dtype=np.int64)
+    _append(str(directory), 'submission_ids.i8', ids.tobytes(), sizes)
+    for writer in writers:
+        writer.flush(str(directory), sizes)
+    meta.update(sizes=sizes, rows=len(rows), watermark=len(rows))
+    return Snapshot(str(path), meta)
+
+
+def _column(question_id, field_type):
+    return {'question_id': question_id, 'field_type': field_type,
+            'kind': snapshots._KINDS.get(field_type, snapshots.TEXT), 'dictionary': []}
+
+
+class TestSnapshotFormat:
+    """Columns written by the refresh are read back through memory maps"""
+
+    def test_round_trip(self, tmp_path):
+        columns = [_column(1, 'number'), _column(2, 'radio'), _column(3, 'checkbox'), _column(4, 'long_text')]
+        snapshot = _write_snapshot(tmp_path, columns, [
+            {1: '4.5', 2: 'a', 3: '["x", "y"]', 4: 'héllo'},
+            {1: 'abc', 2: 'b', 3: 'y'},
+            {2: 'a', 4: 'ok'},
+        ])
+
+        assert snapshot.rows == 3
+        assert snapshot.submission_ids.tolist() == [1, 2, 3]
+        numbers = snapshot.numeric(1)
+        assert numbers[0] == 4.5 and math.isnan(numbers[1]) and math.isnan(numbers[2])
+        assert snapshot.choice_counts(2) == {'a': 2, 'b': 1}
+        assert snapshot.choice_counts(3) == {'x': 1, 'y': 2}
+        assert snapshot.texts(4) == ['héllo', '', 'ok']
+
+    def test_empty_columns(self, tmp_path):
+        snapshot = _write_snapshot(tmp_path, [_column(1, 'number'), _column(2, 'short_text')], [])
+        assert snapshot.numeric(1).size == 0
+        assert snapshot.texts(2) == []
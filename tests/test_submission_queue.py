@@ -0,0 +1,141 @@
+"""
+Tests for the write-behind submission journal
+
+The journal is a local SQLite file, so no PostgreSQL server is required.
+"""
+
+from datetime import datetime, date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import DataError, ProgrammingError
+from sqlalchemy.orm import sessionmaker
+
+from app import db
+from app.services import submission_queue
+from app.services.submission_queue import SubmissionJournal, SubmissionWriter, enqueue_submission
+from app.services.submissions import SubmissionsService
+
+
+@pytest.fixture
+def journal(tmp_path):
+    """Journal in a throwaway directory."""
+    journal = SubmissionJournal(str(tmp_path / "journal" / "submissions.db"))
+    yield journal
+    journal.close()
+
+
+def make_item(form_id=1, **answers):
+    return {
+        'form_id': form_id,
+        'answers': {int(key[1:]): value for key, value in answers.items()},
+        'user_id': None,
+        'ip_address': None,
+        'submitted_at': datetime(2024, 5, 1, 12, 30),
+    }
+
+
+class TestSubmissionJournal:
+    """Append, claim, complete and dead-letter"""
+
+    def test_round_trip_preserves_types(self, journal):
+        journal.append(make_item(q1="Alice", q2=["A", "B"], q3=4.5, q4=date(2024, 5, 1)))
+        [(_, item)] = journal.claim(10)
+        assert item['answers'] == {1: "Alice", 2: ["A", "B"], 3: 4.5, 4: "2024-05-01"}
+        assert item['submitted_at'] == datetime(2024, 5, 1, 12, 30)
+
+    def test_claim_is_ordered_and_leased(self, journal):
+        ids = [journal.append(make_item(form_id=i)) for i in range(5)]
+        first = journal.claim(3)
+        assert [entry_id for entry_id, _ in first] == ids[:3]
+        second = journal.claim(10)
+        assert [entry_id for entry_id, _ in second] == ids[3:]
+        assert journal.claim(10) == []
+
+    def test_expired_lease_is_reclaimed(self, journal):
+        entry_id = journal.append(make_item())
+        journal.claim(10, lease_seconds=-1)
+        assert [claimed for claimed, _ in journal.claim(10)] == [entry_id]
+
+    def test_release_and_complete(self, journal):
+        entry_id = journal.append(make_item())
+        journal.claim(10)
+        journal.release([entry_id], "connection refused")
+        assert journal.stats()['pending'] == 1
+        journal.claim(10)
+        journal.complete([entry_id])
+        assert journal.stats() == {'pending': 0, 'dead': 0, 'oldest_pending_seconds': 0.0}
+
+    def test_dead_letters_are_kept_and_requeued(self, journal):
+        entry_id = journal.append(make_item())
+        journal.claim(10)
+        journal.dead_letter({entry_id: "Form not found"})
+        assert journal.claim(10) == []
+        [dead] = journal.dead_letters()
+        assert dead['error'] == "Form not found"
+        assert dead['attempts'] == 1
+        assert journal.requeue_dead() == 1
+        assert len(journal.claim(10)) == 1
+
+    def test_entries_survive_reopen(self, tmp_path):
+        path = str(tmp_path / "submissions.db")
+        first = SubmissionJournal(path)
+        first.append(make_item(q1="kept"))
+        first.close()
+        reopened = SubmissionJournal(path)
+        [(_, item)] = reopened.claim(10)
+        reopened.close()
+        assert item['answers'] == {1: "kept"}
+
+
+@pytest.fixture
+def failing_ingest(monkeypatch):
+    """Route sessions to SQLite and make ingest_batch raise the given error for some items."""
+    monkeypatch.setattr(db, "SessionLocal", sessionmaker(bind=create_engine("sqlite://")))
+
+    def install(error, bad_form_ids=None):
+        def ingest_batch(session, items):
+            if bad_form_ids is None or any(item['form_id'] in bad_form_ids for item in items):
+                raise error
+            return [{'success': True, 'submission_id': i, 'errors': []} for i, _ in enumerate(items)]
+        monkeypatch.setattr(SubmissionsService, "ingest_batch", staticmethod(ingest_batch))
+    return install
+
+
+class TestSubmissionWriter:
+    """How drain failures are sorted into retries, dead letters and alerts"""
+
+    def test_row_error_dead_letters_only_the_bad_entry(self, journal, failing_ingest):
+        failing_ingest(DataError("INSERT", {}, Exception("value too long")), bad_form_ids={2})
+        for form_id in (1, 2, 3):
+            journal.append(make_item(form_id=form_id))
+        writer = SubmissionWriter(journal)
+        assert writer.drain_once() == 3
+        [dead] = journal.dead_letters()
+        assert dead['submission']['form_id'] == 2
+        assert journal.stats()['pending'] == 0
+        assert writer.drained == 2
+
+    def test_batch_error_keeps_entries_pending_and_alerts(self, journal, failing_ingest):
+        failing_ingest(ProgrammingError("INSERT", {}, Exception("permission denied for table submissions")))
+        for form_id in (1, 2):
+            journal.append(make_item(form_id=form_id))
+        writer = SubmissionWriter(journal)
+        with pytest.raises(ProgrammingError):
+            writer.drain_once()
+        assert journal.stats()['pending'] == 2
+        assert journal.stats()['dead'] == 0
+        assert "permission denied" in writer.stats()['alert']
+
+
+class TestEnqueueSubmission:
+    """What the respondent is told when a submission cannot be journaled"""
+
+    def test_append_failure_is_reported(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(SubmissionsService, "precheck_submission", staticmethod(lambda *args: []))
+        journal = SubmissionJournal(str(tmp_path / "submissions.db"))
+        journal.close()  # appends now raise
+        monkeypatch.setattr(submission_queue, "get_submission_writer", lambda: SubmissionWriter(journal))
+        entry_id, errors = enqueue_submission({'id': 1}, {1: "yes"})
+        assert entry_id is None
+        assert errors == ["Your response could not be saved; please try again"]
@@ -0,0 +1,165 @@
+"""
+Tests for submission validation helpers
+
+These exercise the DB-agnostic pieces of `app.services.submissions` and
+the compiled validators in `app.services.validators`.
+"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import submissions
+from app.services.submissions import SubmissionsService
+from app.services import validators
+from app.services.validators import ValidationPlan, invalidate_validation_plan
+
+
+@pytest.fixture
+def question_plan():
+    """Compiled plan built from question rows as loaded by `load_question_rows`."""
+    return ValidationPlan(7, [
+        {'id': 1, 'label': 'Name', 'field_type': 'short_text', 'required': True,
+         'validation_min': None, 'validation_max': 10, 'validation_regex': None, 'options': []},
+        {'id': 2, 'label': 'Color', 'field_type': 'radio', 'required': False,
+         'validation_min': None, 'validation_max': None, 'validation_regex': None,
+         'options': ['red', 'blue']},
+        {'id': 3, 'label': 'Age', 'field_type': 'number', 'required': False,
+         'validation_min': 0, 'validation_max': 120, 'validation_regex': None, 'options': []},
+        {'id': 4, 'label': 'Code', 'field_type': 'short_text', 'required': False,
+         'validation_min': None, 'validation_max': None, 'validation_regex': r'[A-Z]{3}-\d{2}',
+         'options': []},
+    ])
+
+
+class TestAnswerSerialization:
+    """Stored text form of answers"""
+
+    def test_lists_are_comma_joined(self):
+        assert SubmissionsService._serialize_answer(['a', 'b']) == "a, b"
+
+    def test_empty_answers_are_skipped(self):
+        assert SubmissionsService._serialize_answer(None) is None
+        assert SubmissionsService._serialize_answer("") is None
+
+    def test_scalars_are_stringified(self):
+        assert SubmissionsService._serialize_answer(42) == "42"
+
+
+class TestPlanValidation:
+    """Validation against a compiled plan"""
+
+    def test_valid_submission(self, question_plan):
+        data = {'question_1': 'Ann', 'question_2': 'red', 'question_3': '30'}
+        assert question_plan.validate(data) == []
+
+    def test_required_and_choice_errors(self, question_plan):
+        data = {'question_2': 'green'}
+        errors = question_plan.validate(data)
+        assert "Question 'Name' is required" in errors
+        assert "'Color' has an invalid selection" in errors
+
+    def test_numeric_bounds(self, question_plan):
+        data = {'question_1': 'Ann', 'question_3': '200'}
+        errors = question_plan.validate(data)
+        assert errors == ["'Age' must be at most 120"]
+
+    def test_text_length(self, question_plan):
+        data = {'question_1': 'A very long name'}
+        errors = question_plan.validate(data)
+        assert errors == ["'Name' must be at most 10 characters"]
+
+    def test_validation_regex_is_enforced(self, question_plan):
+        assert question_plan.validate({'question_1': 'Ann', 'question_4': 'ABC-12'}) == []
+        errors = question_plan.validate({'question_1': 'Ann', 'question_4': 'abc-12'})
+        assert errors == ["'Code' has an invalid format"]
+
+    def test_invalid_regex_is_ignored(self):
+        plan = ValidationPlan(8, [
+            {'id': 1, 'label': 'Broken', 'field_type': 'short_text', 'required': False,
+             'validation_min': None, 'validation_max': None, 'validation_regex': '([',
+             'options': []},
+        ])
+        assert plan.validate({'question_1': 'anything'}) == []
+
+    def test_options_are_frozen(self, question_plan):
+        assert isinstance(question_plan.questions[1].options, frozenset)
+
+    def test_lineage_keys(self):
+        plan = ValidationPlan(9, [
+            {'id': 5, 'lineage_key': 2, 'label': 'Copied', 'field_type': 'short_text', 'required': False},
+            {'id': 6, 'lineage_key': None, 'label': 'Unlinked', 'field_type': 'short_text', 'required': False},
+        ])
+        # Questions without a lineage (not yet migrated) start their own
+        assert plan.lineage_keys == {5: 2, 6: 6}
+
+    def test_invalidation_repeats_after_commit(self, question_plan):
+        session = SimpleNamespace(info={})
+        validators._plan_cache.set(7, question_plan)
+        invalidate_validation_plan(7, session)
+        assert validators._plan_cache.get(7) is None
+        # A concurrent submit reloads the plan before the edit commits
+        validators._plan_cache.set(7, question_plan)
+        for callback in session.info['on_commit']:
+            callback()
+        assert validators._plan_cache.get(7) is None
+
+
+class TestSubmissionWindow:
+    """Window checks against an explicit submission time"""
+
+    def test_replayed_submission_inside_window(self):
+        form = SimpleNamespace(
+            submission_start=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            submission_end=datetime(2024, 2, 1, tzinfo=timezone.utc),
+        )
+        at = datetime(2024, 1, 15, tzinfo=timezone.utc)
+        assert SubmissionsService.validate_submission_window(form, at)[0] is True
+
+    def test_replayed_submission_after_window(self):
+        form = SimpleNamespace(
+            submission_start=None,
+            submission_end=datetime(2024, 2, 1, tzinfo=timezone.utc),
+        )
+        at = datetime(2024, 3, 1, tzinfo=timezone.utc)
+        assert SubmissionsService.validate_submission_window(form, at)[0] is False
+
+    def test_naive_now_against_aware_window(self):
+        form = SimpleNamespace(
+            submission_start=datetime.now(timezone.utc) - timedelta(days=1),
+            submission_end=None,
+        )
+        assert SubmissionsService.validate_submission_window(form)[0] is True
+
+
+class TestPrecheck:
+    """Checks run before a write-behind submission is journaled"""
+
+    @pytest.fixture
+    def schema(self, question_plan):
+        validators._plan_cache.set(7, question_plan)
+        yield {'id': 3, 'version_id': 7, 'single_submission': True,
+               'submission_start': None, 'submission_end': None}
+        validators._plan_cache.pop(7)
+
+    def test_valid_answers_pass(self, schema):
+        assert SubmissionsService.precheck_submission(schema, {1: "Ann", 2: "red"}) == []
+
+    def test_answer_errors_are_returned(self, schema):
+        errors = SubmissionsService.precheck_submission(schema, {2: "green"})
+        assert "Question 'Name' is required" in errors
+        assert "'Color' has an invalid selection" in errors
+
+    def test_closed_window(self, schema):
+        schema['submission_end'] = datetime(2024, 2, 1)
+        errors = SubmissionsService.precheck_submission(schema, {1: "Ann"}, at=datetime(2024, 3, 1))
+        assert errors == ["Submission period ended on 2024-02-01 00:00"]
+
+    def test_known_submitter(self, schema):
+        submissions._known_submitters.set((3, 'user', 11), True)
+        try:
+            errors = SubmissionsService.precheck_submission(schema, {1: "Ann"}, user_id=11)
+        finally:
+            submissions._known_submitters.pop((3, 'user', 11))
+        assert errors == ["You have already submitted this form"]
@@ -0,0 +1,35 @@
+"""
+Tests for the per-tenant dashboard cache (app.services.tenant_dashboard)
+The aggregate queries need PostgreSQL; these cover caching and eviction.
+"""
+
+from app.services.tenant_dashboard import (
+    cache_dashboard, empty_dashboard, get_cached_dashboard, invalidate_tenant_dashboard
+)
+
+
+class TestDashboardCache:
+    """Cached dashboards per tenant and scope"""
+
+    def test_scopes_are_cached_separately(self):
+        owner_view = dict(empty_dashboard(), total_forms=5)
+        editor_view = dict(empty_dashboard(), total_forms=2)
+        cache_dashboard(901, owner_view)
+        cache_dashboard(901, editor_view, scope=7)
+        assert get_cached_dashboard(901)['total_forms'] == 5
+        assert get_cached_dashboard(901, 7)['total_forms'] == 2
+        assert get_cached_dashboard(901, 8) is None
+
+    def test_returns_copies(self):
+        cache_dashboard(902, empty_dashboard())
+        get_cached_dashboard(902)['recent_activity'].append({'form_title': 'x'})
+        assert get_cached_dashboard(902)['recent_activity'] == []
+
+    def test_invalidation_drops_every_scope(self):
+        cache_dashboard(903, empty_dashboard())
+        cache_dashboard(903, empty_dashboard(), scope=7)
+        cache_dashboard(904, empty_dashboard())
+        invalidate_tenant_dashboard(903)
+        assert get_cached_dashboard(903) is None
+        assert get_cached_dashboard(903, 7) is None
+        assert get_cached_dashboard(904) is not None
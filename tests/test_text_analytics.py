@@ -0,0 +1,63 @@
+"""
+Tests for the text analytics pipeline (app.services.text_analytics)
+"""
+
+from app.services import text_analytics
+from app.services.text_analytics import summarize, terms, tokenize, top_terms
+
+
+class TestTokenizer:
+    """Compiled tokenizer and indexed terms"""
+
+    def test_punctuation_and_case(self):
+        assert tokenize("Great service, LOVE it!") == ['great', 'service', 'love', 'it']
+
+    def test_inner_apostrophes_are_kept(self):
+        assert tokenize("don't 'quoted'") == ["don't", 'quoted']
+
+    def test_unicode_letters(self):
+        assert tokenize("Café naïve") == ['café', 'naïve']
+
+    def test_sql_pattern_is_the_python_pattern_in_posix_classes(self):
+        # PostgreSQL before 14 rejects escapes such as \W inside brackets
+        sql = text_analytics.SQL_TOKEN_PATTERN
+        assert '\\' not in sql
+        assert sql.replace('[[:alnum:]]', r'[^\W_]') == text_analytics.TOKEN_PATTERN
+
+    def test_short_and_overlong_tokens_are_not_indexed(self):
+        assert terms("an ok day " + "x" * 100) == ['day']
+
+    def test_stop_words_are_indexed(self):
+        # Filtered when reading, so the stop word list can change without a rebuild
+        assert 'the' in terms("the end")
+
+
+class TestTopTerms:
+    """Ranking of indexed terms"""
+
+    def test_stop_words_are_skipped(self):
+        assert top_terms({'the': 9, 'great': 2}) == [{'word': 'great', 'count': 2}]
+
+    def test_ties_break_by_term(self):
+        ranked = top_terms({'beta': 2, 'alpha': 2, 'gamma': 3}, top_n=2)
+        assert [row['word'] for row in ranked] == ['gamma', 'alpha']
+
+    def test_builtin_stop_words(self):
+        assert set(text_analytics.BUILTIN_STOP_WORDS) <= text_analytics.stop_words()
+
+
+class TestSummarize:
+    """In-memory summaries in the index's format"""
+
+    def test_lengths_skip_blank_answers(self):
+        summary = summarize(["good food", "", "   ", None, "good"])
+        assert summary['response_count'] == 2
+        assert summary['min_length'] == 4
+        assert summary['max_length'] == 9
+        assert summary['avg_length'] == 6.5
+        assert summary['common_words'] == [{'word': 'good', 'count': 2}, {'word': 'food', 'count': 1}]
+
+    def test_empty(self):
+        summary = summarize([])
+        assert summary['response_count'] == 0
+        assert summary['common_words'] == []